@@ -0,0 +1,119 @@
+import os
+import threading
+import time
+
+from metrics import metrics
+from log import get_logger
+
+log = get_logger(__name__)
+
+# Consecutive failures that open a breaker
+BREAKER_FAILURE_THRESHOLD = int(os.environ.get('BREAKER_FAILURE_THRESHOLD', '5'))
+
+# Seconds an open breaker rejects calls before letting a trial call through
+BREAKER_RESET_TIMEOUT = float(os.environ.get('BREAKER_RESET_TIMEOUT', '30'))
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+
+class CircuitOpenError(Exception):
+    """Raised instead of calling a dependency whose breaker is open."""
+
+    def __init__(self, name, retry_after):
+        super().__init__(f"Circuit {name} is open, retry after {retry_after:.0f}s")
+        self.name = name
+        self.retry_after = retry_after
+
+
+class CircuitBreaker:
+    """
+    Closed / open / half-open circuit breaker.
+
+    After `failure_threshold` consecutive failures the breaker opens and
+    rejects calls for `reset_timeout` seconds. It then lets a single trial
+    call through (half-open): success closes it again, failure re-opens it.
+    A trial that never reports back (e.g. a cancelled call) stops blocking
+    new trials after another `reset_timeout`.
+    """
+
+    def __init__(self, name, failure_threshold=BREAKER_FAILURE_THRESHOLD, reset_timeout=BREAKER_RESET_TIMEOUT):
+        self.name = name
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self._lock = threading.Lock()
+        self._state = CLOSED
+        self._failures = 0
+        self._opened_at = 0.0
+        self._trial_started = None
+        self.transitions = 0
+
+    @property
+    def state(self):
+        with self._lock:
+            return self._current_state(time.monotonic())
+
+    def _current_state(self, now):
+        if self._state == OPEN and now - self._opened_at >= self.reset_timeout:
+            self._transition(HALF_OPEN)
+        return self._state
+
+    def _transition(self, state):
+        log.info("Circuit %s: %s -> %s", self.name, self._state, state)
+        # Counted per target state, e.g. circuit_ocr_open, in the next EMF record
+        metrics.increment(f"circuit_{self.name.replace('.', '_')}_{state}")
+        self._state = state
+        self.transitions += 1
+        if state == OPEN:
+            self._opened_at = time.monotonic()
+        if state != HALF_OPEN:
+            self._trial_started = None
+
+    def allow(self):
+        """Return True if a call may go ahead; in half-open state only one trial call is admitted."""
+        now = time.monotonic()
+        with self._lock:
+            state = self._current_state(now)
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and (self._trial_started is None or now - self._trial_started >= self.reset_timeout):
+                self._trial_started = now
+                return True
+            return False
+
+    def retry_after(self):
+        """Seconds until an open breaker admits a trial call (0 when closed, at least 1 otherwise)."""
+        with self._lock:
+            if self._current_state(time.monotonic()) == CLOSED:
+                return 0.0
+            return max(self._opened_at + self.reset_timeout - time.monotonic(), 1.0)
+
+    def record_success(self):
+        with self._lock:
+            # A call admitted before the breaker opened says nothing about recovery; only the trial call closes it
+            if self._state == OPEN:
+                return
+            self._failures = 0
+            if self._state == HALF_OPEN:
+                self._transition(CLOSED)
+
+    def record_failure(self):
+        with self._lock:
+            self._failures += 1
+            if self._state == HALF_OPEN or (self._state == CLOSED and self._failures >= self.failure_threshold):
+                self._transition(OPEN)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'state': self._current_state(time.monotonic()),
+                'consecutive_failures': self._failures,
+                'transitions': self.transitions
+            }
+
+
+def is_outage_error(error):
+    """Return True for errors suggesting the dependency is down: no response at all, 429 or 5xx."""
+    status = getattr(error, 'status_code', None)
+    return status is None or status == 429 or status >= 500
@@ -0,0 +1,82 @@
+import re
+
+IMAGE_PLACEHOLDER = re.compile(r'!\[[^\]]*\]\([^)]*\)')
+SEPARATOR_RULE = re.compile(r'^\s*([-*_=~]\s*){3,}$')
+TABLE_SEPARATOR = re.compile(r'^\s*\|?(\s*:?-{2,}:?\s*\|)+\s*:?-*:?\s*\|?\s*$')
+MARKDOWN_DECORATION = re.compile(r'^#+\s*|\*\*|__')
+HORIZONTAL_SPACE = re.compile(r'[ \t\u00a0]+')
+AMOUNT = re.compile(r'\d+[.,]\d{2}\b')
+TOTAL_LINE = re.compile(r'\b(total|balance due|amount due)\b', re.IGNORECASE)
+
+# Footer boilerplate, dropped line by line once a total has been seen (dates and card lines can follow it)
+FOOTER_PATTERNS = re.compile(
+    r'(thank\s*you|please come again|follow us|visit us|www\.|https?://|survey|'
+    r'customer copy|return policy|refund policy|terms (and|&) conditions|have a (nice|great) day)',
+    re.IGNORECASE
+)
+
+# Loyalty-program boilerplate, dropped only when the line carries no amount
+LOYALTY_PATTERNS = re.compile(
+    r'(points?\s+(balance|earned|this)|you (earned|saved)|rewards? (member|card|number|program)|'
+    r'loyalty|join (today|now)|sign up)',
+    re.IGNORECASE
+)
+
+
+def estimate_tokens(text):
+    """Rough token count for Mistral tokenizers (about four characters per token)."""
+    return (len(text) + 3) // 4
+
+
+def _compact_table_row(line):
+    # Empty cells are kept so values stay in their columns
+    cells = [cell.strip() for cell in line.strip().strip('|').split('|')]
+    return ' | '.join(cells)
+
+
+def compact_markdown(text):
+    """
+    Shrink OCR markdown before it is embedded in the structuring prompt.
+
+    Drops image placeholders, separator rules and loyalty boilerplate,
+    collapses markdown tables to "a | b | c" lines, normalizes whitespace and
+    skips footer boilerplate once a total has been seen. Returns the compacted
+    text and a dict with token estimates before and after.
+    """
+    lines = []
+    seen_total = False
+    for raw_line in IMAGE_PLACEHOLDER.sub('', text).splitlines():
+        line = HORIZONTAL_SPACE.sub(' ', raw_line).strip()
+
+        if not line:
+            # Keep single blank lines as block boundaries
+            if lines and lines[-1]:
+                lines.append('')
+            continue
+        if SEPARATOR_RULE.match(line) or TABLE_SEPARATOR.match(line):
+            continue
+        if seen_total and FOOTER_PATTERNS.search(line) and not AMOUNT.search(line):
+            continue
+        if LOYALTY_PATTERNS.search(line) and not AMOUNT.search(line):
+            continue
+
+        if line.startswith('|'):
+            line = _compact_table_row(line)
+        line = MARKDOWN_DECORATION.sub('', line).strip()
+        if not line:
+            continue
+
+        if TOTAL_LINE.search(line):
+            seen_total = True
+        lines.append(line)
+
+    compacted = '\n'.join(lines).strip()
+    tokens_before = estimate_tokens(text)
+    tokens_after = estimate_tokens(compacted)
+    return compacted, {
+        'chars_before': len(text),
+        'chars_after': len(compacted),
+        'tokens_before': tokens_before,
+        'tokens_after': tokens_after,
+        'tokens_saved': tokens_before - tokens_after
+    }
@@ -6,13 +6,15 @@ echo "Creating Lambda deployment package..."
 # Create a temporary directory
 mkdir -p package
 
-# Install dependencies
-pip install -r requirements.txt -t package/
+# Install dependencies as Linux wheels, so compiled ones (Pillow) load on Lambda whatever machine builds the package
+pip install -r requirements.txt -t package/ \
+    --platform manylinux2014_x86_64 --implementation cp \
+    --python-version "${LAMBDA_PYTHON_VERSION:-3.11}" --only-binary=:all:
 
-# Copy Lambda function and dependencies
-cp lambda_function.py package/
-cp openai_client.py package/
-cp parse_response.py package/
+# Copy every backend module except the local dev server
+for module in *.py; do
+    [ "$module" = "dev_server.py" ] || cp "$module" package/
+done
 
 # Create zip file
 cd package
@@ -0,0 +1,386 @@
+#!/usr/bin/env python3
+"""
+Local development server for lambda_handler.
+
+Adapts plain HTTP requests into API Gateway proxy events and runs them through
+the real handler. Requests are served concurrently, each on a simulated Lambda
+container: a container handles one request at a time, idle containers are
+reused (warm start) and new ones start a fresh Python process that imports
+lambda_function (cold start). Each container has its own modules, caches,
+breakers and connections, and pays the SDK imports itself, so init cost shows
+up where it would in production (minus the runtime's own startup).
+
+Usage:
+    export MISTRAL_API_KEY="your-api-key"
+    python dev_server.py --port 8080
+"""
+import argparse
+import itertools
+import json
+import os
+import subprocess
+import sys
+import threading
+import time
+import traceback
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit, parse_qsl
+
+
+class LocalLambdaContext:
+    """Minimal stand-in for the Lambda context object."""
+
+    def __init__(self, container_id, timeout_seconds):
+        self.aws_request_id = str(uuid.uuid4())
+        self.function_name = 'receipt-scanner-api-local'
+        self.log_stream_name = container_id
+        self.memory_limit_in_mb = 1024
+        self._deadline = time.monotonic() + timeout_seconds
+
+    def get_remaining_time_in_millis(self):
+        return max(0, int((self._deadline - time.monotonic()) * 1000))
+
+
+class Container:
+    """
+    A simulated execution environment: a child process that imports lambda_function.
+
+    Requests are written to the child's stdin and replies read from a
+    separate pipe, one JSON document per line, so the handler's own stdout
+    logging passes through untouched.
+    """
+
+    def __init__(self, container_id, cold_start_delay):
+        self.container_id = container_id
+        start = time.monotonic()
+        env = dict(os.environ)
+        # Local runs use the key from the environment instead of Secrets Manager
+        if env.get('MISTRAL_API_KEY'):
+            env.setdefault('SECRETS_BACKEND', 'env')
+        read_fd, write_fd = os.pipe()
+        self.process = subprocess.Popen(
+            [sys.executable, os.path.abspath(__file__), '--container', str(write_fd),
+             '--cold-start-delay', str(cold_start_delay)],
+            stdin=subprocess.PIPE, pass_fds=(write_fd,), env=env, text=True
+        )
+        os.close(write_fd)
+        self._replies = os.fdopen(read_fd, 'r')
+        ready = self._reply()
+        self.init_duration_ms = ready['init_duration_ms']
+        self.total_start_ms = (time.monotonic() - start) * 1000
+
+        self.invocations = 0
+        self.last_used = time.monotonic()
+
+    def invoke(self, event, timeout_seconds):
+        return self._request({'invoke': event, 'timeout_seconds': timeout_seconds})
+
+    def query(self, name):
+        """Read container state: `raw_response`, `raw_responses` or `providers`."""
+        return self._request({'query': name})
+
+    def close(self):
+        if self.process.poll() is None:
+            self.process.stdin.close()
+            self.process.wait(timeout=5)
+        self._replies.close()
+
+    def _request(self, message):
+        self.process.stdin.write(json.dumps(message) + '\n')
+        self.process.stdin.flush()
+        return self._reply()
+
+    def _reply(self):
+        line = self._replies.readline()
+        if not line:
+            raise RuntimeError(f"{self.container_id} exited with code {self.process.wait()}")
+        reply = json.loads(line)
+        if 'error' in reply:
+            raise RuntimeError(f"{self.container_id} failed: {reply['error']}")
+        return reply
+
+
+def serve_container(reply_fd, cold_start_delay=0.0):
+    """Child side of a Container: import the handler, then serve requests from stdin."""
+    replies = os.fdopen(reply_fd, 'w')
+
+    def reply(payload):
+        replies.write(json.dumps(payload) + '\n')
+        replies.flush()
+
+    start = time.monotonic()
+    if cold_start_delay:
+        time.sleep(cold_start_delay)
+    try:
+        import lambda_function
+        from mistral_client import get_last_raw_response
+        from request_context import raw_responses
+        from providers import provider_pool
+    except Exception:
+        reply({'error': traceback.format_exc()})
+        return
+    reply({'init_duration_ms': (time.monotonic() - start) * 1000})
+
+    queries = {
+        'raw_response': get_last_raw_response,
+        'raw_responses': raw_responses.recent,
+        'providers': provider_pool.metrics
+    }
+    container_id = f"container-{os.getpid()}"
+    for line in sys.stdin:
+        message = json.loads(line)
+        try:
+            if 'query' in message:
+                reply({'result': queries[message['query']]()})
+                continue
+            context = LocalLambdaContext(container_id, message['timeout_seconds'])
+            started = time.monotonic()
+            response = lambda_function.lambda_handler(message['invoke'], context)
+            reply({'response': response, 'duration_ms': (time.monotonic() - started) * 1000})
+        except Exception:
+            reply({'error': traceback.format_exc()})
+
+
+class ContainerPool:
+    """Hands out warm containers when idle ones exist and cold-starts new ones otherwise."""
+
+    def __init__(self, max_containers=10, idle_timeout=300, cold_start_delay=0.0):
+        self.max_containers = max_containers
+        self.idle_timeout = idle_timeout
+        self.cold_start_delay = cold_start_delay
+        self._cond = threading.Condition()
+        self._idle = []
+        self._total = 0
+        self._ids = itertools.count(1)
+        self.cold_starts = 0
+        self.warm_starts = 0
+
+    def acquire(self):
+        """Return (container, is_cold) for the next invocation."""
+        with self._cond:
+            while True:
+                self._expire_idle()
+                if self._idle:
+                    self.warm_starts += 1
+                    return self._idle.pop(), False
+                if self._total < self.max_containers:
+                    self._total += 1
+                    container_id = f"container-{next(self._ids)}"
+                    break
+                self._cond.wait()
+
+        try:
+            container = Container(container_id, self.cold_start_delay)
+        except Exception:
+            with self._cond:
+                self._total -= 1
+                self._cond.notify()
+            raise
+        with self._cond:
+            self.cold_starts += 1
+        return container, True
+
+    def release(self, container):
+        with self._cond:
+            container.last_used = time.monotonic()
+            self._idle.append(container)
+            self._cond.notify()
+
+    def discard(self, container):
+        """Drop a container whose process failed; a new one is cold-started when needed."""
+        container.close()
+        with self._cond:
+            self._total -= 1
+            self._cond.notify()
+
+    def query(self, name):
+        """
+        Query every idle container, most recently used first.
+
+        The containers are taken out of the idle list while they are queried,
+        so no invocation writes to the same pipe, and the pool lock is not
+        held during the I/O. Containers that fail to answer are discarded.
+        """
+        with self._cond:
+            containers, self._idle = list(reversed(self._idle)), []
+        results = []
+        answered = []
+        for container in containers:
+            try:
+                results.append((container.container_id, container.query(name)['result']))
+            except Exception:
+                self.discard(container)
+                continue
+            answered.append(container)
+        with self._cond:
+            # Containers released meanwhile were used more recently, so these go back in front of them
+            self._idle[:0] = reversed(answered)
+            self._cond.notify_all()
+        return results
+
+    def close(self):
+        with self._cond:
+            idle, self._idle = self._idle, []
+            self._total -= len(idle)
+        for container in idle:
+            container.close()
+
+    def _expire_idle(self):
+        now = time.monotonic()
+        alive = [c for c in self._idle if now - c.last_used < self.idle_timeout]
+        for container in self._idle:
+            if container not in alive:
+                container.close()
+        self._total -= len(self._idle) - len(alive)
+        self._idle = alive
+
+    def stats(self):
+        with self._cond:
+            return {
+                'containers': self._total,
+                'idle': len(self._idle),
+                'cold_starts': self.cold_starts,
+                'warm_starts': self.warm_starts
+            }
+
+
+def build_api_gateway_event(method, raw_path, headers, body):
+    """Translate an HTTP request into an API Gateway REST proxy event."""
+    url = urlsplit(raw_path)
+    query = dict(parse_qsl(url.query)) or None
+    return {
+        'resource': url.path,
+        'path': url.path,
+        'httpMethod': method,
+        'headers': headers,
+        'queryStringParameters': query,
+        'body': body.decode('utf-8') if body else None,
+        'isBase64Encoded': False,
+        'requestContext': {
+            'requestId': str(uuid.uuid4()),
+            'stage': 'local',
+            'httpMethod': method,
+            'path': url.path
+        }
+    }
+
+
+class LambdaRequestHandler(BaseHTTPRequestHandler):
+    """Serves every method by invoking lambda_handler on a pooled container."""
+
+    pool = None
+    timeout_seconds = 180
+
+    def do_GET(self):
+        path = urlsplit(self.path).path
+        if path == '/raw_response':
+            # Consumed by parse_response.fetch_and_parse_raw_response; read from the most recently used container
+            results = self.pool.query('raw_response')
+            self._send_json(200, {'raw_response': results[0][1] if results else ''})
+        elif path == '/_raw_responses':
+            # Recent requests of every idle container with their raw model output, timings and token usage
+            self._send_json(200, {'requests': [
+                dict(entry, container_id=container_id)
+                for container_id, entries in self.pool.query('raw_responses') for entry in entries
+            ]})
+        elif path == '/_providers':
+            # Latency, error rate and breaker state of each provider and operation, per idle container
+            self._send_json(200, dict(self.pool.query('providers')))
+        elif path == '/_stats':
+            self._send_json(200, self.pool.stats())
+        else:
+            self._invoke()
+
+    def do_POST(self):
+        self._invoke()
+
+    def do_OPTIONS(self):
+        self._invoke()
+
+    def _invoke(self):
+        length = int(self.headers.get('Content-Length') or 0)
+        body = self.rfile.read(length) if length else b''
+        event = build_api_gateway_event(self.command, self.path, dict(self.headers.items()), body)
+
+        # A container that fails to start or dies mid-request is a bad gateway, as with API Gateway and Lambda
+        try:
+            container, is_cold = self.pool.acquire()
+        except Exception as e:
+            self.log_error("Container failed to start: %s", e)
+            self._send_json(502, {'error': 'Lambda container failed to start', 'details': str(e)})
+            return
+        try:
+            reply = container.invoke(event, self.timeout_seconds)
+        except Exception as e:
+            self.pool.discard(container)
+            self.log_error("%s", e)
+            self._send_json(502, {'error': 'Lambda container failed', 'details': str(e)})
+            return
+        container.invocations += 1
+        self.pool.release(container)
+        response, duration_ms = reply['response'], reply['duration_ms']
+
+        headers = dict(response.get('headers') or {})
+        headers['X-Container-Id'] = container.container_id
+        headers['X-Cold-Start'] = 'true' if is_cold else 'false'
+        headers['X-Duration-Ms'] = f"{duration_ms:.1f}"
+        if is_cold:
+            headers['X-Init-Duration-Ms'] = f"{container.init_duration_ms:.1f}"
+        self._send(response.get('statusCode', 200), headers, (response.get('body') or '').encode('utf-8'))
+
+    def _send_json(self, status, payload):
+        self._send(status, {'Content-Type': 'application/json'}, json.dumps(payload).encode('utf-8'))
+
+    def _send(self, status, headers, body):
+        self.send_response(status)
+        for name, value in headers.items():
+            self.send_header(name, value)
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+
+def create_server(host='127.0.0.1', port=8080, pool=None, timeout_seconds=180):
+    """Create a threaded HTTP server bound to a container pool."""
+    handler = type('BoundLambdaRequestHandler', (LambdaRequestHandler,), {
+        'pool': pool or ContainerPool(),
+        'timeout_seconds': timeout_seconds
+    })
+    return ThreadingHTTPServer((host, port), handler)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description='Run lambda_handler behind a local HTTP server')
+    parser.add_argument('--host', default='127.0.0.1')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--max-containers', type=int, default=10,
+                        help='Maximum concurrent simulated containers')
+    parser.add_argument('--idle-timeout', type=float, default=300,
+                        help='Seconds before an idle container is recycled')
+    parser.add_argument('--cold-start-delay', type=float, default=0.0,
+                        help='Extra seconds added to each cold start')
+    parser.add_argument('--timeout', type=int, default=180,
+                        help='Simulated function timeout in seconds')
+    parser.add_argument('--container', type=int, help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.container is not None:
+        serve_container(args.container, args.cold_start_delay)
+        return
+
+    pool = ContainerPool(args.max_containers, args.idle_timeout, args.cold_start_delay)
+    server = create_server(args.host, args.port, pool, args.timeout)
+    print(f"Serving lambda_handler on http://{args.host}:{args.port} (max {args.max_containers} containers)")
+    try:
+        server.serve_forever()
+    except KeyboardInterrupt:
+        pass
+    finally:
+        server.server_close()
+        print(f"Container stats: {pool.stats()}")
+        pool.close()
+
+
+if __name__ == '__main__':
+    main()
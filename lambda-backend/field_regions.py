@@ -0,0 +1,90 @@
+import math
+
+from table_extractor import AMOUNT, TAX_LINE, TOTAL_LINE, extract_date
+from validation import amounts_match, parse_amount
+
+# Fields whose position on the receipt is tracked for region re-OCR
+LOCATED_FIELDS = ('merchant', 'date', 'receipt_id', 'tax', 'total')
+
+# Extra lines of padding above and below a located line, since line positions are estimates
+LINE_MARGIN = 1.5
+
+
+def _find_line(lines, value):
+    """Return the index of the last line with a matching amount, or the first line containing the text."""
+    if value in (None, ''):
+        return None
+    target = parse_amount(value) if AMOUNT.search(str(value)) else None
+    needle = str(value).strip().lower()
+    found = None
+    for index, line in enumerate(lines):
+        if target is not None:
+            amounts = [parse_amount(amount) for amount in AMOUNT.findall(line)]
+            if any(amount is not None and amounts_match(amount, target) for amount in amounts):
+                found = index
+        elif needle and needle in line.lower():
+            found = index
+            break
+    return found
+
+
+def valid_region(region):
+    """Return True if region has finite fractions with 0 <= top < bottom <= 1 and 0 <= left < right <= 1."""
+    if not isinstance(region, dict):
+        return False
+    bounds = [region.get(key, default) for key, default in (('top', None), ('bottom', None), ('left', 0.0), ('right', 1.0))]
+    if not all(isinstance(value, (int, float)) and not isinstance(value, bool) and math.isfinite(value)
+               for value in bounds):
+        return False
+    top, bottom, left, right = bounds
+    return 0 <= top < bottom <= 1 and 0 <= left < right <= 1
+
+
+def locate_fields(result, pages):
+    """
+    Estimate where each extracted field sits on the receipt image.
+
+    The OCR API only returns bounding boxes for embedded images, so text
+    positions are estimated from the line's position within its page's
+    markdown. Receipts are a single top-to-bottom column, which keeps this
+    close enough for a cropped re-OCR. Returns {field: {'page', 'top', 'bottom'}}
+    with top/bottom as fractions of the page height.
+    """
+    regions = {}
+    fields = [(field, result.get(field)) for field in LOCATED_FIELDS]
+    fields += [(f"items.{index}.total_price", item.get('total_price'))
+               for index, item in enumerate(result.get('items') or []) if isinstance(item, dict)]
+
+    for page_index, markdown in enumerate(pages):
+        lines = [line for line in markdown.splitlines() if line.strip()]
+        if not lines:
+            continue
+        line_height = 1.0 / len(lines)
+        for field, value in fields:
+            if field in regions:
+                continue
+            index = _find_line(lines, value)
+            if index is None:
+                continue
+            regions[field] = {
+                'page': page_index,
+                'top': round(max(0.0, (index - LINE_MARGIN) * line_height), 4),
+                'bottom': round(min(1.0, (index + 1 + LINE_MARGIN) * line_height), 4)
+            }
+    return regions
+
+
+def read_field(field, text):
+    """Read a single field's value from the OCR text of a cropped region."""
+    lines = [line.strip().strip('|').strip() for line in text.splitlines() if line.strip()]
+    if field == 'date':
+        return extract_date(text)
+    if field in ('total', 'tax') or field.endswith('price'):
+        label = TOTAL_LINE if field == 'total' else TAX_LINE if field == 'tax' else None
+        candidates = [line for line in lines if label is None or label.search(line)] or lines
+        for line in reversed(candidates):
+            amounts = AMOUNT.findall(line)
+            if amounts:
+                return amounts[-1].strip()
+        return ''
+    return lines[0].lstrip('#').strip() if lines else ''
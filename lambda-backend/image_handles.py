@@ -0,0 +1,179 @@
+import base64
+import os
+import threading
+import time
+import types
+import uuid
+from concurrent.futures import ThreadPoolExecutor
+
+from log import get_logger
+from metrics import metrics
+
+log = get_logger(__name__)
+
+# Signed URLs are requested for this many hours; handles are dropped a minute before they lapse
+IMAGE_HANDLE_EXPIRY_HOURS = int(os.environ.get('IMAGE_HANDLE_EXPIRY_HOURS', '1'))
+EXPIRY_MARGIN = 60
+
+
+class InMemoryFilesAPI:
+    """Local stand-in for the Mistral files endpoint (local runs and tests)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._files = {}
+        self.uploads = 0
+        self.deletes = 0
+
+    def upload(self, file, purpose=None):
+        file_id = str(uuid.uuid4())
+        with self._lock:
+            self._files[file_id] = file['content']
+            self.uploads += 1
+        return types.SimpleNamespace(id=file_id, filename=file['file_name'], purpose=purpose)
+
+    def get_signed_url(self, file_id, expiry=24):
+        with self._lock:
+            if file_id not in self._files:
+                raise KeyError(f"No such file: {file_id}")
+        return types.SimpleNamespace(url=f"memory://files/{file_id}")
+
+    def delete(self, file_id):
+        with self._lock:
+            deleted = self._files.pop(file_id, None) is not None
+            self.deletes += deleted
+        return types.SimpleNamespace(id=file_id, deleted=deleted)
+
+    def __len__(self):
+        with self._lock:
+            return len(self._files)
+
+
+def inline_document(image_b64):
+    """OCR document that embeds the image in the request body."""
+    return {"type": "image_url", "image_url": f"data:image/jpeg;base64,{image_b64}"}
+
+
+class ImageHandles:
+    """
+    Uploads an image once to the files API and hands out a signed URL for it.
+
+    The first OCR attempt embeds the image inline; retries reference the
+    uploaded file by URL instead of re-sending the base64 body. Handles are
+    kept per container, so a retried invocation landing on a warm container
+    reuses the upload too. Deletes run on a background thread; in Lambda they
+    may finish during the next invocation once the container thaws.
+    """
+
+    def __init__(self, files_api=None, expiry_hours=IMAGE_HANDLE_EXPIRY_HOURS):
+        # Without an explicit files API, the client's own `files` endpoint is used
+        self.files_api = files_api
+        self.expiry_hours = expiry_hours
+        self._lock = threading.Lock()
+        self._handles = {}
+        self._cleanup = ThreadPoolExecutor(max_workers=1, thread_name_prefix='image-handle-cleanup')
+        self.uploads = 0
+        self.upload_failures = 0
+        self.reuses = 0
+        self.bytes_avoided = 0
+        self.deleted = 0
+        self.delete_failures = 0
+
+    def document(self, client, key, image_b64, upload=False):
+        """
+        Return the OCR document for an image.
+
+        An existing handle for `key` is always referenced. Otherwise the image
+        is uploaded when `upload` is set, and sent inline when it is not or
+        when the upload fails.
+        """
+        with self._lock:
+            handle = self._handles.get(key)
+            if handle and handle['expires_at'] <= time.time():
+                self._handles.pop(key)
+                self._schedule_delete(handle)
+                handle = None
+            if handle:
+                self.reuses += 1
+                self.bytes_avoided += len(image_b64)
+                metrics.increment('image_handle_reuses')
+                metrics.observe('image_handle_bytes_avoided', len(image_b64), unit='Bytes')
+                return {"type": "image_url", "image_url": handle['url']}
+
+        if not upload:
+            return inline_document(image_b64)
+
+        try:
+            handle = self._upload(client, key, image_b64)
+        except Exception as e:
+            log.warning("Image upload failed (%s), sending the image inline", e)
+            with self._lock:
+                self.upload_failures += 1
+            metrics.increment('image_handle_upload_failures')
+            return inline_document(image_b64)
+        return {"type": "image_url", "image_url": handle['url']}
+
+    def release(self, key):
+        """Forget the handle for `key` and delete its file in the background."""
+        with self._lock:
+            handle = self._handles.pop(key, None)
+            if handle:
+                self._schedule_delete(handle)
+
+    def _upload(self, client, key, image_b64):
+        files_api = self.files_api if self.files_api is not None else client.files
+        uploaded = files_api.upload(
+            file={"file_name": f"{key}.jpg", "content": base64.b64decode(image_b64)},
+            purpose="ocr"
+        )
+        signed = files_api.get_signed_url(file_id=uploaded.id, expiry=self.expiry_hours)
+        handle = {
+            'file_id': uploaded.id,
+            'url': signed.url,
+            'files_api': files_api,
+            'expires_at': time.time() + self.expiry_hours * 3600 - EXPIRY_MARGIN
+        }
+        with self._lock:
+            previous = self._handles.get(key)
+            self._handles[key] = handle
+            self.uploads += 1
+            if previous:
+                self._schedule_delete(previous)
+        metrics.increment('image_handle_uploads')
+        log.info("Uploaded image %s as file %s", key, uploaded.id)
+        return handle
+
+    def _schedule_delete(self, handle):
+        self._cleanup.submit(self._delete, handle)
+
+    def _delete(self, handle):
+        try:
+            handle['files_api'].delete(file_id=handle['file_id'])
+        except Exception as e:
+            log.warning("Failed to delete uploaded image %s: %s", handle['file_id'], e)
+            with self._lock:
+                self.delete_failures += 1
+            metrics.increment('image_handle_delete_failures')
+            return
+        with self._lock:
+            self.deleted += 1
+        metrics.increment('image_handle_deletes')
+
+    def flush(self):
+        """Wait for pending deletes (tests and shutdown)."""
+        self._cleanup.submit(lambda: None).result()
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'active': len(self._handles),
+                'uploads': self.uploads,
+                'upload_failures': self.upload_failures,
+                'reuses': self.reuses,
+                'bytes_avoided': self.bytes_avoided,
+                'deleted': self.deleted,
+                'delete_failures': self.delete_failures
+            }
+
+
+image_handles = ImageHandles()
@@ -0,0 +1,110 @@
+import base64
+import io
+
+# Pillow is optional: without it, image operations fall back to sending the original image
+try:
+    from PIL import Image
+except ImportError:
+    Image = None
+
+IMAGING_AVAILABLE = Image is not None
+
+
+class ImagingUnavailable(Exception):
+    """Raised when an image operation needs Pillow and it is not installed or cannot decode the image."""
+
+
+def decode_image_base64(image_base64):
+    """Decode a plain or data-URL base64 image into bytes."""
+    if image_base64.startswith("data:image"):
+        image_base64 = image_base64.split(",")[1]
+    return base64.b64decode(image_base64)
+
+
+def encode_jpeg(image, quality=90):
+    """Encode a Pillow image as base64 JPEG."""
+    buffer = io.BytesIO()
+    image.convert('RGB').save(buffer, format='JPEG', quality=quality)
+    return base64.b64encode(buffer.getvalue()).decode('ascii')
+
+
+def open_image(image_bytes):
+    if Image is None:
+        raise ImagingUnavailable("Pillow is not installed")
+    try:
+        image = Image.open(io.BytesIO(image_bytes))
+        image.load()
+    except (OSError, ValueError) as e:
+        # Formats Pillow cannot read are still sent to OCR unmodified
+        raise ImagingUnavailable(f"Cannot decode image: {str(e)}")
+    return image
+
+
+def crop_region(image_bytes, region, scale=2.0, min_height=64):
+    """
+    Crop a region given as fractions of the image and upscale it for re-OCR.
+
+    `region` holds `top`, `bottom` and optionally `left`/`right` in the 0..1
+    range. Returns the crop as base64 JPEG.
+    """
+    image = open_image(image_bytes)
+    width, height = image.size
+    box = (
+        int(region.get('left', 0.0) * width),
+        int(region['top'] * height),
+        int(region.get('right', 1.0) * width),
+        int(region['bottom'] * height)
+    )
+    # Thin regions still yield at least one pixel row and column
+    box = (box[0], box[1], max(box[2], box[0] + 1), max(box[3], box[1] + 1))
+    crop = image.crop(box)
+    factor = max(scale, min_height / max(crop.height, 1))
+    crop = crop.resize((int(crop.width * factor), int(crop.height * factor)), Image.LANCZOS)
+    return encode_jpeg(crop)
+
+
+def split_tall_image(image, min_aspect=3.0, tile_aspect=2.0, overlap=0.12, max_tiles=8):
+    """
+    Split a tall, narrow receipt photo (a Pillow image) into overlapping horizontal strips.
+
+    Images whose height/width ratio is below `min_aspect` are not split.
+    Each strip is `tile_aspect` times as tall as the image is wide (grown
+    when needed to stay within `max_tiles`) and overlaps its neighbour by the
+    `overlap` fraction of its height. Returns a list of base64 JPEG strips,
+    or None when the image should be processed whole.
+    """
+    width, height = image.size
+    if width == 0 or height / width < min_aspect:
+        return None
+
+    tile_height = max(int(width * tile_aspect), 1)
+    # stride * (tiles - 1) + tile_height >= height, with stride = tile_height * (1 - overlap)
+    needed = 1 + -(-(height - tile_height) // max(int(tile_height * (1 - overlap)), 1))
+    if needed > max_tiles:
+        tile_height = int(height / (1 + (max_tiles - 1) * (1 - overlap))) + 1
+    stride = max(int(tile_height * (1 - overlap)), 1)
+
+    tiles = []
+    top = 0
+    while True:
+        bottom = min(top + tile_height, height)
+        tiles.append(encode_jpeg(image.crop((0, top, width, bottom))))
+        if bottom >= height:
+            break
+        top += stride
+    return tiles
+
+
+def downscale(image, max_side=1024, quality=70):
+    """
+    Shrink a Pillow image so its longest side is at most `max_side` pixels.
+
+    Returns the downscaled image as base64 JPEG, or None when the image is
+    already small enough that a reduced pass would not save anything.
+    """
+    width, height = image.size
+    factor = max_side / max(width, height)
+    if factor >= 1:
+        return None
+    small = image.resize((max(int(width * factor), 1), max(int(height * factor), 1)), Image.LANCZOS)
+    return encode_jpeg(small, quality=quality)
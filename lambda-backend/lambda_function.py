@@ -1,25 +1,60 @@
 import json
+import math
+import uuid
 import base64
-import os
-from typing import Dict, Any
-import boto3
-from mistral_client import process_image
+from typing import Dict, Any, Optional
+from mistral_client import process_image, process_image_url, reextract_field
+from scheduler import PRIORITY_CLASSES, PreemptedError, scheduler
+from layout_index import layout_index
+from ocr_cache import ocr_cache
+from image_handles import image_handles
+from providers import provider_pool
+from queue_worker import (SQS_MAX_MESSAGE_BYTES, InvalidMessage, default_receipt_queue, default_result_store,
+                          is_queue_event, process_queue_event)
+from circuit_breaker import CircuitOpenError
+from uploads import UploadNotFound, default_upload_store
+from field_regions import valid_region
+from secret_provider import default_secret_provider, is_auth_error
+from request_context import current_context, request_scope
+from metering import meter
+from metrics import metrics
+from log import Redacted, get_logger
+from profiling import InvocationProfile, profile_requested, profile_sampled
+from warmup import PREWARM_ON_INIT, is_warmup_event, prewarmer
+from lifecycle import on_after_restore, on_before_snapshot
 
-# Initialize Secrets Manager client
-secrets_client = boto3.client('secretsmanager', region_name='ap-southeast-2')
+log = get_logger(__name__)
 
-def get_mistral_api_key():
-    """Get Mistral API key from AWS Secrets Manager"""
+# Cached Mistral API key, refreshed in the background (see SECRETS_BACKEND)
+mistral_secret = default_secret_provider('ReconcileAI/mistral/api-key')
+
+def get_mistral_api_key(force_refresh=False):
+    """Get the Mistral API key from the cached secret provider"""
     try:
-        response = secrets_client.get_secret_value(SecretId='ReconcileAI/mistral/api-key')
-        secret_string = response['SecretString']
-        # Parse the JSON to get the api_key value
-        secret_dict = json.loads(secret_string)
-        return secret_dict['api_key']
+        return mistral_secret.get(force_refresh=force_refresh)
     except Exception as e:
-        print(f"Error getting Mistral API key from Secrets Manager: {e}")
+        log.error("Error getting Mistral API key: %s", type(e).__name__)
         raise
 
+def call_with_api_key(fn, *args, **kwargs):
+    """Call fn with the cached API key, retrying once with a fresh key if it was rejected"""
+    try:
+        return fn(*args, api_key=get_mistral_api_key(), **kwargs)
+    except Exception as e:
+        if not is_auth_error(e):
+            raise
+        log.warning("Mistral rejected the cached API key, refreshing it")
+        return fn(*args, api_key=get_mistral_api_key(force_refresh=True), **kwargs)
+
+# Where queue-driven invocations write their structured receipts
+result_store = default_result_store()
+
+# Where clients upload images directly with a presigned URL (none unless UPLOAD_BUCKET is set)
+upload_store = default_upload_store()
+
+# Where receipts are deferred to while the OCR or chat circuit is open (none unless RECEIPT_QUEUE_URL and RESULT_BUCKET are set)
+receipt_queue = default_receipt_queue()
+
 # Load the GPT-4o prompt
 GPT4O_PROMPT = """
 Extract the following information from this receipt image and return it as a JSON object:
@@ -47,10 +82,180 @@ Be precise and extract exactly what's shown on the receipt. Look for:
 If information is unclear or missing, use empty strings.
 """
 
+def process_queued_receipt(request_data: Dict[str, Any]) -> Dict[str, Any]:
+    """Process one receipt from a queue message body"""
+    image_base64 = request_data.get('image_base64')
+    upload_id = request_data.get('upload_id')
+    if not image_base64 and not upload_id:
+        raise InvalidMessage('Missing image_base64 or upload_id field')
+    
+    priority = request_data.get('priority', 'batch')
+    if priority not in PRIORITY_CLASSES:
+        raise InvalidMessage(f"Invalid priority: {priority}")
+    
+    # Queued work is metered against the user who submitted it
+    context = current_context()
+    context.user_id = request_data.get('user_id') or context.user_id
+    budget = meter.check_budget(context.user_id)
+    if budget == 'reject':
+        raise InvalidMessage(f"Daily processing budget exceeded for user {context.user_id}")
+    context.downgraded = budget == 'downgrade'
+    
+    # Messages referencing a direct upload stay far below the SQS message size limit
+    if not image_base64:
+        if upload_store is None:
+            raise InvalidMessage('Direct uploads are not configured')
+        try:
+            image_url = upload_store.download_url(upload_id)
+        except (UploadNotFound, ValueError) as e:
+            raise InvalidMessage(str(e))
+        result = call_with_api_key(process_image_url, image_url, GPT4O_PROMPT,
+                                   priority, cache_key=f"upload:{upload_id}")
+        discard_upload(upload_id)
+        return result
+    return call_with_api_key(process_image, image_base64, GPT4O_PROMPT, priority)
+
+def discard_upload(upload_id: str) -> None:
+    """Delete a processed direct upload; if that fails, the bucket's lifecycle rule expires it"""
+    try:
+        upload_store.delete(upload_id)
+    except Exception as e:
+        log.warning("Could not delete upload %s: %s", upload_id, type(e).__name__)
+
+def defer_receipt(request_data: Dict[str, Any], retry_after: int) -> Optional[str]:
+    """Queue a receipt for the queue worker, delayed until the circuit may close; returns its receipt id or None"""
+    if receipt_queue is None:
+        return None
+    message = {
+        'receipt_id': str(uuid.uuid4()),
+        'priority': 'batch',
+        'user_id': current_context().user_id
+    }
+    if request_data.get('image_base64'):
+        message['image_base64'] = request_data['image_base64']
+    else:
+        message['upload_id'] = request_data['upload_id']
+    # Large inline images don't fit in a queue message; only direct uploads always can be deferred
+    if len(json.dumps(message)) > SQS_MAX_MESSAGE_BYTES:
+        return None
+    try:
+        receipt_queue.send_message(message, delay_seconds=retry_after)
+    except Exception as e:
+        log.warning("Could not defer receipt: %s", type(e).__name__)
+        return None
+    metrics.increment('receipts_deferred')
+    return message['receipt_id']
+
+def get_user_id(event: Dict[str, Any]) -> str:
+    """Cognito user id from the API Gateway authorizer claims, or 'anonymous'"""
+    authorizer = (event.get('requestContext') or {}).get('authorizer') or {}
+    claims = authorizer.get('claims') or (authorizer.get('jwt') or {}).get('claims') or {}
+    return claims.get('sub') or 'anonymous'
+
+def with_profile(response: Dict[str, Any], profile: Dict[str, Any]) -> Dict[str, Any]:
+    """Attach a profile summary to a JSON response body"""
+    try:
+        body = json.loads(response.get('body') or '{}')
+    except json.JSONDecodeError:
+        return response
+    body['profile'] = profile
+    return dict(response, body=json.dumps(body))
+
 def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
     """
     AWS Lambda handler for receipt processing
+    
+    Handles API Gateway requests, SQS-style queue batches and warm-up pings.
+    Queue batches report partial failures so only the failed messages are
+    redelivered.
+    Each receipt is processed in its own request context.
     """
+    # Scheduled warm-up pings only initialize the container
+    if is_warmup_event(event):
+        try:
+            return prewarmer.run(get_mistral_api_key)
+        finally:
+            metrics.flush()
+    
+    # Queue-driven worker mode; errors here must propagate so the batch is retried
+    # Usage and latency metrics are emitted once per invocation as single batched records
+    if is_queue_event(event):
+        try:
+            return process_queue_event(event, process_queued_receipt, result_store)
+        finally:
+            meter.flush()
+            metrics.flush()
+    
+    request_id = getattr(context, 'aws_request_id', None) or (event.get('requestContext') or {}).get('requestId')
+    try:
+        with request_scope(request_id, get_user_id(event)) as request:
+            # Profiling is opt-in: a signed X-Profile header attaches the profile, sampling only writes it to /tmp
+            attach_profile = profile_requested(event.get('headers'))
+            if attach_profile or profile_sampled():
+                with InvocationProfile(request.request_id) as profile:
+                    response = handle_api_request(event)
+                if attach_profile:
+                    response = with_profile(response, profile.summary())
+            else:
+                response = handle_api_request(event)
+            status = response['statusCode']
+            request.outcome = 'success' if status < 400 else 'client_error' if status < 500 else 'error'
+            return response
+    finally:
+        meter.flush()
+        metrics.flush()
+
+def get_result(receipt_id: Any, user_id: str) -> Dict[str, Any]:
+    """Return the user's stored result of a queued receipt: 200 when processed, 422 when it failed, 404 while pending"""
+    if not receipt_id or not isinstance(receipt_id, str):
+        return {
+            'statusCode': 400,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps({'error': 'Missing receipt_id field'})
+        }
+    
+    # Another user's receipt id looks the same as one that was never queued
+    result = result_store.get(receipt_id, owner=user_id)
+    if result is None:
+        return {
+            'statusCode': 404,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps({'error': 'No result for this receipt yet'})
+        }
+    
+    # The queue worker stores {"error": ...} for receipts that can never be processed
+    if set(result) == {'error'}:
+        return {
+            'statusCode': 422,
+            'headers': {
+                'Access-Control-Allow-Origin': '*',
+                'Content-Type': 'application/json'
+            },
+            'body': json.dumps({
+                'success': False,
+                'error': result['error']
+            })
+        }
+    return {
+        'statusCode': 200,
+        'headers': {
+            'Access-Control-Allow-Origin': '*',
+            'Content-Type': 'application/json'
+        },
+        'body': json.dumps({
+            'success': True,
+            'data': result
+        })
+    }
+
+def handle_api_request(event: Dict[str, Any]) -> Dict[str, Any]:
+    """Handle one API Gateway request"""
     try:
         # Handle CORS preflight requests
         if event.get('httpMethod') == 'OPTIONS':
@@ -93,20 +298,73 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': 'Missing request body'})
             }
         
-        # Extract image data
+        action = request_data.get('action', 'process')
+        
+        # Deferred and queued receipts: look up the result the queue worker stored under the receipt id
+        if action == 'result':
+            return get_result(request_data.get('receipt_id'), current_context().user_id)
+        
+        # Direct uploads: hand out a presigned PUT URL so the image never passes through the Lambda
+        if action == 'upload_init':
+            if upload_store is None:
+                return {
+                    'statusCode': 501,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Content-Type': 'application/json'
+                    },
+                    'body': json.dumps({'error': 'Direct uploads are not configured'})
+                }
+            try:
+                upload = upload_store.create_upload(request_data.get('content_type', 'image/jpeg'))
+            except ValueError as e:
+                return {
+                    'statusCode': 400,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Content-Type': 'application/json'
+                    },
+                    'body': json.dumps({'error': str(e)})
+                }
+            return {
+                'statusCode': 200,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Content-Type': 'application/json'
+                },
+                'body': json.dumps({
+                    'success': True,
+                    'data': upload
+                })
+            }
+        
+        # Extract image data; a completed direct upload can be processed by its id instead
         image_base64 = request_data.get('image_base64')
-        if not image_base64:
+        upload_id = request_data.get('upload_id')
+        if not image_base64 and not (upload_id and action == 'process'):
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Content-Type': 'application/json'
+                },
+                'body': json.dumps({'error': 'Missing image_base64 or upload_id field'})
+            }
+        
+        # Interactive uploads are served ahead of bulk imports
+        priority = request_data.get('priority', 'interactive')
+        if priority not in PRIORITY_CLASSES:
             return {
                 'statusCode': 400,
                 'headers': {
                     'Access-Control-Allow-Origin': '*',
                     'Content-Type': 'application/json'
                 },
-                'body': json.dumps({'error': 'Missing image_base64 field'})
+                'body': json.dumps({'error': f"Invalid priority. Must be one of: {', '.join(PRIORITY_CLASSES)}"})
             }
         
         # Validate image size (4MB limit)
-        image_size = len(image_base64) * 3 / 4  # Approximate size of decoded base64
+        image_size = len(image_base64 or '') * 3 / 4  # Approximate size of decoded base64
         max_size = 4 * 1024 * 1024  # 4MB
         if image_size > max_size:
             return {
@@ -118,12 +376,75 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'body': json.dumps({'error': f'Image too large. Maximum size is {max_size / (1024 * 1024):.1f} MB'})
             }
         
+        # A field re-extraction re-reads one region returned by an earlier result
+        region = request_data.get('region')
+        if action == 'reextract_field' and (not request_data.get('field') or not valid_region(region)):
+            return {
+                'statusCode': 400,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Content-Type': 'application/json'
+                },
+                'body': json.dumps({'error': 'reextract_field requires a field and a region with 0 <= top < bottom <= 1 '
+                                             'and, if given, 0 <= left < right <= 1'})
+            }
+        
+        # OCR fetches a direct upload itself through a short-lived GET URL
+        image_url = None
+        if not image_base64:
+            if upload_store is None:
+                return {
+                    'statusCode': 501,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Content-Type': 'application/json'
+                    },
+                    'body': json.dumps({'error': 'Direct uploads are not configured'})
+                }
+            try:
+                image_url = upload_store.download_url(upload_id)
+            except UploadNotFound as e:
+                return {
+                    'statusCode': 404,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Content-Type': 'application/json'
+                    },
+                    'body': json.dumps({'error': str(e)})
+                }
+            except ValueError as e:
+                return {
+                    'statusCode': 413,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Content-Type': 'application/json'
+                    },
+                    'body': json.dumps({'error': str(e)})
+                }
+        
+        # Users over their daily budget are switched to the cheaper model, then rejected
+        budget = meter.check_budget(current_context().user_id)
+        if budget == 'reject':
+            return {
+                'statusCode': 429,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Content-Type': 'application/json'
+                },
+                'body': json.dumps({'error': 'Daily processing budget exceeded'})
+            }
+        current_context().downgraded = budget == 'downgrade'
+        
         # Process the image with Mistral
         try:
-            # Set the API key from Secrets Manager
-            os.environ['MISTRAL_API_KEY'] = get_mistral_api_key()
-            
-            result = process_image(image_base64, GPT4O_PROMPT)
+            if action == 'reextract_field':
+                result = call_with_api_key(reextract_field, image_base64, request_data['field'], region, priority)
+            elif image_url:
+                result = call_with_api_key(process_image_url, image_url, GPT4O_PROMPT, priority,
+                                           cache_key=f"upload:{upload_id}")
+                discard_upload(upload_id)
+            else:
+                result = call_with_api_key(process_image, image_base64, GPT4O_PROMPT, priority)
             
             return {
                 'statusCode': 200,
@@ -137,8 +458,56 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 })
             }
             
+        except CircuitOpenError as e:
+            # Fail fast during an outage instead of waiting on timeouts; defer the receipt when possible
+            retry_after = math.ceil(e.retry_after)
+            log.warning("Failing fast: %s", e)
+            receipt_id = defer_receipt(request_data, retry_after) if action == 'process' else None
+            if receipt_id:
+                return {
+                    'statusCode': 202,
+                    'headers': {
+                        'Access-Control-Allow-Origin': '*',
+                        'Content-Type': 'application/json'
+                    },
+                    'body': json.dumps({
+                        'success': True,
+                        'queued': True,
+                        'data': {'receipt_id': receipt_id}
+                    })
+                }
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'Retry-After',
+                    'Content-Type': 'application/json',
+                    'Retry-After': str(retry_after)
+                },
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Receipt processing is temporarily unavailable, please retry later'
+                })
+            }
+            
+        except PreemptedError as e:
+            log.warning("Receipt preempted by scheduler: %s", e)
+            return {
+                'statusCode': 503,
+                'headers': {
+                    'Access-Control-Allow-Origin': '*',
+                    'Access-Control-Expose-Headers': 'Retry-After',
+                    'Content-Type': 'application/json',
+                    'Retry-After': '5'
+                },
+                'body': json.dumps({
+                    'success': False,
+                    'error': 'Server busy, please retry shortly'
+                })
+            }
+            
         except Exception as e:
-            print(f"Error processing image: {str(e)}")
+            log.error("Error processing image: %s", Redacted(e), exc_info=True)
             return {
                 'statusCode': 500,
                 'headers': {
@@ -161,7 +530,7 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
             }
             
     except Exception as e:
-        print(f"Lambda handler error: {str(e)}")
+        log.error("Lambda handler error: %s", Redacted(e), exc_info=True)
         return {
             'statusCode': 500,
             'headers': {
@@ -169,4 +538,34 @@ def lambda_handler(event: Dict[str, Any], context: Any) -> Dict[str, Any]:
                 'Content-Type': 'application/json'
             },
             'body': json.dumps({'error': 'Internal server error'})
-        }
\ No newline at end of file
+        }
+
+# Optionally warm up during the init phase, which runs with extra CPU
+if PREWARM_ON_INIT:
+    prewarmer.run(get_mistral_api_key)
+
+# Components count their events per invocation; only point-in-time state is reported as gauges
+metrics.register_gauges('scheduler', scheduler.load)
+metrics.register_gauges('ocr_cache', lambda: {'entries': ocr_cache.metrics()['entries']})
+metrics.register_gauges('layout_index', lambda: {'templates': len(layout_index)})
+metrics.register_gauges('image_handles', lambda: {'active': image_handles.metrics()['active']})
+metrics.register_gauges('providers', lambda: {
+    key: {'latency_ms': health['latency_ms'], 'error_rate': health['error_rate']}
+    for key, health in provider_pool.metrics().items()
+})
+
+# Snapshots must not carry the API key or init-phase usage into every restored container
+on_before_snapshot(mistral_secret.invalidate)
+on_after_restore(mistral_secret.invalidate)
+on_before_snapshot(meter.flush)
+on_before_snapshot(metrics.flush)
+
+# boto3 clients built during init carry its connections and credentials; restored containers build new ones
+for component in (mistral_secret.backend, result_store, upload_store, receipt_queue):
+    if hasattr(component, 'reconnect'):
+        on_after_restore(component.reconnect)
+
+if __name__ == '__main__':
+    # Local testing: serve lambda_handler over HTTP on port 8080 (see dev_server.py)
+    from dev_server import main
+    main()
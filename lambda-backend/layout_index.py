@@ -0,0 +1,253 @@
+import hashlib
+import os
+import re
+import threading
+from collections import OrderedDict
+
+from metrics import metrics
+from table_extractor import AMOUNT, RECEIPT_ID_LINE, derive_unit_price, extract_date, find_tables
+from validation import amounts_match, parse_amount, validate_receipt
+
+DIGITS = re.compile(r'\d+')
+NON_WORD = re.compile(r'[^a-z# ]+')
+
+
+def _line_shape(line):
+    """Classify a line as table row (T), amount line (A) or text (W)."""
+    if line.startswith('|'):
+        return 'T'
+    if AMOUNT.search(line):
+        return 'A'
+    return 'W'
+
+
+def _normalize_tokens(line):
+    return ' '.join(NON_WORD.sub(' ', DIGITS.sub('#', line.lower())).split())
+
+
+def _text_lines(text):
+    return [line.strip() for line in text.splitlines() if line.strip() and not line.strip().startswith('![')]
+
+
+def fingerprint(text):
+    """
+    Fingerprint the layout of an OCR markdown receipt.
+
+    Combines the normalized first header line, the table column headers and
+    the sequence of line shapes with repeated runs collapsed, so receipts from
+    the same template share a fingerprint regardless of how many items they list.
+    """
+    lines = _text_lines(text)
+    header = _normalize_tokens(lines[0]) if lines else ''
+    columns = '|'.join(_normalize_tokens(cell) for header_cells, _ in find_tables(text) for cell in header_cells)
+
+    shapes = []
+    for line in lines:
+        shape = _line_shape(line)
+        if not shapes or shapes[-1] != shape:
+            shapes.append(shape)
+
+    digest = hashlib.sha1(f"{header}\n{columns}\n{''.join(shapes)}".encode('utf-8')).hexdigest()
+    return digest[:16]
+
+
+def _label_for_amount(text, value):
+    """Return the text label on the last non-table line whose amount equals value."""
+    target = parse_amount(value)
+    if target is None:
+        return None
+    label = None
+    for line in text.splitlines():
+        line = line.strip().strip('*').strip()
+        if line.startswith('|'):
+            continue
+        for match in AMOUNT.finditer(line):
+            amount = parse_amount(match.group(0))
+            prefix = _normalize_tokens(line[:match.start()]).replace('#', '').strip()
+            if amount is not None and amounts_match(amount, target) and prefix:
+                label = prefix
+    return label
+
+
+def _amount_after_label(text, label):
+    """Return the amount on the last non-table line whose normalized text starts with label."""
+    found = ''
+    for line in text.splitlines():
+        line = line.strip().strip('*').strip()
+        if line.startswith('|'):
+            continue
+        if _normalize_tokens(line).replace('#', '').strip().startswith(label):
+            amounts = AMOUNT.findall(line)
+            if amounts:
+                found = amounts[-1].strip()
+    return found
+
+
+def _learn_columns(tables, item):
+    """Find the table and column indexes that hold the fields of a known item."""
+    for table_index, (_, rows) in enumerate(tables):
+        for row in rows:
+            columns = {}
+            for field in ('name', 'total_price', 'qty', 'unit_price'):
+                wanted = str(item.get(field, '')).strip()
+                if not wanted:
+                    continue
+                for index, cell in enumerate(row):
+                    if index in columns.values():
+                        continue
+                    if cell == wanted or (field != 'name' and parse_amount(cell) is not None
+                                          and parse_amount(cell) == parse_amount(wanted)):
+                        columns[field] = index
+                        break
+            if 'name' in columns and 'total_price' in columns:
+                return table_index, columns
+    return None
+
+
+def learn_recipe(text, result):
+    """
+    Learn an extraction recipe for this layout from a verified structured result.
+
+    Returns None when the result cannot be mapped back onto the OCR text.
+    """
+    items = result.get('items') or []
+    tables = find_tables(text)
+    if not items or not tables:
+        return None
+
+    located = _learn_columns(tables, items[0])
+    total_label = _label_for_amount(text, result.get('total'))
+    if located is None or not total_label:
+        return None
+
+    # Addresses differ between branches of a chain, so remember where they are, not what they say
+    address = (result.get('address') or '').lower()
+    address_lines = [index for index, line in enumerate(_text_lines(text))
+                     if address and not line.startswith('|') and line.lower() in address]
+
+    table_index, columns = located
+    return {
+        'merchant': result.get('merchant', ''),
+        'address_lines': address_lines,
+        'table_index': table_index,
+        'columns': columns,
+        'total_label': total_label,
+        'tax_label': _label_for_amount(text, result.get('tax'))
+    }
+
+
+def apply_recipe(text, recipe):
+    """Extract a receipt from OCR markdown with a learned recipe."""
+    tables = find_tables(text)
+    items = []
+    if recipe['table_index'] < len(tables):
+        _, rows = tables[recipe['table_index']]
+        columns = recipe['columns']
+        for row in rows:
+            cell = lambda field: row[columns[field]] if field in columns and columns[field] < len(row) else ''
+            if not cell('name') or parse_amount(cell('total_price')) is None:
+                continue
+            items.append({
+                'name': cell('name'),
+                'qty': cell('qty') or '1',
+                'unit_price': cell('unit_price') or derive_unit_price(cell('qty') or '1', cell('total_price')),
+                'total_price': cell('total_price')
+            })
+
+    lines = _text_lines(text)
+    receipt_id_match = RECEIPT_ID_LINE.search(text)
+    return {
+        'merchant': recipe['merchant'],
+        'address': ', '.join(lines[index] for index in recipe['address_lines'] if index < len(lines)),
+        'date': extract_date(text),
+        'receipt_id': receipt_id_match.group(4) if receipt_id_match else '',
+        'tax': _amount_after_label(text, recipe['tax_label']) if recipe['tax_label'] else '',
+        'total': _amount_after_label(text, recipe['total_label']),
+        'items': items
+    }
+
+
+class LayoutIndex:
+    """
+    LRU-bounded index from layout fingerprint to extraction recipe.
+
+    Receipts whose layout matches a known template are extracted locally with
+    the stored recipe. Unknown layouts go through the LLM and are added once
+    the recipe learned from the model output reproduces that output.
+    """
+
+    def __init__(self, capacity=256):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._recipes = OrderedDict()
+        self.lookups = 0
+        self.hits = 0
+        self.learned = 0
+        self.evictions = 0
+
+    def __len__(self):
+        with self._lock:
+            return len(self._recipes)
+
+    def extract(self, text):
+        """Return (fingerprint, result); result is None when no usable recipe matches."""
+        key = fingerprint(text)
+        with self._lock:
+            self.lookups += 1
+            recipe = self._recipes.get(key)
+            if recipe is not None:
+                self._recipes.move_to_end(key)
+        if recipe is None:
+            metrics.increment('layout_misses')
+            return key, None
+
+        result = apply_recipe(text, recipe)
+        if validate_receipt(result):
+            metrics.increment('layout_misses')
+            return key, None
+        with self._lock:
+            self.hits += 1
+        metrics.increment('layout_hits')
+        return key, result
+
+    def learn(self, key, text, result):
+        """Learn and store a recipe for this layout if it reproduces the verified result."""
+        if validate_receipt(result):
+            return False
+        recipe = learn_recipe(text, result)
+        if recipe is None:
+            return False
+
+        replayed = apply_recipe(text, recipe)
+        if len(replayed['items']) != len(result['items']) or \
+                not amounts_match(parse_amount(replayed['total']) or 0.0, parse_amount(result['total'])):
+            return False
+
+        with self._lock:
+            self._recipes[key] = recipe
+            self._recipes.move_to_end(key)
+            self.learned += 1
+            evicted = 0
+            while len(self._recipes) > self.capacity:
+                self._recipes.popitem(last=False)
+                evicted += 1
+            self.evictions += evicted
+        metrics.increment('layout_learned')
+        if evicted:
+            metrics.increment('layout_evictions', evicted)
+        return True
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'templates': len(self._recipes),
+                'lookups': self.lookups,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.lookups, 4) if self.lookups else 0.0,
+                'learned': self.learned,
+                'evictions': self.evictions
+            }
+
+
+# Shared template index for this container
+layout_index = LayoutIndex(capacity=int(os.environ.get('LAYOUT_INDEX_CAPACITY', '256')))
@@ -0,0 +1,66 @@
+import random
+
+from log import get_logger
+
+log = get_logger(__name__)
+
+# Runtime hooks for snapshot-based fast starts (Lambda SnapStart); absent elsewhere
+try:
+    from snapshot_restore_py import register_after_restore, register_before_snapshot
+except ImportError:
+    register_after_restore = register_before_snapshot = None
+
+_before_snapshot_hooks = []
+_after_restore_hooks = []
+restores = 0
+
+
+def on_before_snapshot(fn):
+    """Register fn to run before the initialized container is snapshotted."""
+    _before_snapshot_hooks.append(fn)
+    return fn
+
+
+def on_after_restore(fn):
+    """Register fn to run when a container is restored from a snapshot."""
+    _after_restore_hooks.append(fn)
+    return fn
+
+
+def _run(hooks, phase):
+    for hook in hooks:
+        try:
+            hook()
+        except Exception as e:
+            log.warning("%s hook %s failed: %s", phase, getattr(hook, '__qualname__', hook), e)
+
+
+def before_snapshot():
+    """
+    Drop state that must not be shared by every container restored from the snapshot.
+
+    Imports, compiled regexes, prompt templates and SDK model classes stay in
+    the snapshot; open connections, cached credentials and pending metrics
+    are released by the registered hooks.
+    """
+    _run(_before_snapshot_hooks, 'before_snapshot')
+
+
+def after_restore():
+    """
+    Make a restored container unique again.
+
+    Every restore starts from the same memory, so the random module is
+    reseeded from the OS. Hooks clear connections and credentials, which are
+    then re-established lazily by the first request.
+    """
+    global restores
+    restores += 1
+    random.seed()
+    _run(_after_restore_hooks, 'after_restore')
+    log.info("Restored from snapshot", extra={'fields': {'restores': restores}})
+
+
+if register_before_snapshot is not None:
+    register_before_snapshot(before_snapshot)
+    register_after_restore(after_restore)
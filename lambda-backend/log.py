@@ -0,0 +1,100 @@
+import json
+import logging
+import os
+import sys
+import time
+import zlib
+
+from request_context import active_context
+
+# Deployment environment; `dev` logs everything unredacted at DEBUG, anything else defaults to INFO with redaction
+ENVIRONMENT = os.environ.get('ENVIRONMENT', 'prod').lower()
+LOG_LEVEL = os.environ.get('LOG_LEVEL', 'DEBUG' if ENVIRONMENT == 'dev' else 'INFO').upper()
+LOG_REDACT = os.environ.get('LOG_REDACT', 'false' if ENVIRONMENT == 'dev' else 'true').lower() == 'true'
+
+# Per-level sampling, e.g. "DEBUG=0.01,INFO=0.25"; unlisted levels are always logged
+LOG_SAMPLE_RATES = os.environ.get('LOG_SAMPLE_RATES', '')
+
+
+def _parse_sample_rates(spec):
+    rates = {}
+    for part in filter(None, (part.strip() for part in spec.split(','))):
+        level, _, rate = part.partition('=')
+        rates[logging.getLevelName(level.strip().upper())] = float(rate)
+    return rates
+
+
+class Redacted:
+    """
+    Wraps receipt contents passed as a log argument.
+
+    Formatting is lazy, and with redaction on only the length is written,
+    so OCR text and model output never reach the logs in production.
+    """
+
+    __slots__ = ('value',)
+
+    def __init__(self, value):
+        self.value = value
+
+    def __str__(self):
+        text = str(self.value)
+        return f"<redacted {len(text)} chars>" if LOG_REDACT else text
+
+
+class SamplingFilter(logging.Filter):
+    """
+    Keeps a configured share of records per level.
+
+    The decision is a hash of the request id, so a sampled request keeps all
+    of its lines at that level instead of a random scattering of them.
+    """
+
+    def __init__(self, rates):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record):
+        rate = self.rates.get(record.levelno)
+        if rate is None or rate >= 1:
+            return True
+        context = active_context()
+        key = f"{context.request_id}:{record.levelno}" if context else f"{record.created}:{record.lineno}"
+        return zlib.crc32(key.encode('utf-8')) / 0xFFFFFFFF < rate
+
+
+class JsonFormatter(logging.Formatter):
+    """One JSON object per line with the request id and any `extra={'fields': {...}}`."""
+
+    def format(self, record):
+        entry = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S', time.gmtime(record.created)) + f".{int(record.msecs):03d}Z",
+            'level': record.levelname,
+            'logger': record.name,
+            'message': record.getMessage()
+        }
+        context = active_context()
+        if context is not None:
+            entry['request_id'] = context.request_id
+        entry.update(getattr(record, 'fields', None) or {})
+        if record.exc_info:
+            entry['exception'] = record.exc_info[0].__name__
+            # Exception messages can quote receipt contents, so the traceback is only kept unredacted
+            if not LOG_REDACT:
+                entry['traceback'] = self.formatException(record.exc_info)
+        return json.dumps(entry, default=str)
+
+
+_root = logging.getLogger('receipt_scanner')
+_root.setLevel(LOG_LEVEL)
+_root.propagate = False
+if not _root.handlers:
+    _handler = logging.StreamHandler(sys.stdout)
+    _handler.setFormatter(JsonFormatter())
+    _handler.addFilter(SamplingFilter(_parse_sample_rates(LOG_SAMPLE_RATES)))
+    _root.addHandler(_handler)
+
+
+def get_logger(name):
+    """Return a logger under the shared, JSON-formatted `receipt_scanner` logger."""
+    return logging.getLogger(f"receipt_scanner.{name}")
@@ -0,0 +1,119 @@
+import json
+import os
+import threading
+import time
+
+from metrics import metrics
+
+# List prices in USD: chat models per million tokens (input, output), OCR per thousand pages
+MODEL_PRICES = {
+    'mistral-small-latest': (0.1, 0.3),
+    'mistral-large-latest': (2.0, 6.0),
+}
+OCR_PRICE_PER_1000_PAGES = 1.0
+
+# Optional per-user daily spend limit in USD; unset means no enforcement
+USER_DAILY_BUDGET = float(os.environ['USER_DAILY_BUDGET_USD']) if os.environ.get('USER_DAILY_BUDGET_USD') else None
+
+# Share of the budget after which a user is switched to the cheaper model
+DOWNGRADE_AT = float(os.environ.get('BUDGET_DOWNGRADE_AT', '0.8'))
+
+# Pending aggregates are emitted once this many distinct (user, stage, model) keys build up
+METERING_FLUSH_KEYS = int(os.environ.get('METERING_FLUSH_KEYS', '100'))
+
+COUNTERS = ('requests', 'prompt_tokens', 'completion_tokens', 'ocr_pages', 'bytes_uploaded')
+
+
+def estimate_cost(model, prompt_tokens=0, completion_tokens=0, ocr_pages=0, **_):
+    """Estimated list price in USD of one stage's usage."""
+    input_price, output_price = MODEL_PRICES.get(model, (0.0, 0.0))
+    return (prompt_tokens * input_price + completion_tokens * output_price) / 1_000_000 \
+        + ocr_pages * OCR_PRICE_PER_1000_PAGES / 1000
+
+
+class UsageMeter:
+    """
+    Aggregates token, page and byte usage per user, stage and model.
+
+    Usage is summed in memory and emitted as a single JSON line per flush
+    rather than one line per API call. Daily spend per user is tracked for
+    budget enforcement; it is per container, so with many containers the
+    budget acts as a per-container limit unless the totals are fed back from
+    the emitted records.
+    """
+
+    def __init__(self, daily_budget=USER_DAILY_BUDGET, flush_keys=METERING_FLUSH_KEYS):
+        self.daily_budget = daily_budget
+        self.flush_keys = flush_keys
+        self._lock = threading.Lock()
+        self._pending = {}
+        self._spend = {}
+        self.rejected = 0
+        self.downgraded = 0
+
+    def record(self, user_id, stage, model, **counts):
+        """Add one API call's usage; counts are any of COUNTERS except `requests`."""
+        cost = estimate_cost(model, **counts)
+        day = time.strftime('%Y-%m-%d', time.gmtime())
+        with self._lock:
+            entry = self._pending.setdefault((user_id, stage, model), dict.fromkeys(COUNTERS, 0) | {'cost_usd': 0.0})
+            entry['requests'] += 1
+            for name, count in counts.items():
+                entry[name] += count or 0
+            entry['cost_usd'] += cost
+
+            spent_day, spent = self._spend.get(user_id, (day, 0.0))
+            self._spend[user_id] = (day, (spent if spent_day == day else 0.0) + cost)
+            full = len(self._pending) >= self.flush_keys
+        if full:
+            self.flush()
+
+    def spent_today(self, user_id):
+        day = time.strftime('%Y-%m-%d', time.gmtime())
+        with self._lock:
+            spent_day, spent = self._spend.get(user_id, (day, 0.0))
+        return spent if spent_day == day else 0.0
+
+    def check_budget(self, user_id):
+        """Return 'ok', 'downgrade' (use the cheaper model) or 'reject' for a user's next receipt."""
+        if self.daily_budget is None:
+            return 'ok'
+        spent = self.spent_today(user_id)
+        if spent >= self.daily_budget:
+            with self._lock:
+                self.rejected += 1
+            metrics.increment('budget_rejections')
+            return 'reject'
+        if spent >= self.daily_budget * DOWNGRADE_AT:
+            with self._lock:
+                self.downgraded += 1
+            metrics.increment('budget_downgrades')
+            return 'downgrade'
+        return 'ok'
+
+    def flush(self):
+        """Emit pending aggregates as one JSON line and return them."""
+        with self._lock:
+            pending, self._pending = self._pending, {}
+        if not pending:
+            return []
+        records = []
+        for (user_id, stage, model), entry in pending.items():
+            record = {'user_id': user_id, 'stage': stage, 'model': model}
+            record.update((name, entry[name]) for name in COUNTERS)
+            record['cost_usd_estimate'] = round(entry['cost_usd'], 6)
+            records.append(record)
+        print(json.dumps({'metering': records, 'timestamp': int(time.time())}))
+        return records
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'pending_keys': len(self._pending),
+                'users_tracked': len(self._spend),
+                'rejected': self.rejected,
+                'downgraded': self.downgraded
+            }
+
+
+meter = UsageMeter()
@@ -0,0 +1,130 @@
+import json
+import math
+import os
+import threading
+import time
+
+METRICS_NAMESPACE = os.environ.get('METRICS_NAMESPACE', 'ReceiptScanner')
+SERVICE_NAME = os.environ.get('SERVICE_NAME', 'receipt-scanner-mistral')
+
+# Histogram buckets grow geometrically, so ~60 buckets span 1 ms to 10 minutes
+# and stay under the 100 distinct values EMF accepts per metric
+BUCKET_GROWTH = 1.25
+_LOG_GROWTH = math.log(BUCKET_GROWTH)
+
+MAX_METRICS_PER_DIRECTIVE = 100
+
+
+def bucket_value(value):
+    """Round a positive value up to its histogram bucket boundary."""
+    if value <= 1:
+        return round(max(value, 0.0), 2)
+    return round(BUCKET_GROWTH ** math.ceil(math.log(value) / _LOG_GROWTH), 2)
+
+
+class StdoutSink:
+    """Writes each record as one JSON line; CloudWatch Logs extracts EMF records into metrics."""
+
+    def emit(self, record):
+        print(json.dumps(record))
+
+
+class InMemorySink:
+    """Keeps emitted records in memory (tests and the dev server)."""
+
+    def __init__(self):
+        self.records = []
+
+    def emit(self, record):
+        self.records.append(record)
+
+
+class MetricsRegistry:
+    """
+    In-process histograms and counters, flushed as one EMF record per invocation.
+
+    Observations only bump a bucket count under a lock, so recording costs
+    far less than a log line. `flush()` turns everything gathered since the
+    last flush into a single CloudWatch Embedded Metric Format record.
+    """
+
+    def __init__(self, sink=None, namespace=METRICS_NAMESPACE):
+        self.sink = sink or StdoutSink()
+        self.namespace = namespace
+        self._lock = threading.Lock()
+        self._histograms = {}
+        self._counters = {}
+        self._gauge_sources = []
+
+    def observe(self, name, value, unit='Milliseconds'):
+        bucket = bucket_value(value)
+        with self._lock:
+            histogram_unit, counts = self._histograms.setdefault(name, (unit, {}))
+            counts[bucket] = counts.get(bucket, 0) + 1
+
+    def increment(self, name, count=1):
+        with self._lock:
+            self._counters[name] = self._counters.get(name, 0) + count
+
+    def register_gauges(self, prefix, snapshot):
+        """Report the numbers in `snapshot()` (nested dicts allowed) as `<prefix>_<key>` gauges in every record."""
+        self._gauge_sources.append((prefix, snapshot))
+
+    def gauges(self):
+        values = {}
+        for prefix, snapshot in self._gauge_sources:
+            _flatten(prefix, snapshot(), values)
+        return values
+
+    def record_request(self, context, outcome):
+        """Record the stage timings and total latency of a finished request."""
+        for stage, seconds in context.timings.items():
+            self.observe(f"{stage}_ms", seconds * 1000)
+        total_ms = (time.time() - context.started) * 1000
+        self.observe('total_ms', total_ms)
+        self.observe(f"total_ms_{outcome}", total_ms)
+        self.increment(f"requests_{outcome}")
+
+    def flush(self):
+        """Emit one EMF record with everything observed since the last flush, and return it."""
+        with self._lock:
+            histograms, self._histograms = self._histograms, {}
+            counters, self._counters = self._counters, {}
+        gauges = self.gauges()
+        if not histograms and not counters and not gauges:
+            return None
+
+        definitions = [{'Name': name, 'Unit': unit} for name, (unit, _) in sorted(histograms.items())] \
+            + [{'Name': name, 'Unit': 'Count'} for name in sorted(counters)] \
+            + [{'Name': name, 'Unit': 'None'} for name in sorted(gauges)]
+        record = {
+            '_aws': {
+                'Timestamp': int(time.time() * 1000),
+                # EMF accepts at most 100 metrics per directive
+                'CloudWatchMetrics': [{
+                    'Namespace': self.namespace,
+                    'Dimensions': [['Service']],
+                    'Metrics': definitions[start:start + MAX_METRICS_PER_DIRECTIVE]
+                } for start in range(0, len(definitions), MAX_METRICS_PER_DIRECTIVE)]
+            },
+            'Service': SERVICE_NAME
+        }
+        for name, (_, counts) in histograms.items():
+            values = sorted(counts)
+            record[name] = {'Values': values, 'Counts': [counts[value] for value in values]}
+        record.update(counters)
+        record.update(gauges)
+        self.sink.emit(record)
+        return record
+
+
+def _flatten(prefix, snapshot, values):
+    for key, value in snapshot.items():
+        name = f"{prefix}_{key}".replace('.', '_')
+        if isinstance(value, dict):
+            _flatten(name, value, values)
+        elif isinstance(value, (int, float)) and not isinstance(value, bool):
+            values[name] = value
+
+
+metrics = MetricsRegistry()
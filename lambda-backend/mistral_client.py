@@ -1,22 +1,86 @@
 import os
 import json
-from mistralai import Mistral
+import time
+import asyncio
+import threading
+import httpx
 from parse_response import parse_raw_response
+from scheduler import PreemptedError, scheduler
+from model_router import MODEL_ROUTES, measure_ocr_text, router
+from validation import reconciliation_issues, validate_receipt
+from compaction import compact_markdown
+from table_extractor import MIN_CONFIDENCE, extract_receipt, stats as extractor_stats
+from layout_index import layout_index
+from speculation import race_local_and_model
+from money import normalize_receipt
+from field_regions import locate_fields, read_field
+from imaging import (IMAGING_AVAILABLE, ImagingUnavailable, crop_region, decode_image_base64, downscale, open_image,
+                     split_tall_image)
+from tiling import stitch_markdown
+from reconcile import build_followup_prompt, find_inconsistencies, merge_followup, stats as reconcile_stats
+from ocr_cache import image_digest, ocr_cache
+from progressive import low_res_sufficient, stats as progressive_stats
+from image_handles import image_handles, inline_document
+from secret_provider import is_auth_error
+from request_context import current_context, in_request_scope, raw_responses, timed
+from metering import meter
+from metrics import metrics
+from log import Redacted, get_logger
+from lifecycle import on_after_restore, on_before_snapshot
+from providers import FailoverClient, provider_pool
+from circuit_breaker import CircuitBreaker, CircuitOpenError, is_outage_error
 
-# Global variable to store the last raw response
-LAST_RAW_RESPONSE = ""
+log = get_logger(__name__)
 
-def process_image(image_base64, system_prompt):
-    """Process an image with Mistral OCR and return structured JSON data."""
-    global LAST_RAW_RESPONSE
-    
+# One pooled HTTP client per container keeps the TLS connection to the API host open between
+# requests for sync calls; async calls (tiled OCR, speculative chat) connect per event loop, see _run_async()
+_http_client = None
+_http_client_lock = threading.Lock()
+
+# Loading the CA bundle is the slow part of building a client; the context survives snapshots
+_ssl_context = None
+
+# Interactive uploads race the local extractors against the chat call
+SPECULATIVE_EXTRACTION = os.environ.get('SPECULATIVE_EXTRACTION', 'true').lower() == 'true'
+
+# Tall receipts are split into overlapping strips that are OCR'd in parallel
+TILED_OCR = os.environ.get('TILED_OCR', 'true').lower() == 'true'
+
+# Receipts are first OCR'd downscaled and only re-sent at full resolution when that falls short
+PROGRESSIVE_OCR = os.environ.get('PROGRESSIVE_OCR', 'true').lower() == 'true'
+PROGRESSIVE_MAX_SIDE = int(os.environ.get('PROGRESSIVE_MAX_SIDE', '1024'))
+
+# OCR attempts per image; retries reference the uploaded file instead of re-sending the image
+OCR_MAX_ATTEMPTS = int(os.environ.get('OCR_MAX_ATTEMPTS', '2'))
+
+# Both passes need Pillow; without it every receipt is sent whole at full resolution
+if (TILED_OCR or PROGRESSIVE_OCR) and not IMAGING_AVAILABLE:
+    log.warning("Pillow is not installed, TILED_OCR and PROGRESSIVE_OCR have no effect")
+
+# One breaker per stage across all providers; while open, calls fail fast with CircuitOpenError
+STAGE_BREAKERS = {
+    stage: CircuitBreaker(
+        stage,
+        int(os.environ.get(f'BREAKER_{stage.upper()}_FAILURE_THRESHOLD', '5')),
+        float(os.environ.get(f'BREAKER_{stage.upper()}_RESET_TIMEOUT', '30'))
+    )
+    for stage in ('ocr', 'chat')
+}
+
+@in_request_scope
+def process_image(image_base64, system_prompt, priority='interactive', api_key=None):
+    """Process an image with Mistral OCR and return structured JSON data.
+
+    The OCR and chat calls are admitted through the shared priority scheduler,
+    so interactive uploads are served ahead of queued batch and background work.
+    The result carries the estimated region of each field, so a single field
+    can later be re-read from a crop with reextract_field(). Receipts are first
+    OCR'd downscaled and re-sent at full resolution only when the result does
+    not validate or misses a key field. The raw model output, stage timings
+    and token usage are recorded on the current request context.
+    """
     try:
-        api_key = os.environ.get("MISTRAL_API_KEY")
-        
-        if not api_key:
-            raise ValueError("MISTRAL_API_KEY environment variable not set")
-        
-        client = Mistral(api_key=api_key)
+        client = _get_client(api_key)
         
         # Ensure the image_base64 is properly formatted
         if image_base64.startswith("data:image"):
@@ -25,48 +89,505 @@ def process_image(image_base64, system_prompt):
         else:
             image_b64 = image_base64
             
-        print(f"Sending request to Mistral OCR API with image of length: {len(image_b64)}")
-        
-        # Process with Mistral OCR - use "image_url" type for images
-        ocr_response = client.ocr.process(
-            model="mistral-ocr-latest",
-            document={
-                "type": "image_url",
-                "image_url": f"data:image/jpeg;base64,{image_b64}"
-            }
-        )
+        log.info("Sending request to Mistral OCR API with image of length: %d", len(image_b64))
         
-        # Extract text from all pages
-        text = "\n\n".join([page.markdown for page in ocr_response.pages])
+        metrics.observe('payload_bytes', len(image_b64), unit='Bytes')
         
-        print(f"Mistral OCR extracted text (first 200 chars): {text[:200]}")
+        # Very tall receipts are OCR'd as overlapping strips in parallel, then stitched
+        with timed('decode'):
+            digest = image_digest(image_b64)
+            tiles, low_b64 = _prepare_passes(image_b64)
         
-        # Now use Mistral chat to structure the data
-        chat_response = client.chat.complete(
-            model="mistral-large-latest",
-            messages=[
-                {"role": "system", "content": system_prompt},
-                {"role": "user", "content": f"Here is the OCR text from a receipt:\n\n{text}\n\nPlease extract and structure this data as JSON."}
-            ],
-            temperature=0.0
-        )
+        pages = None
+        wasted = 0.0
+        if low_b64:
+            started = time.time()
+            pages = _ocr_pages(client, low_b64, digest, 'low', None, priority)
+            result, raw_response = _structure_receipt(client, "\n\n".join(pages), system_prompt, priority, low_res=True)
+            elapsed = time.time() - started
+            if low_res_sufficient(result):
+                log.info("Low-resolution pass accepted (%d of %d bytes)", len(low_b64), len(image_b64))
+                progressive_stats.record_low(len(image_b64), len(low_b64), elapsed)
+            else:
+                log.info("Low-resolution pass incomplete, escalating to full resolution")
+                pages = None
+                wasted = elapsed
         
-        content = chat_response.choices[0].message.content
+        if pages is None:
+            started = time.time()
+            pages = _ocr_pages(client, image_b64, digest, 'full', tiles, priority)
+            
+            # Extract text from all pages
+            text = "\n\n".join(pages)
+            
+            log.debug("Mistral OCR extracted text: %s", Redacted(text[:200]))
+            
+            result, raw_response = _structure_receipt(client, text, system_prompt, priority)
+            progressive_stats.record_full(len(low_b64) if low_b64 else 0, time.time() - started, wasted)
         
         # Store the raw response for debugging
-        LAST_RAW_RESPONSE = content
+        current_context().raw_response = raw_response
+        
+        # Uploaded copies are only needed for retries of a failed request
+        for tier in ('low', 'full'):
+            image_handles.release(f"{digest}-{tier}")
+        for index in range(len(tiles or ())):
+            image_handles.release(f"{digest}-full-{index}")
+        
+        # Keep where each field sits so one field can be re-OCR'd from a crop
+        result['regions'] = locate_fields(result, pages)
+        return result
+        
+    except Exception as e:
+        log.error("Error processing image with Mistral: %s", Redacted(e), exc_info=True)
+        current_context().raw_response = f"Error: {str(e)}"
+        raise
+
+@in_request_scope
+def process_image_url(image_url, system_prompt, priority='interactive', cache_key=None, api_key=None):
+    """Process an image that OCR fetches itself from a short-lived URL.
+
+    Used for direct-to-S3 uploads: the Lambda only forwards the URL, so the
+    tiling and progressive passes, which need the image bytes, are skipped.
+    """
+    try:
+        client = _get_client(api_key)
+        
+        pages = ocr_cache.get(cache_key, 'url') if cache_key else None
+        if pages is None:
+            log.info("Sending request to Mistral OCR API with uploaded image URL")
+            document = {"type": "image_url", "image_url": image_url}
+            pages = _retry_ocr(lambda attempt: _ocr_document(client, document, priority))
+            if cache_key:
+                ocr_cache.put(cache_key, 'url', pages)
+        
+        text = "\n\n".join(pages)
+        log.debug("Mistral OCR extracted text: %s", Redacted(text[:200]))
         
-        print(f"Mistral chat response (first 100 chars): {content[:100]}")
+        result, raw_response = _structure_receipt(client, text, system_prompt, priority)
+        current_context().raw_response = raw_response
         
-        # Use the parser from parse_response.py
-        return parse_raw_response(content)
+        result['regions'] = locate_fields(result, pages)
+        return result
         
     except Exception as e:
-        print(f"Error processing image with Mistral: {str(e)}")
-        LAST_RAW_RESPONSE = f"Error: {str(e)}"
+        log.error("Error processing image URL with Mistral: %s", Redacted(e), exc_info=True)
+        current_context().raw_response = f"Error: {str(e)}"
         raise
 
+@in_request_scope
+def reextract_field(image_base64, field, region, priority='interactive', api_key=None):
+    """Re-read a single field from a cropped, upscaled region of the receipt image.
+
+    `region` is the entry for `field` from a previous result's `regions`. Only
+    the crop is sent to OCR; without Pillow the whole image is sent instead.
+    """
+    client = _get_client(api_key)
+    try:
+        image_b64 = crop_region(decode_image_base64(image_base64), region)
+    except ImagingUnavailable as e:
+        log.warning("Cropping unavailable (%s), re-reading %s from the full image", e, field)
+        image_b64 = image_base64.split(",")[1] if image_base64.startswith("data:image") else image_base64
+    
+    log.info("Re-extracting %s from region of length: %d", field, len(image_b64))
+    text = "\n\n".join(_run_ocr(client, image_b64, priority))
+    return {
+        'field': field,
+        'value': read_field(field, text),
+        'bytes_sent': len(image_b64)
+    }
+
+def warm_up(api_key=None):
+    """Build the client and open the pooled TLS connection to the API host ahead of the first receipt.
+
+    Only sync calls reuse that connection. Async calls connect on their own
+    request's event loop and only save the SSL context loaded here.
+    """
+    client = _get_client(api_key)
+    client.models.list()
+
+def _get_client(api_key=None):
+    # The key is passed per call; the environment variable is only a fallback for local scripts
+    api_key = api_key or os.environ.get("MISTRAL_API_KEY")
+    
+    if not api_key:
+        raise ValueError("No Mistral API key given and MISTRAL_API_KEY environment variable not set")
+    
+    # OCR and chat calls go to the fastest healthy provider and fail over to the others
+    return FailoverClient(provider_pool, api_key, _shared_http_client())
+
+def _shared_http_client():
+    global _http_client
+    with _http_client_lock:
+        if _http_client is None:
+            _http_client = httpx.Client(verify=_shared_ssl_context())
+        return _http_client
+
+def _shared_ssl_context():
+    global _ssl_context
+    if _ssl_context is None:
+        _ssl_context = httpx.create_ssl_context()
+    return _ssl_context
+
+def _run_async(client, coro_fn):
+    """Run coro_fn(loop_client) in a new event loop and return its result.
+
+    Async connections belong to the loop that opened them, so each loop gets
+    its own AsyncClient, closed together with the loop.
+    """
+    async def run():
+        async with httpx.AsyncClient(verify=_shared_ssl_context()) as async_client:
+            try:
+                return await coro_fn(client.with_async_client(async_client))
+            finally:
+                client.pool.release(async_client)
+    return asyncio.run(run())
+
+@on_before_snapshot
+@on_after_restore
+def reset_http_client():
+    """Close pooled connections; the next request opens new ones."""
+    global _http_client
+    with _http_client_lock:
+        client, _http_client = _http_client, None
+    if client is not None:
+        client.close()
+
+def _run_ocr(client, image_b64, priority, key=None):
+    """OCR a base64 JPEG and return the markdown of each page.
+
+    The first attempt embeds the image; a retry uploads it once through the
+    files API and references it by URL, as does any later call for `key`.
+    """
+    def attempt_ocr(attempt):
+        nonlocal key
+        if attempt == 0 and key is None:
+            document = inline_document(image_b64)
+        else:
+            key = key or image_digest(image_b64)
+            document = image_handles.document(client, key, image_b64, upload=attempt > 0)
+        return _ocr_document(client, document, priority)
+    
+    return _retry_ocr(attempt_ocr)
+
+def _ocr_document(client, document, priority):
+    # Process with Mistral OCR - use "image_url" type for images
+    with timed('ocr'):
+        ocr_response = _run_stage(
+            'ocr',
+            priority,
+            client.ocr.process,
+            model="mistral-ocr-latest",
+            document=document
+        )
+    _record_ocr_usage(ocr_response, document)
+    return [page.markdown for page in ocr_response.pages]
+
+def _record_ocr_usage(ocr_response, document):
+    """Meter OCR pages and the bytes embedded in the request (none when OCR fetches a URL)."""
+    usage = getattr(ocr_response, 'usage_info', None)
+    pages = getattr(usage, 'pages_processed', None) or len(ocr_response.pages)
+    url = document.get("image_url", "")
+    _record_usage('ocr', "mistral-ocr-latest", ocr_pages=pages,
+                  bytes_uploaded=len(url) if url.startswith("data:") else 0)
+
+def _record_chat_usage(chat_response, stage, model):
+    usage = getattr(chat_response, 'usage', None)
+    if usage is not None:
+        _record_usage(stage, model,
+                      prompt_tokens=getattr(usage, 'prompt_tokens', 0) or 0,
+                      completion_tokens=getattr(usage, 'completion_tokens', 0) or 0)
+
+def _record_usage(stage, model, **counts):
+    """Add usage to the current request and to the per-user meter."""
+    context = current_context()
+    context.add_usage(**counts)
+    meter.record(context.user_id, stage, model, **counts)
+
+def _retry_ocr(attempt_ocr):
+    """Call attempt_ocr(attempt) until it succeeds or OCR_MAX_ATTEMPTS is reached."""
+    for attempt in range(OCR_MAX_ATTEMPTS):
+        try:
+            return attempt_ocr(attempt)
+        except Exception as e:
+            _check_retryable(attempt, e)
+
+async def _retry_ocr_async(attempt_ocr):
+    """Await attempt_ocr(attempt) until it succeeds or OCR_MAX_ATTEMPTS is reached."""
+    for attempt in range(OCR_MAX_ATTEMPTS):
+        try:
+            return await attempt_ocr(attempt)
+        except Exception as e:
+            _check_retryable(attempt, e)
+
+def _check_retryable(attempt, error):
+    """Re-raise an OCR error that another attempt would not fix; otherwise count the retry."""
+    # A rejected key is refreshed by the caller, not retried here
+    if isinstance(error, (PreemptedError, CircuitOpenError)) or attempt + 1 >= OCR_MAX_ATTEMPTS \
+            or is_auth_error(error):
+        raise error
+    log.warning("OCR attempt %d failed (%s), retrying", attempt + 1, type(error).__name__)
+    metrics.increment('ocr_retries')
+
+def _run_stage(stage, priority, fn, **request):
+    """Run one OCR or chat call through the scheduler, behind the stage's circuit breaker."""
+    breaker = _admit(stage)
+    try:
+        response = scheduler.run(priority, fn, **request)
+    except Exception as e:
+        _record_stage_error(breaker, e)
+        raise
+    breaker.record_success()
+    return response
+
+async def _run_stage_async(stage, priority, fn, **request):
+    breaker = _admit(stage)
+    try:
+        response = await scheduler.run_async(priority, fn, **request)
+    except Exception as e:
+        _record_stage_error(breaker, e)
+        raise
+    breaker.record_success()
+    return response
+
+def _admit(stage):
+    """Return the stage's breaker, or fail fast before queueing for a slot when it is open."""
+    breaker = STAGE_BREAKERS[stage]
+    if not breaker.allow():
+        metrics.increment(f"{stage}_fast_failures")
+        raise CircuitOpenError(stage, breaker.retry_after())
+    return breaker
+
+def _record_stage_error(breaker, error):
+    # Only outages count against the breaker; a 4xx still means the API answered
+    if isinstance(error, (PreemptedError, CircuitOpenError)):
+        return
+    if is_outage_error(error):
+        breaker.record_failure()
+    else:
+        breaker.record_success()
+
+def _ocr_pages(client, image_b64, digest, tier, tiles, priority):
+    """OCR an image at one resolution tier, reusing cached pages for the same source image."""
+    pages = ocr_cache.get(digest, tier)
+    if pages is not None:
+        log.info("OCR cache hit for %s resolution", tier)
+        metrics.increment('ocr_cache_hits')
+        return pages
+    metrics.increment('ocr_cache_misses')
+    if tiles:
+        log.info("Tiling tall receipt into %d strips", len(tiles))
+        pages = [_run_async(client, lambda loop_client: _run_tiled_ocr(loop_client, tiles, f"{digest}-{tier}", priority))]
+    else:
+        pages = _run_ocr(client, image_b64, priority, key=f"{digest}-{tier}")
+    ocr_cache.put(digest, tier, pages)
+    return pages
+
+def _prepare_passes(image_b64):
+    """Decode the image once and return its strips and its reduced-resolution copy.
+
+    Strips are None unless the receipt is tall enough to tile; the reduced
+    copy is None when the image is already small. Tiled receipts need every
+    pixel of width, so they skip the low-resolution pass. Without Pillow,
+    or for formats it cannot read, the image is OCR'd whole as sent.
+    """
+    if not (TILED_OCR or PROGRESSIVE_OCR):
+        return None, None
+    try:
+        image = open_image(decode_image_base64(image_b64))
+        tiles = split_tall_image(image) if TILED_OCR else None
+        low_b64 = downscale(image, max_side=PROGRESSIVE_MAX_SIDE) if PROGRESSIVE_OCR and not tiles else None
+    except ImagingUnavailable:
+        metrics.increment('imaging_unavailable')
+        return None, None
+    return tiles, low_b64
+
+async def _run_tiled_ocr(client, tiles, key, priority):
+    """OCR all strips concurrently and stitch their markdown into a single page."""
+    started = time.monotonic()
+    pages = await asyncio.gather(*(
+        _ocr_tile(client, tile, f"{key}-{index}", priority) for index, tile in enumerate(tiles)
+    ))
+    current_context().add_timing('ocr', time.monotonic() - started)
+    return stitch_markdown(pages)
+
+async def _ocr_tile(client, tile_b64, key, priority):
+    """OCR one strip, retried like a whole image: a retry uploads the strip and references it by URL."""
+    async def attempt_ocr(attempt):
+        if attempt == 0:
+            document = image_handles.document(client, key, tile_b64)
+        else:
+            document = await asyncio.to_thread(image_handles.document, client, key, tile_b64, upload=True)
+        response = await _run_stage_async(
+            'ocr',
+            priority,
+            client.ocr.process_async,
+            model="mistral-ocr-latest",
+            document=document
+        )
+        _record_ocr_usage(response, document)
+        return "\n\n".join(page.markdown for page in response.pages)
+    
+    return await _retry_ocr_async(attempt_ocr)
+
+def _structure_receipt(client, text, system_prompt, priority, low_res=False):
+    """Turn OCR text into a structured receipt; returns the receipt and the raw model output.
+
+    Receipts matching a known merchant layout, and clean tabular receipts that
+    reconcile, are extracted locally without relying on the chat model, which
+    is otherwise picked by the model router from the size of the OCR text.
+    Interactive uploads start the chat call alongside the local extractors and
+    cancel it when the local result reconciles; other priorities try the local
+    extractors first and only then call the model.
+    
+    Text from a low-resolution pass only gets the local extractors and the
+    small model. Unless low_res_sufficient() accepts that result, it is
+    returned as-is for the caller to retry at full resolution, without
+    escalation or follow-up; it never teaches the layout index.
+    """
+    ocr_done = time.monotonic()
+    
+    # Strip layout noise and boilerplate before it reaches the prompt
+    prompt_text, compaction = compact_markdown(text)
+    log.debug("Compacted OCR text: %d -> %d tokens (%d saved)",
+              compaction['tokens_before'], compaction['tokens_after'], compaction['tokens_saved'])
+    
+    # Route small, simple receipts to a faster model; escalate if its output doesn't validate
+    # Table and tax-line structure is measured on the raw markdown, size on the compacted prompt
+    features = measure_ocr_text(text)
+    features['chars'] = compaction['chars_after']
+    route = router.choose_route(features)
+    
+    # Users close to their spending budget stay on the cheaper model with no large-model calls
+    downgraded = current_context().downgraded
+    if downgraded or low_res:
+        route = 'small'
+    
+    if priority == 'interactive' and SPECULATIVE_EXTRACTION:
+        # Race the local extractors against the chat call; a reconciled local result wins
+        winner, (layout_key, local_result), chat_response = _run_async(client, lambda loop_client: race_local_and_model(
+            _run_stage_async('chat', priority, loop_client.chat.complete_async, **_chat_request(prompt_text, system_prompt, route)),
+            lambda: _extract_locally(text),
+            lambda output: output[1] is not None and not reconciliation_issues(output[1])
+        ))
+        if winner == 'local':
+            log.info("Local extraction won the race, chat call cancelled")
+            return local_result, json.dumps(local_result)
+        log.info("Routed receipt to %s (%d lines, %d chars)", MODEL_ROUTES[route], features['lines'], features['chars'])
+        content, result, issues = _finish_structuring(chat_response, route, time.monotonic() - ocr_done)
+    else:
+        # Receipts matching a known layout, or clean tables that reconcile, skip the chat call
+        layout_key, local_result = _extract_locally(text)
+        if local_result is not None:
+            log.info("Local extraction succeeded, skipping chat call")
+            return local_result, json.dumps(local_result)
+        log.info("Routing receipt to %s (%d lines, %d chars)", MODEL_ROUTES[route], features['lines'], features['chars'])
+        content, result, issues = _structure_text(client, prompt_text, system_prompt, route, priority)
+    
+    # Only an accepted tier is worth refining; a rejected low-resolution result is redone at full resolution
+    if low_res and not low_res_sufficient(result):
+        return result, content
+    
+    if issues and route != 'large' and not downgraded:
+        log.info("Escalating to %s after validation issues: %s", MODEL_ROUTES['large'], ', '.join(issues))
+        content, result, issues = _structure_text(client, prompt_text, system_prompt, 'large', priority)
+    
+    # Fix what still doesn't add up with a narrow follow-up on the OCR text we already have
+    inconsistencies = find_inconsistencies(result, prompt_text)
+    if inconsistencies and not downgraded:
+        result = _targeted_followup(client, result, inconsistencies, prompt_text, priority)
+        issues = validate_receipt(result)
+    
+    # Verified model output teaches the index this layout for next time; low-resolution text is not trusted to
+    if not issues and not low_res:
+        layout_index.learn(layout_key, text, result)
+    
+    log.debug("Mistral chat response: %s", Redacted(content[:100]))
+    return result, content
+
+def _extract_locally(text):
+    """Try the layout index, then the table extractor.
+
+    Returns the layout fingerprint and the local result, or None when neither
+    extractor produced a result that validates.
+    """
+    with timed('local_extraction'):
+        return _run_local_extractors(text)
+
+def _run_local_extractors(text):
+    layout_key, template_result = layout_index.extract(text)
+    if template_result is not None:
+        log.info("Matched known receipt layout %s", layout_key)
+        return layout_key, normalize_receipt(template_result)
+    
+    start = time.monotonic()
+    local_result, confidence = extract_receipt(text)
+    hit = confidence >= MIN_CONFIDENCE
+    extractor_stats.record_attempt(hit, time.monotonic() - start)
+    if hit:
+        log.info("Local table extraction reconciled (confidence %.2f)", confidence)
+        return layout_key, normalize_receipt(local_result)
+    return layout_key, None
+
+def _chat_request(text, system_prompt, route):
+    """Build the chat completion arguments for structuring OCR text on a route."""
+    return {
+        "model": MODEL_ROUTES[route],
+        "messages": [
+            {"role": "system", "content": system_prompt},
+            {"role": "user", "content": f"Here is the OCR text from a receipt:\n\n{text}\n\nPlease extract and structure this data as JSON."}
+        ],
+        "temperature": 0.0
+    }
+
+def _structure_text(client, text, system_prompt, route, priority):
+    """Structure OCR text with the chat model for a route.
+
+    Returns the raw model output, the parsed receipt and its validation issues.
+    """
+    start = time.monotonic()
+    chat_response = _run_stage('chat', priority, client.chat.complete, **_chat_request(text, system_prompt, route))
+    return _finish_structuring(chat_response, route, time.monotonic() - start)
+
+def _finish_structuring(chat_response, route, latency):
+    """Parse and validate a chat response, recording route and latency statistics."""
+    content = chat_response.choices[0].message.content
+    extractor_stats.record_chat_latency(latency)
+    current_context().add_timing('chat', latency)
+    _record_chat_usage(chat_response, 'structure', MODEL_ROUTES[route])
+    
+    # Use the parser from parse_response.py
+    with timed('parse'):
+        result = parse_raw_response(content)
+        issues = validate_receipt(result)
+    router.record(route, latency, valid=not issues, escalated=bool(issues) and route != 'large')
+    return content, result, issues
+
+def _targeted_followup(client, result, inconsistencies, text, priority):
+    """Ask the large model only for the disputed fields and merge its answer back in.
+
+    The merged receipt is kept only if it has fewer inconsistencies than before.
+    """
+    log.info("Requesting targeted re-extraction for: %s", ', '.join(inconsistencies))
+    with timed('chat'):
+        chat_response = _run_stage(
+            'chat',
+            priority,
+            client.chat.complete,
+            model=MODEL_ROUTES['large'],
+            messages=[{"role": "user", "content": build_followup_prompt(result, inconsistencies, text)}],
+            response_format={"type": "json_object"},
+            temperature=0.0
+        )
+    _record_chat_usage(chat_response, 'followup', MODEL_ROUTES['large'])
+    followup = parse_raw_response(chat_response.choices[0].message.content)
+    
+    merged = merge_followup(result, followup)
+    remaining = find_inconsistencies(merged, text)
+    reconcile_stats.record(inconsistencies, remaining)
+    return merged if len(remaining) < len(inconsistencies) else result
+
 def get_last_raw_response():
-    """Return the last raw response from Mistral API."""
-    global LAST_RAW_RESPONSE
-    return LAST_RAW_RESPONSE
+    """Return the raw model output of the most recently recorded request."""
+    latest = raw_responses.latest()
+    return latest['raw_response'] if latest else ""
@@ -0,0 +1,103 @@
+import os
+import re
+import threading
+
+from metrics import metrics
+
+# Chat models available to the router, cheapest first
+MODEL_ROUTES = {
+    'small': 'mistral-small-latest',
+    'large': 'mistral-large-latest'
+}
+
+TABLE_ROW = re.compile(r'^\s*\|.*\|\s*$')
+TABLE_SEPARATOR = re.compile(r'^\s*\|?\s*:?-{3,}')
+TAX_LINE = re.compile(r'\b(gst|vat|tax|hst|pst)\b', re.IGNORECASE)
+
+
+def measure_ocr_text(text):
+    """Measure the OCR text features the router decides on."""
+    lines = [line for line in text.splitlines() if line.strip()]
+    return {
+        'chars': len(text),
+        'lines': len(lines),
+        'tables': sum(1 for line in lines if TABLE_SEPARATOR.match(line)),
+        'table_rows': sum(1 for line in lines if TABLE_ROW.match(line)),
+        'tax_lines': sum(1 for line in lines if TAX_LINE.search(line))
+    }
+
+
+class ModelRouter:
+    """
+    Picks the chat model for a receipt from the size and complexity of its OCR text.
+
+    Short, simple receipts go to the small model; anything long, with several
+    tables or several tax lines goes to the large model. Latency, validation
+    outcome and escalation counters are kept per route so the thresholds can
+    be tuned from production data.
+    """
+
+    def __init__(self, small_max_chars=1500, small_max_lines=40, small_max_tables=1, small_max_tax_lines=1):
+        self.small_max_chars = small_max_chars
+        self.small_max_lines = small_max_lines
+        self.small_max_tables = small_max_tables
+        self.small_max_tax_lines = small_max_tax_lines
+        self._lock = threading.Lock()
+        self._stats = {route: self._empty_stats() for route in MODEL_ROUTES}
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'calls': 0,
+            'latency_total': 0.0,
+            'validated': 0,
+            'failed_validation': 0,
+            'escalated': 0
+        }
+
+    def choose_route(self, features):
+        """Return the route name ('small' or 'large') for the measured OCR features."""
+        if (features['chars'] <= self.small_max_chars
+                and features['lines'] <= self.small_max_lines
+                and features['tables'] <= self.small_max_tables
+                and features['tax_lines'] <= self.small_max_tax_lines):
+            return 'small'
+        return 'large'
+
+    def record(self, route, latency, valid, escalated=False):
+        """Record one structuring call made on a route."""
+        with self._lock:
+            stats = self._stats[route]
+            stats['calls'] += 1
+            stats['latency_total'] += latency
+            stats['validated' if valid else 'failed_validation'] += 1
+            if escalated:
+                stats['escalated'] += 1
+        metrics.increment(f"route_{route}_calls")
+        metrics.observe(f"route_{route}_ms", latency * 1000)
+        if not valid:
+            metrics.increment(f"route_{route}_failed_validation")
+        if escalated:
+            metrics.increment(f"route_{route}_escalated")
+
+    def metrics(self):
+        """Return per-route call counts, mean latency and validation pass rate."""
+        with self._lock:
+            snapshot = {}
+            for route, stats in self._stats.items():
+                calls = stats['calls']
+                snapshot[route] = {
+                    'model': MODEL_ROUTES[route],
+                    'calls': calls,
+                    'avg_latency_ms': round(stats['latency_total'] / calls * 1000, 2) if calls else 0.0,
+                    'validation_pass_rate': round(stats['validated'] / calls, 4) if calls else 0.0,
+                    'escalated': stats['escalated']
+                }
+            return snapshot
+
+
+# Shared router; thresholds can be tuned per environment
+router = ModelRouter(
+    small_max_chars=int(os.environ.get('ROUTER_SMALL_MAX_CHARS', '1500')),
+    small_max_lines=int(os.environ.get('ROUTER_SMALL_MAX_LINES', '40'))
+)
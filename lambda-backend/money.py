@@ -0,0 +1,137 @@
+import os
+import re
+from decimal import Decimal, InvalidOperation, ROUND_HALF_UP
+
+# Currency assumed when a receipt only shows a bare "$" or no symbol at all
+DEFAULT_CURRENCY = os.environ.get('DEFAULT_CURRENCY', 'AUD')
+
+# Prefixed symbols are checked before bare ones so "NZ$" wins over "$"
+CURRENCY_SYMBOLS = [
+    ('A$', 'AUD'),
+    ('AU$', 'AUD'),
+    ('NZ$', 'NZD'),
+    ('US$', 'USD'),
+    ('C$', 'CAD'),
+    ('S$', 'SGD'),
+    ('€', 'EUR'),
+    ('£', 'GBP'),
+    ('¥', 'JPY'),
+    ('₹', 'INR'),
+]
+CURRENCY_CODES = ('AUD', 'NZD', 'USD', 'CAD', 'SGD', 'EUR', 'GBP', 'JPY', 'INR', 'CHF')
+CURRENCY_CODE = re.compile(r'\b(' + '|'.join(CURRENCY_CODES) + r')\b', re.IGNORECASE)
+
+# Digits after the decimal point in each currency's minor unit
+MINOR_UNIT_DIGITS = {'JPY': 0}
+
+# One number: digits in thousands groups ("1.234", "1 234") or plain, then an optional one- or
+# two-digit decimal part with the other separator; percentages like "10%" are not amounts
+NUMBER = re.compile(r"(?<![\d.,'])(\d{1,3}(?:([.,' ])\d{3})+(?:(?!\2)[.,]\d{1,2})?|\d+(?:[.,]\d{1,2})?)(?![.,']?\d|\s?%)")
+
+
+def parse_decimal(value):
+    """
+    Parse a free-form amount like "$12.34", "AUD 5,00" or "1.234,50" into a Decimal.
+
+    A separator followed by three-digit groups is a thousands separator, one
+    followed by one or two final digits the decimal point. Returns None when
+    no number is found, or when the string holds several ("12.34 1.12",
+    "2 x 3.50") and picking one would be a guess.
+    """
+    if isinstance(value, bool) or value is None:
+        return None
+    if isinstance(value, (int, float)):
+        return Decimal(str(value))
+
+    raw = str(value).strip()
+    matches = list(NUMBER.finditer(raw))
+    if len(matches) != 1:
+        return None
+    match = matches[0]
+    number = match.group(1)
+    if match.group(2):
+        number = number.replace(match.group(2), '')
+    number = number.replace(',', '.')
+
+    # "-$5.00", "$-5.00" and "5.00-" mark refunds and discounts on many receipts
+    if raw.startswith('-') or raw.endswith('-') or raw[:match.start()].endswith('-'):
+        number = '-' + number
+
+    try:
+        return Decimal(number)
+    except InvalidOperation:
+        return None
+
+
+def detect_currency(value):
+    """Return the ISO currency code written in a money string, or None."""
+    if not isinstance(value, str):
+        return None
+    code = CURRENCY_CODE.search(value)
+    if code:
+        return code.group(1).upper()
+    for symbol, currency in CURRENCY_SYMBOLS:
+        if symbol in value:
+            return currency
+    return None
+
+
+def to_minor_units(amount, currency):
+    """Convert a Decimal amount to integer minor units (cents) of a currency."""
+    exponent = Decimal(1).scaleb(MINOR_UNIT_DIGITS.get(currency, 2))
+    return int((amount * exponent).quantize(Decimal(1), rounding=ROUND_HALF_UP))
+
+
+def normalize_amount(value, currency=None):
+    """Normalize one money value to {'raw', 'minor', 'currency'}; minor is None when unparseable."""
+    currency = detect_currency(value) or currency or DEFAULT_CURRENCY
+    amount = parse_decimal(value)
+    return {
+        'raw': value,
+        'minor': to_minor_units(amount, currency) if amount is not None else None,
+        'currency': currency
+    }
+
+
+def normalize_quantity(value):
+    """Normalize a quantity like "2", "1.5 kg" or 3 to a number, defaulting to 1."""
+    quantity = parse_decimal(value)
+    if quantity is None or quantity <= 0:
+        return 1
+    return int(quantity) if quantity == quantity.to_integral_value() else float(quantity)
+
+
+def normalize_receipt(result, default_currency=None):
+    """
+    Add a `normalized` block with integer minor units to a structured receipt.
+
+    The receipt currency is the first explicit code or symbol found on the
+    total, tax or item prices, so a bare "$" on line items inherits "AUD 12.00"
+    from the total. All items are converted in the same pass; the raw strings
+    are left untouched.
+    """
+    if not isinstance(result, dict):
+        return result
+
+    items = [item for item in result.get('items') or [] if isinstance(item, dict)]
+    candidates = [result.get('total'), result.get('tax')]
+    for item in items:
+        candidates.extend((item.get('total_price'), item.get('unit_price')))
+
+    currency = next(filter(None, map(detect_currency, candidates)), None) or default_currency or DEFAULT_CURRENCY
+    minor = lambda value: normalize_amount(value, currency)['minor'] if value not in (None, '') else None
+
+    result['normalized'] = {
+        'currency': currency,
+        'total': minor(result.get('total')),
+        'tax': minor(result.get('tax')),
+        'items': [
+            {
+                'qty': normalize_quantity(item.get('qty')),
+                'unit_price': minor(item.get('unit_price')),
+                'total_price': minor(item.get('total_price'))
+            }
+            for item in items
+        ]
+    }
+    return result
@@ -0,0 +1,44 @@
+import hashlib
+import os
+import threading
+from collections import OrderedDict
+
+
+def image_digest(image_b64):
+    """Stable cache key for a base64 image."""
+    return hashlib.sha256(image_b64.encode('ascii')).hexdigest()
+
+
+class OcrCache:
+    """LRU cache of OCR page markdown keyed by image digest and resolution tier."""
+
+    def __init__(self, capacity=64):
+        self.capacity = capacity
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def get(self, digest, tier):
+        with self._lock:
+            pages = self._entries.get((digest, tier))
+            if pages is None:
+                self.misses += 1
+                return None
+            self._entries.move_to_end((digest, tier))
+            self.hits += 1
+            return pages
+
+    def put(self, digest, tier, pages):
+        with self._lock:
+            self._entries[(digest, tier)] = pages
+            self._entries.move_to_end((digest, tier))
+            while len(self._entries) > self.capacity:
+                self._entries.popitem(last=False)
+
+    def metrics(self):
+        with self._lock:
+            return {'entries': len(self._entries), 'hits': self.hits, 'misses': self.misses}
+
+
+ocr_cache = OcrCache(capacity=int(os.environ.get('OCR_CACHE_SIZE', '64')))
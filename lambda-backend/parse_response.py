@@ -3,6 +3,7 @@ import json
 import requests
 import sys
 import re
+from money import normalize_receipt
 
 def parse_raw_response(text: str) -> dict:
     """
@@ -12,10 +13,12 @@ def parse_raw_response(text: str) -> dict:
         text (str): The raw response string from GPT-4o.
         
     Returns:
-        dict: Parsed dictionary with receipt data.
+        dict: Parsed dictionary with receipt data. Monetary values are kept as
+        returned and also carried as integer minor units plus an ISO currency
+        code under the "normalized" key.
     """
     if not text or text.strip() == "":
-        return {"merchant": "", "address": "", "date": "", "total": "", "items": []}
+        return normalize_receipt({"merchant": "", "address": "", "date": "", "total": "", "items": []})
     
     # Step 1: Clean up the text
     # Remove markdown code blocks
@@ -33,10 +36,12 @@ def parse_raw_response(text: str) -> dict:
     # Step 2: Try to parse as valid JSON
     try:
         parsed = json.loads(cleaned)
-        return parsed
     except json.JSONDecodeError:
         # If parsing fails, extract fields using regex
-        return extract_fields_with_regex(cleaned)
+        parsed = extract_fields_with_regex(cleaned)
+    
+    # Step 3: Add normalized money and quantity values
+    return normalize_receipt(parsed)
 
 def extract_fields_with_regex(text: str) -> dict:
     """Extract receipt fields using regex patterns."""
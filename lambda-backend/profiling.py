@@ -0,0 +1,160 @@
+import cProfile
+import hashlib
+import hmac
+import io
+import os
+import pstats
+import random
+import sys
+import threading
+import time
+import tracemalloc
+from collections import Counter
+
+from log import get_logger
+
+log = get_logger(__name__)
+
+# Share of invocations profiled without being asked to (0 disables)
+PROFILE_SAMPLE_RATE = float(os.environ.get('PROFILE_SAMPLE_RATE', '0'))
+
+# Key for the X-Profile header; without it, header-triggered profiling is disabled
+PROFILE_SECRET = os.environ.get('PROFILE_SECRET', '')
+
+# Signed profile requests are accepted for this many seconds after their timestamp
+PROFILE_TOKEN_MAX_AGE = 300
+
+PROFILE_DIR = os.environ.get('PROFILE_DIR', '/tmp')
+
+# Interval of the wall-clock stack sampler
+SAMPLE_INTERVAL = 0.005
+
+# Collapsed stacks and functions attached to a response, heaviest first
+MAX_STACKS = 100
+MAX_FUNCTIONS = 25
+
+
+def sign_profile_request(timestamp, secret=PROFILE_SECRET):
+    """Header value asking for a profile: `<unix timestamp>:<hex HMAC-SHA256 of the timestamp>`."""
+    signature = hmac.new(secret.encode('utf-8'), str(timestamp).encode('utf-8'), hashlib.sha256).hexdigest()
+    return f"{timestamp}:{signature}"
+
+
+def profile_requested(headers, now=None):
+    """Return True if the request carries a valid, fresh X-Profile header."""
+    if not PROFILE_SECRET:
+        return False
+    token = next((value for name, value in (headers or {}).items() if name.lower() == 'x-profile'), '')
+    timestamp, _, _ = token.partition(':')
+    if not timestamp.isdigit() or abs((now or time.time()) - int(timestamp)) > PROFILE_TOKEN_MAX_AGE:
+        return False
+    return hmac.compare_digest(token, sign_profile_request(timestamp, PROFILE_SECRET))
+
+
+def profile_sampled():
+    return PROFILE_SAMPLE_RATE > 0 and random.random() < PROFILE_SAMPLE_RATE
+
+
+class StackSampler:
+    """
+    Samples the stacks of every thread on a wall-clock timer.
+
+    cProfile only sees the thread it runs in and counts CPU-bound calls, so
+    this sampler covers the worker threads and the time spent waiting on the
+    network. Stacks are counted in collapsed form (`outer;inner;leaf`), ready
+    for flamegraph tools.
+    """
+
+    def __init__(self, interval=SAMPLE_INTERVAL):
+        self.interval = interval
+        self.stacks = Counter()
+        self._stop = threading.Event()
+        self._thread = threading.Thread(target=self._run, daemon=True, name='profile-sampler')
+
+    def start(self):
+        self._thread.start()
+
+    def stop(self):
+        self._stop.set()
+        self._thread.join()
+
+    def _run(self):
+        own = threading.get_ident()
+        while not self._stop.wait(self.interval):
+            for thread_id, frame in sys._current_frames().items():
+                if thread_id == own:
+                    continue
+                names = []
+                while frame is not None:
+                    code = frame.f_code
+                    names.append(f"{os.path.basename(code.co_filename)}:{code.co_name}")
+                    frame = frame.f_back
+                self.stacks[';'.join(reversed(names))] += 1
+
+
+class InvocationProfile:
+    """
+    Profiles one invocation: CPU and wall time, tracemalloc peak memory,
+    cProfile statistics and wall-clock stack samples.
+
+    The pstats file is written to PROFILE_DIR; `summary()` returns a compact
+    form that can be attached to a debug response.
+    """
+
+    def __init__(self, request_id):
+        self.request_id = request_id
+        self.profiler = cProfile.Profile()
+        self.sampler = StackSampler()
+        self.result = None
+
+    def __enter__(self):
+        self._started_tracing = not tracemalloc.is_tracing()
+        if self._started_tracing:
+            tracemalloc.start()
+        tracemalloc.reset_peak()
+        self.sampler.start()
+        self._wall = time.perf_counter()
+        self._cpu = time.process_time()
+        self.profiler.enable()
+        return self
+
+    def __exit__(self, exc_type, exc, tb):
+        self.profiler.disable()
+        wall_ms = (time.perf_counter() - self._wall) * 1000
+        cpu_ms = (time.process_time() - self._cpu) * 1000
+        self.sampler.stop()
+        _, peak = tracemalloc.get_traced_memory()
+        if self._started_tracing:
+            tracemalloc.stop()
+
+        path = os.path.join(PROFILE_DIR, f"profile-{self.request_id}.pstats")
+        try:
+            self.profiler.dump_stats(path)
+        except OSError as e:
+            log.warning("Could not write profile to %s: %s", path, e)
+            path = None
+
+        self.result = {
+            'request_id': self.request_id,
+            'wall_ms': round(wall_ms, 2),
+            'cpu_ms': round(cpu_ms, 2),
+            'peak_memory_bytes': peak,
+            'pstats_path': path
+        }
+        log.info("Profiled invocation", extra={'fields': {'profile': self.result}})
+        return False
+
+    def summary(self):
+        """Timing totals plus the heaviest functions and collapsed stacks."""
+        output = io.StringIO()
+        stats = pstats.Stats(self.profiler, stream=output)
+        functions = sorted(stats.stats.items(), key=lambda item: item[1][3], reverse=True)[:MAX_FUNCTIONS]
+        return dict(self.result, functions=[
+            {
+                'function': f"{os.path.basename(filename)}:{line}:{name}",
+                'calls': calls,
+                'own_ms': round(own * 1000, 3),
+                'cumulative_ms': round(cumulative * 1000, 3)
+            }
+            for (filename, line, name), (_, calls, own, cumulative, _) in functions
+        ], stacks=[f"{stack} {count}" for stack, count in self.sampler.stacks.most_common(MAX_STACKS)])
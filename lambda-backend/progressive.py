@@ -0,0 +1,62 @@
+import threading
+
+from metrics import metrics
+from validation import validate_receipt
+
+# Fields that must be present before a low-resolution pass is accepted
+KEY_FIELDS = ('merchant', 'date', 'total')
+
+
+def low_res_sufficient(result):
+    """Return True if a result from the reduced-resolution pass can be returned as-is."""
+    return not validate_receipt(result) and all(result.get(field) for field in KEY_FIELDS)
+
+
+class ProgressiveStats:
+    """Share of receipts finished at each resolution tier and the bytes and latency saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.finished = {'low': 0, 'full': 0}
+        self.bytes_saved = 0
+        self.latency_saved = 0.0
+        self._full_latency_ewma = None
+
+    def record_low(self, full_bytes, low_bytes, elapsed):
+        """A receipt finished on the reduced pass."""
+        with self._lock:
+            self.finished['low'] += 1
+            self.bytes_saved += full_bytes - low_bytes
+            if self._full_latency_ewma is not None:
+                self.latency_saved += self._full_latency_ewma - elapsed
+        metrics.increment('progressive_finished_low')
+        metrics.observe('progressive_bytes_saved', full_bytes - low_bytes, unit='Bytes')
+
+    def record_full(self, low_bytes, full_elapsed, wasted_elapsed=0.0):
+        """A receipt needed the full-resolution pass; a failed reduced pass costs bytes and time."""
+        metrics.increment('progressive_finished_full')
+        if low_bytes:
+            metrics.observe('progressive_bytes_wasted', low_bytes, unit='Bytes')
+            metrics.observe('progressive_wasted_ms', wasted_elapsed * 1000)
+        with self._lock:
+            self.finished['full'] += 1
+            self.bytes_saved -= low_bytes
+            self.latency_saved -= wasted_elapsed
+            if self._full_latency_ewma is None:
+                self._full_latency_ewma = full_elapsed
+            else:
+                self._full_latency_ewma = 0.8 * self._full_latency_ewma + 0.2 * full_elapsed
+
+    def metrics(self):
+        with self._lock:
+            total = sum(self.finished.values())
+            return {
+                'finished_low': self.finished['low'],
+                'finished_full': self.finished['full'],
+                'low_share': round(self.finished['low'] / total, 4) if total else 0.0,
+                'bytes_saved': self.bytes_saved,
+                'latency_saved_ms': round(self.latency_saved * 1000, 2)
+            }
+
+
+stats = ProgressiveStats()
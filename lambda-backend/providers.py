@@ -0,0 +1,387 @@
+import asyncio
+import importlib.util
+import json
+import os
+import random
+import threading
+import time
+from functools import partial
+from types import SimpleNamespace
+
+from circuit_breaker import OPEN, CircuitBreaker, CircuitOpenError, is_outage_error
+from secret_provider import EnvSecretBackend, is_auth_error
+from metrics import metrics
+from log import get_logger
+
+log = get_logger(__name__)
+
+# Failover order; providers without configuration are skipped
+PROVIDERS = [name.strip() for name in os.environ.get('PROVIDERS', 'mistral,azure,gcp').split(',') if name.strip()]
+
+# Azure AI Foundry deployment, keyed by AZURE_MISTRAL_API_KEY (or AZURE_MISTRAL_API_KEY_FILE)
+AZURE_ENDPOINT = os.environ.get('AZURE_MISTRAL_ENDPOINT')
+
+# Vertex AI project; needs google-auth, which is not bundled
+GCP_PROJECT_ID = os.environ.get('GCP_PROJECT_ID')
+GCP_REGION = os.environ.get('GCP_REGION', 'europe-west4')
+
+# Azure and Vertex name models differently; a model missing from a map is not served by that provider
+AZURE_MODELS = json.loads(os.environ.get('AZURE_MISTRAL_MODELS') or json.dumps({
+    'mistral-ocr-latest': 'mistral-document-ai-2505',
+    'mistral-small-latest': 'mistral-small-2503',
+    'mistral-large-latest': 'mistral-large-2411'
+}))
+GCP_MODELS = json.loads(os.environ.get('GCP_MISTRAL_MODELS') or json.dumps({
+    'mistral-small-latest': 'mistral-small-2503',
+    'mistral-large-latest': 'mistral-large-2411'
+}))
+
+# Local fake providers replacing the real ones, e.g. {"primary": {"latency": 2, "failure_rate": 0.5}, "backup": {}}
+FAKE_PROVIDERS = os.environ.get('FAKE_PROVIDERS')
+
+# Weight of the newest call in the moving averages of latency and error rate
+HEALTH_EWMA_ALPHA = 0.2
+
+
+class Provider:
+    """
+    One API serving Mistral models.
+
+    `factory(api_key, http_client, async_client)` builds its SDK client;
+    `api_key` is the per-request Mistral key and only used by providers with
+    `uses_request_key`, `async_client` is None outside an event loop.
+    `models` maps Mistral model names to the provider's names, or is None
+    when the provider serves them under the same names.
+    """
+
+    def __init__(self, name, factory, models=None, uses_request_key=False):
+        self.name = name
+        self.factory = factory
+        self.models = models
+        self.uses_request_key = uses_request_key
+
+    def serves(self, model):
+        return self.models is None or model in self.models
+
+    def request(self, request):
+        """Translate a request to the provider's model name."""
+        if self.models is None:
+            return request
+        return dict(request, model=self.models[request['model']])
+
+
+class ProviderHealth:
+    """Moving averages of one provider's latency and error rate for one operation, plus its breaker."""
+
+    def __init__(self, name, alpha=HEALTH_EWMA_ALPHA):
+        self.alpha = alpha
+        self.breaker = CircuitBreaker(name)
+        self._lock = threading.Lock()
+        self.latency = None
+        self.error_rate = 0.0
+        self.calls = 0
+        self.failures = 0
+
+    def record_success(self, latency):
+        with self._lock:
+            self.calls += 1
+            self.latency = latency if self.latency is None else self.alpha * latency + (1 - self.alpha) * self.latency
+            self.error_rate *= 1 - self.alpha
+        self.breaker.record_success()
+
+    def record_failure(self):
+        with self._lock:
+            self.calls += 1
+            self.failures += 1
+            self.error_rate = self.alpha + (1 - self.alpha) * self.error_rate
+        self.breaker.record_failure()
+
+    def score(self):
+        """Expected seconds per successful call; untried providers score 0 so each gets tried once."""
+        with self._lock:
+            if self.latency is None:
+                return float('inf') if self.failures else 0.0
+            return self.latency / max(1 - self.error_rate, 0.05)
+
+    def metrics(self):
+        with self._lock:
+            summary = {
+                'latency_ms': round(self.latency * 1000, 2) if self.latency is not None else None,
+                'error_rate': round(self.error_rate, 4),
+                'calls': self.calls,
+                'failures': self.failures
+            }
+        return summary | self.breaker.metrics()
+
+
+class ProviderPool:
+    """
+    Routes OCR and chat calls to the fastest healthy provider.
+
+    Providers are ranked per operation by expected latency; those with an
+    open breaker are skipped. Both operations are idempotent reads, so a
+    call that fails with an outage (no response, 429 or 5xx) fails over to
+    the next provider within the same request. Any other error, such as a
+    bad request or the request's key being rejected, would fail the same way
+    everywhere and is raised straight away.
+    """
+
+    def __init__(self, providers):
+        self.providers = providers
+        self._lock = threading.Lock()
+        self._health = {}
+        self._clients = {}
+
+    def health(self, provider, operation):
+        with self._lock:
+            key = (provider.name, operation)
+            if key not in self._health:
+                self._health[key] = ProviderHealth(f"{provider.name}.{operation}")
+            return self._health[key]
+
+    def client(self, provider, api_key, http_client, async_client=None):
+        """Build a provider's SDK client, reusing it until the key or HTTP client changes.
+
+        An async HTTP client only works on the event loop that opened its
+        connections, so each one gets its own SDK clients, kept until
+        release() is called when that loop ends.
+        """
+        api_key = api_key if provider.uses_request_key else None
+        key = (provider.name, async_client)
+        with self._lock:
+            cached = self._clients.get(key)
+            if cached and cached[0] == api_key and cached[1] is http_client:
+                return cached[2]
+        client = provider.factory(api_key, http_client, async_client)
+        with self._lock:
+            self._clients[key] = (api_key, http_client, client)
+        return client
+
+    def release(self, async_client):
+        """Drop the SDK clients built around an async HTTP client whose event loop has ended."""
+        with self._lock:
+            for key in [key for key in self._clients if key[1] is async_client]:
+                del self._clients[key]
+
+    def ranked(self, operation, model):
+        """Providers serving `model` whose breaker is not open, fastest first."""
+        candidates = []
+        for index, provider in enumerate(self.providers):
+            health = self.health(provider, operation)
+            if provider.serves(model) and health.breaker.state != OPEN:
+                candidates.append((health.score(), index, provider, health))
+        return [(provider, health) for _, _, provider, health in sorted(candidates, key=lambda c: c[:2])]
+
+    def call(self, operation, method, api_key, http_client, request):
+        last_error = None
+        for provider, health in self.ranked(operation, request['model']):
+            if not health.breaker.allow():
+                continue
+            started = time.monotonic()
+            try:
+                call = getattr(getattr(self.client(provider, api_key, http_client), operation), method)
+                response = call(**provider.request(request))
+            except Exception as e:
+                last_error = self._failed(provider, health, operation, e)
+                continue
+            self._succeeded(provider, health, operation, time.monotonic() - started, last_error)
+            return response
+        raise last_error or self._unavailable(operation, request['model'])
+
+    async def call_async(self, operation, method, api_key, http_client, request, async_client=None):
+        last_error = None
+        for provider, health in self.ranked(operation, request['model']):
+            if not health.breaker.allow():
+                continue
+            started = time.monotonic()
+            try:
+                call = getattr(getattr(self.client(provider, api_key, http_client, async_client), operation), method)
+                response = await call(**provider.request(request))
+            except Exception as e:
+                last_error = self._failed(provider, health, operation, e)
+                continue
+            self._succeeded(provider, health, operation, time.monotonic() - started, last_error)
+            return response
+        raise last_error or self._unavailable(operation, request['model'])
+
+    def _succeeded(self, provider, health, operation, latency, previous_error):
+        health.record_success(latency)
+        metrics.observe(f"provider_{provider.name}_{operation}_ms", latency * 1000)
+        if previous_error is not None:
+            metrics.increment('provider_failovers')
+
+    def _failed(self, provider, health, operation, error):
+        # A provider rejecting its own credentials is down for us; the request's key being rejected is not
+        if not is_outage_error(error) and (provider.uses_request_key or not is_auth_error(error)):
+            # The provider answered, so a half-open breaker's trial call still succeeded
+            health.breaker.record_success()
+            raise error
+        health.record_failure()
+        metrics.increment(f"provider_{provider.name}_{operation}_errors")
+        log.warning("%s %s call failed (%s)", provider.name, operation, type(error).__name__)
+        return error
+
+    def _unavailable(self, operation, model):
+        """Error for a call no provider could take, because every breaker is open or none serves the model."""
+        retry_after = [self.health(p, operation).breaker.retry_after() for p in self.providers if p.serves(model)]
+        if not retry_after:
+            return ValueError(f"No configured provider serves {model}")
+        return CircuitOpenError(f"{operation} providers", min(retry_after))
+
+    def metrics(self):
+        with self._lock:
+            health = dict(self._health)
+        return {f"{name}.{operation}": h.metrics() for (name, operation), h in sorted(health.items())}
+
+
+class FailoverClient:
+    """
+    Stands in for a Mistral SDK client: `ocr` and `chat` calls go through the
+    provider pool, anything else (files, models) to the first provider.
+    Async calls need `async_client`, an AsyncClient owned by the running
+    event loop; see with_async_client().
+    """
+
+    def __init__(self, pool, api_key, http_client, async_client=None):
+        self.pool = pool
+        self.api_key = api_key
+        self.http_client = http_client
+        self.async_client = async_client
+        self.ocr = SimpleNamespace(
+            process=partial(self._call, 'ocr', 'process'),
+            process_async=partial(self._call_async, 'ocr', 'process_async')
+        )
+        self.chat = SimpleNamespace(
+            complete=partial(self._call, 'chat', 'complete'),
+            complete_async=partial(self._call_async, 'chat', 'complete_async')
+        )
+
+    def _call(self, operation, method, **request):
+        return self.pool.call(operation, method, self.api_key, self.http_client, request)
+
+    def _call_async(self, operation, method, **request):
+        return self.pool.call_async(operation, method, self.api_key, self.http_client, request, self.async_client)
+
+    def with_async_client(self, async_client):
+        """A copy of this client whose async calls go through `async_client`."""
+        return FailoverClient(self.pool, self.api_key, self.http_client, async_client)
+
+    def __getattr__(self, name):
+        primary = self.pool.providers[0]
+        return getattr(self.pool.client(primary, self.api_key, self.http_client), name)
+
+
+class FakeProviderError(Exception):
+    """Failure raised by a fake provider; carries a status code like the SDK errors."""
+
+    def __init__(self, provider, status_code=503):
+        super().__init__(f"{provider} unavailable")
+        self.status_code = status_code
+
+
+class FakeProviderClient:
+    """
+    Local provider for failover tests: answers OCR and chat calls after
+    `latency` seconds and fails a `failure_rate` share of them. Attributes
+    can be changed while running, e.g. to take a provider down.
+    """
+
+    def __init__(self, name, latency=0.05, failure_rate=0.0, markdown='TOTAL 0.00', content='{}'):
+        self.name = name
+        self.latency = latency
+        self.failure_rate = failure_rate
+        self.markdown = markdown
+        self.content = content
+        self.calls = 0
+        self.ocr = SimpleNamespace(process=self._ocr, process_async=self._ocr_async)
+        self.chat = SimpleNamespace(complete=self._chat, complete_async=self._chat_async)
+
+    def _respond(self):
+        self.calls += 1
+        if random.random() < self.failure_rate:
+            raise FakeProviderError(self.name)
+
+    def _ocr_response(self):
+        self._respond()
+        return SimpleNamespace(pages=[SimpleNamespace(markdown=self.markdown)],
+                               usage_info=SimpleNamespace(pages_processed=1))
+
+    def _chat_response(self):
+        self._respond()
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=self.content))],
+                               usage=SimpleNamespace(prompt_tokens=0, completion_tokens=0))
+
+    def _ocr(self, **request):
+        time.sleep(self.latency)
+        return self._ocr_response()
+
+    async def _ocr_async(self, **request):
+        await asyncio.sleep(self.latency)
+        return self._ocr_response()
+
+    def _chat(self, **request):
+        time.sleep(self.latency)
+        return self._chat_response()
+
+    async def _chat_async(self, **request):
+        await asyncio.sleep(self.latency)
+        return self._chat_response()
+
+
+def fake_provider(name, **behaviour):
+    """A Provider backed by a single FakeProviderClient, reachable as `provider.fake`."""
+    client = FakeProviderClient(name, **behaviour)
+    provider = Provider(name, lambda api_key, http_client, async_client: client)
+    provider.fake = client
+    return provider
+
+
+# Each SDK is only imported once its provider is first called
+def _mistral_client(api_key, http_client, async_client):
+    from mistralai import Mistral
+    return Mistral(api_key=api_key, client=http_client, async_client=async_client)
+
+
+def _azure_client(api_key, http_client, async_client):
+    from mistralai_azure import MistralAzure
+    return MistralAzure(azure_api_key=EnvSecretBackend('AZURE_MISTRAL_API_KEY').fetch(),
+                        azure_endpoint=AZURE_ENDPOINT, client=http_client, async_client=async_client)
+
+
+def _gcp_client(api_key, http_client, async_client):
+    from mistralai_gcp import MistralGoogleCloud
+    return MistralGoogleCloud(region=GCP_REGION, project_id=GCP_PROJECT_ID, client=http_client,
+                              async_client=async_client)
+
+
+def configured_providers():
+    """Providers named in PROVIDERS that have their configuration, or the FAKE_PROVIDERS set."""
+    if FAKE_PROVIDERS:
+        return [fake_provider(name, **behaviour) for name, behaviour in json.loads(FAKE_PROVIDERS).items()]
+
+    providers = []
+    for name in PROVIDERS:
+        if name == 'mistral':
+            providers.append(Provider('mistral', _mistral_client, uses_request_key=True))
+        elif name == 'azure' and AZURE_ENDPOINT:
+            providers.append(Provider('azure', _azure_client, AZURE_MODELS))
+        elif name == 'gcp' and GCP_PROJECT_ID:
+            if not _google_auth_installed():
+                log.warning("GCP_PROJECT_ID is set but google-auth is not installed, skipping the gcp provider")
+            else:
+                providers.append(Provider('gcp', _gcp_client, GCP_MODELS))
+        elif name not in ('azure', 'gcp'):
+            raise ValueError(f"Unknown provider in PROVIDERS: {name}")
+    if not providers:
+        raise ValueError("PROVIDERS names no configured provider")
+    return providers
+
+
+def _google_auth_installed():
+    try:
+        return importlib.util.find_spec('google.auth') is not None
+    except ModuleNotFoundError:
+        return False
+
+
+provider_pool = ProviderPool(configured_providers())
@@ -0,0 +1,228 @@
+import json
+import os
+import threading
+import uuid
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor
+
+import boto3
+
+from request_context import request_scope
+from log import Redacted, get_logger
+
+log = get_logger(__name__)
+
+# Number of records from one batch processed at the same time
+QUEUE_WORKER_CONCURRENCY = int(os.environ.get('QUEUE_WORKER_CONCURRENCY', '4'))
+
+# SQS rejects message bodies above 256 KiB
+SQS_MAX_MESSAGE_BYTES = 256 * 1024
+
+# SQS caps the delivery delay of a message at 15 minutes
+SQS_MAX_DELAY_SECONDS = 900
+
+
+class InvalidMessage(ValueError):
+    """A queue message that can never be processed; it is acknowledged with a failed result instead of redelivered."""
+
+
+def is_queue_event(event):
+    """Return True if the event is an SQS-style batch of records."""
+    records = event.get('Records')
+    return isinstance(records, list) and all(
+        record.get('eventSource') == 'aws:sqs' for record in records
+    )
+
+
+class InMemoryResultStore:
+    """Result store that keeps processed receipts in memory (local runs and tests)."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._results = {}
+
+    def put(self, receipt_id, result, owner='anonymous'):
+        with self._lock:
+            self._results[receipt_id] = (owner, result)
+
+    def get(self, receipt_id, owner='anonymous'):
+        """Return the stored result, or None when there is none or it belongs to another user."""
+        with self._lock:
+            stored_owner, result = self._results.get(receipt_id, (None, None))
+        return result if stored_owner == owner else None
+
+
+class S3ResultStore:
+    """Result store that writes each processed receipt as a JSON object in S3."""
+
+    def __init__(self, bucket, prefix='results/', s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._owns_client = s3_client is None
+        self.s3_client = s3_client or boto3.client('s3', region_name='ap-southeast-2')
+
+    def reconnect(self):
+        """Build a new client, e.g. after a snapshot restore; an injected client is kept."""
+        if self._owns_client:
+            self.s3_client = boto3.client('s3', region_name='ap-southeast-2')
+
+    def put(self, receipt_id, result, owner='anonymous'):
+        self.s3_client.put_object(
+            Bucket=self.bucket,
+            Key=f"{self.prefix}{receipt_id}.json",
+            Body=json.dumps(result).encode('utf-8'),
+            ContentType='application/json',
+            Metadata={'owner': owner}
+        )
+
+    def get(self, receipt_id, owner='anonymous'):
+        """Return the stored result, or None when there is none or it belongs to another user."""
+        try:
+            response = self.s3_client.get_object(Bucket=self.bucket, Key=f"{self.prefix}{receipt_id}.json")
+        except self.s3_client.exceptions.NoSuchKey:
+            return None
+        if response.get('Metadata', {}).get('owner', 'anonymous') != owner:
+            return None
+        return json.loads(response['Body'].read())
+
+
+def default_result_store():
+    """Use S3 when RESULT_BUCKET is configured, otherwise keep results in memory."""
+    bucket = os.environ.get('RESULT_BUCKET')
+    if bucket:
+        return S3ResultStore(bucket)
+    return InMemoryResultStore()
+
+
+class InMemoryQueue:
+    """
+    Local stand-in for an SQS queue feeding lambda_handler.
+
+    Messages are delivered in batches shaped like the Lambda SQS event. After the
+    handler runs, pass its response to `complete()`: successful messages are
+    deleted and the ones listed in `batchItemFailures` become visible again.
+    """
+
+    def __init__(self):
+        self._visible = deque()
+        self._in_flight = {}
+        self._receive_counts = {}
+
+    def send_message(self, body, delay_seconds=0):
+        # Delivery delays are not simulated
+        message_id = str(uuid.uuid4())
+        self._visible.append((message_id, json.dumps(body)))
+        self._receive_counts[message_id] = 0
+        return message_id
+
+    def __len__(self):
+        return len(self._visible) + len(self._in_flight)
+
+    def receive_batch(self, max_messages=10):
+        records = []
+        while self._visible and len(records) < max_messages:
+            message_id, body = self._visible.popleft()
+            self._in_flight[message_id] = body
+            self._receive_counts[message_id] += 1
+            records.append({
+                'messageId': message_id,
+                'receiptHandle': f"{message_id}-{self._receive_counts[message_id]}",
+                'body': body,
+                'attributes': {'ApproximateReceiveCount': str(self._receive_counts[message_id])},
+                'eventSource': 'aws:sqs'
+            })
+        return {'Records': records}
+
+    def complete(self, event, response):
+        failed = {item['itemIdentifier'] for item in response.get('batchItemFailures', [])}
+        for record in event['Records']:
+            message_id = record['messageId']
+            body = self._in_flight.pop(message_id)
+            if message_id in failed:
+                self._visible.append((message_id, body))
+
+
+class SqsQueue:
+    """Sends receipts to the SQS queue that feeds lambda_handler's queue mode."""
+
+    def __init__(self, queue_url, sqs_client=None):
+        self.queue_url = queue_url
+        self._owns_client = sqs_client is None
+        self.sqs_client = sqs_client or boto3.client('sqs', region_name='ap-southeast-2')
+
+    def reconnect(self):
+        """Build a new client, e.g. after a snapshot restore; an injected client is kept."""
+        if self._owns_client:
+            self.sqs_client = boto3.client('sqs', region_name='ap-southeast-2')
+
+    def send_message(self, body, delay_seconds=0):
+        response = self.sqs_client.send_message(
+            QueueUrl=self.queue_url,
+            MessageBody=json.dumps(body),
+            DelaySeconds=min(int(delay_seconds), SQS_MAX_DELAY_SECONDS)
+        )
+        return response['MessageId']
+
+
+def default_receipt_queue():
+    """
+    The queue named by RECEIPT_QUEUE_URL, or None when receipts cannot be deferred.
+
+    A deferred receipt's result is only reachable by the client through an
+    S3 result store, so RESULT_BUCKET must be set as well.
+    """
+    queue_url = os.environ.get('RECEIPT_QUEUE_URL')
+    if not queue_url:
+        return None
+    if not os.environ.get('RESULT_BUCKET'):
+        log.warning("RECEIPT_QUEUE_URL is set without RESULT_BUCKET, receipts will not be deferred")
+        return None
+    return SqsQueue(queue_url)
+
+
+def process_queue_event(event, process_receipt, result_store, max_workers=QUEUE_WORKER_CONCURRENCY):
+    """
+    Process every record of a queue batch concurrently.
+
+    `process_receipt(request_data)` returns the structured receipt for one
+    message body. Results are written to the result store under the message's
+    `receipt_id` (falling back to its messageId), owned by the message's
+    `user_id` so only that user can look them up. Failed records are reported
+    as partial batch failures so only they are redelivered. Malformed bodies
+    and InvalidMessage errors would fail on every delivery, so they are
+    acknowledged and stored as `{"error": ...}` results instead.
+    """
+    records = event['Records']
+
+    def handle(record):
+        receipt_id = record['messageId']
+        owner = 'anonymous'
+        try:
+            request_data = json.loads(record['body'])
+            if not isinstance(request_data, dict):
+                raise InvalidMessage('Message body must be a JSON object')
+            receipt_id = request_data.get('receipt_id') or receipt_id
+            owner = request_data.get('user_id') or owner
+            # Worker threads don't inherit the caller's context, so each record is its own request
+            with request_scope(record['messageId']):
+                result = process_receipt(request_data)
+        except (json.JSONDecodeError, InvalidMessage) as e:
+            log.warning("Discarding invalid queue message %s: %s", record['messageId'], e)
+            result_store.put(receipt_id, {'error': str(e)}, owner)
+            return
+        result_store.put(receipt_id, result, owner)
+
+    failures = []
+    if not records:
+        return {'batchItemFailures': failures}
+
+    with ThreadPoolExecutor(max_workers=min(max_workers, len(records))) as executor:
+        futures = [(record, executor.submit(handle, record)) for record in records]
+        for record, future in futures:
+            try:
+                future.result()
+            except Exception as e:
+                log.error("Error processing queued receipt %s: %s", record['messageId'], Redacted(e))
+                failures.append({'itemIdentifier': record['messageId']})
+
+    return {'batchItemFailures': failures}
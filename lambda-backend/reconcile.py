@@ -0,0 +1,149 @@
+import json
+import re
+import threading
+from datetime import datetime
+
+from metrics import metrics
+from money import normalize_receipt
+from table_extractor import AMOUNT, TAX_LINE
+from validation import validate_receipt
+
+# Headers like "TAX INVOICE ABN 12 345 678 901" name the tax without being a tax line
+NOT_TAX_LINE = re.compile(r'\btax\s+invoice\b|\b(abn|acn|(gst|vat|tax)\s*(id|reg\w*|no\b\.?|number|#))', re.IGNORECASE)
+
+# What to ask for, per inconsistency, in the follow-up prompt
+FIELD_REQUESTS = {
+    'missing_total': '"total": the final amount paid, with currency symbol',
+    'missing_tax': '"tax": the GST, VAT or sales tax amount, with currency symbol',
+    'invalid_date': '"date": the receipt date in YYYY-MM-DD format',
+    'missing_items': '"items": every purchased line item as {"name", "qty", "unit_price", "total_price"}',
+    'items_do_not_sum_to_total': '"missing_items": line items on the receipt that are absent from the current '
+                                 'extraction, as {"name", "qty", "unit_price", "total_price"}, and "total": the '
+                                 'final amount paid',
+    'item_without_price': '"prices": an object mapping each current item name that has no price to its '
+                          'total price with currency symbol'
+}
+
+FOLLOWUP_PROMPT = """A receipt was extracted from OCR text but the extraction is inconsistent: {issues}.
+
+Using only the OCR text below, return a JSON object with exactly these keys:
+{requests}
+
+Do not repeat fields that are not requested. Use empty strings or empty lists when the value is not on the receipt.
+
+Current extraction:
+{current}
+
+OCR text:
+{text}"""
+
+
+def find_inconsistencies(result, text):
+    """Return the issues of a structured receipt that a targeted follow-up can fix."""
+    issues = validate_receipt(result)
+    if issues == ['not_an_object']:
+        return issues
+
+    if not result.get('tax') and has_tax_line(text):
+        issues.append('missing_tax')
+
+    if result.get('date'):
+        try:
+            datetime.strptime(result['date'], '%Y-%m-%d')
+        except (TypeError, ValueError):
+            issues.append('invalid_date')
+
+    return [issue for issue in issues if issue in FIELD_REQUESTS]
+
+
+def has_tax_line(text):
+    """Return True if a line of the OCR text names a tax and carries a money amount."""
+    return any(
+        TAX_LINE.search(line) and AMOUNT.search(line) and not NOT_TAX_LINE.search(line)
+        for line in text.splitlines()
+    )
+
+
+def build_followup_prompt(result, issues, text):
+    """Build a narrow prompt asking only for the disputed fields or missing items."""
+    current = {
+        'total': result.get('total', ''),
+        'tax': result.get('tax', ''),
+        'date': result.get('date', ''),
+        'items': [
+            {'name': item.get('name', ''), 'total_price': item.get('total_price', '')}
+            for item in result.get('items') or [] if isinstance(item, dict)
+        ]
+    }
+    return FOLLOWUP_PROMPT.format(
+        issues=', '.join(issue.replace('_', ' ') for issue in issues),
+        requests='\n'.join(f"- {FIELD_REQUESTS[issue]}" for issue in issues),
+        current=json.dumps(current, indent=2),
+        text=text
+    )
+
+
+def merge_followup(result, followup):
+    """Merge a follow-up answer into a copy of the receipt and re-normalize it."""
+    merged = dict(result)
+    merged['items'] = [dict(item) for item in result.get('items') or [] if isinstance(item, dict)]
+    if not isinstance(followup, dict):
+        return merged
+
+    for field in ('total', 'tax', 'date'):
+        if followup.get(field):
+            merged[field] = followup[field]
+
+    if followup.get('items') and not merged['items']:
+        merged['items'] = [item for item in followup['items'] if isinstance(item, dict)]
+
+    known = {item.get('name') for item in merged['items']}
+    for item in followup.get('missing_items') or []:
+        if isinstance(item, dict) and item.get('name') not in known:
+            merged['items'].append(item)
+            known.add(item.get('name'))
+
+    prices = followup.get('prices') or {}
+    if isinstance(prices, dict):
+        for item in merged['items']:
+            if not item.get('total_price') and prices.get(item.get('name')):
+                item['total_price'] = prices[item['name']]
+                item.setdefault('unit_price', prices[item['name']])
+
+    return normalize_receipt(merged)
+
+
+class ReconciliationStats:
+    """Counts targeted follow-ups and the full reruns they avoided."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.followups = 0
+        self.resolved = 0
+        self.improved = 0
+
+    def record(self, issues_before, issues_after):
+        with self._lock:
+            self.followups += 1
+            if not issues_after:
+                self.resolved += 1
+            elif len(issues_after) < len(issues_before):
+                self.improved += 1
+        metrics.increment('followups')
+        if not issues_after:
+            metrics.increment('followups_resolved')
+        elif len(issues_after) < len(issues_before):
+            metrics.increment('followups_improved')
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'followups': self.followups,
+                'resolved': self.resolved,
+                'improved': self.improved,
+                # A resolved receipt would otherwise have been re-uploaded for full OCR + chat
+                'full_reruns_avoided': self.resolved
+            }
+
+
+stats = ReconciliationStats()
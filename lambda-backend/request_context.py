@@ -0,0 +1,151 @@
+import contextvars
+import functools
+import itertools
+import os
+import random
+import time
+import uuid
+from contextlib import contextmanager
+
+from metrics import metrics
+
+# Share of finished requests whose raw model output is kept for inspection; errors are always kept
+RAW_RESPONSE_SAMPLE_RATE = float(os.environ.get('RAW_RESPONSE_SAMPLE_RATE', '1.0'))
+RAW_RESPONSE_BUFFER_SIZE = int(os.environ.get('RAW_RESPONSE_BUFFER_SIZE', '32'))
+
+
+class RequestContext:
+    """Per-request state: id, user, raw model output, stage timings and token usage."""
+
+    def __init__(self, request_id=None, user_id=None):
+        self.request_id = request_id or str(uuid.uuid4())
+        self.user_id = user_id or 'anonymous'
+        # Set when the user is over the budget's downgrade threshold (see metering)
+        self.downgraded = False
+        self.started = time.time()
+        self.raw_response = ""
+        self.error = None
+        # Set by the handler from the response (e.g. 'client_error'); defaults to success or error
+        self.outcome = None
+        self.timings = {}
+        self.usage = {}
+
+    def add_timing(self, stage, seconds):
+        """Add time spent in a stage; repeated stages (e.g. escalations) accumulate."""
+        self.timings[stage] = self.timings.get(stage, 0.0) + seconds
+
+    def add_usage(self, **counts):
+        for name, count in counts.items():
+            if count:
+                self.usage[name] = self.usage.get(name, 0) + count
+
+    def to_dict(self):
+        return {
+            'request_id': self.request_id,
+            'user_id': self.user_id,
+            'started': self.started,
+            'raw_response': self.raw_response,
+            'error': self.error,
+            'outcome': self.outcome,
+            'timings_ms': {stage: round(seconds * 1000, 2) for stage, seconds in self.timings.items()},
+            'usage': dict(self.usage)
+        }
+
+
+_current = contextvars.ContextVar('request_context', default=None)
+
+
+def active_context():
+    """Return the context of the request being processed, or None outside a request scope."""
+    return _current.get()
+
+
+def current_context():
+    """
+    Return the context of the request being processed.
+
+    Outside a request scope this returns a detached context, so callers can
+    record into it unconditionally.
+    """
+    return _current.get() or RequestContext()
+
+
+@contextmanager
+def request_scope(request_id=None, user_id=None):
+    """
+    Run a block as one request, or join the request that is already active.
+
+    asyncio tasks and asyncio.to_thread copy the context, so stages they run
+    record into the same request. Plain thread pools do not: each queued
+    record opens its own scope. The outermost scope adds the finished
+    request to `raw_responses` and its timings to `metrics`.
+    """
+    context = _current.get()
+    token = None
+    if context is None:
+        context = RequestContext(request_id, user_id)
+        token = _current.set(context)
+    try:
+        yield context
+    except Exception as e:
+        context.error = str(e)
+        raise
+    finally:
+        if token is not None:
+            _current.reset(token)
+            context.outcome = context.outcome or ('error' if context.error else 'success')
+            raw_responses.record(context)
+            metrics.record_request(context, context.outcome)
+
+
+def in_request_scope(fn):
+    """Decorator running fn inside request_scope(), joining the caller's request if there is one."""
+    @functools.wraps(fn)
+    def wrapper(*args, **kwargs):
+        with request_scope():
+            return fn(*args, **kwargs)
+    return wrapper
+
+
+@contextmanager
+def timed(stage):
+    """Record the duration of a block as a stage timing of the current request."""
+    start = time.monotonic()
+    try:
+        yield
+    finally:
+        current_context().add_timing(stage, time.monotonic() - start)
+
+
+class RawResponseBuffer:
+    """
+    Bounded, sampled ring buffer of recently finished requests.
+
+    Writers claim a slot from an atomic counter and readers copy the slot
+    list, so neither takes a lock; a reader may see a slot from just before
+    or just after a concurrent write, which is fine for debugging.
+    """
+
+    def __init__(self, capacity=RAW_RESPONSE_BUFFER_SIZE, sample_rate=RAW_RESPONSE_SAMPLE_RATE):
+        self.capacity = capacity
+        self.sample_rate = sample_rate
+        self._slots = [None] * capacity
+        self._sequence = itertools.count()
+
+    def record(self, context):
+        if context.error is None and random.random() >= self.sample_rate:
+            return
+        sequence = next(self._sequence)
+        self._slots[sequence % self.capacity] = (sequence, context.to_dict())
+
+    def recent(self, limit=None):
+        """Return recorded requests, newest first."""
+        entries = sorted((slot for slot in list(self._slots) if slot is not None), key=lambda slot: slot[0], reverse=True)
+        return [entry for _, entry in entries[:limit]]
+
+    def latest(self):
+        entries = self.recent(1)
+        return entries[0] if entries else None
+
+
+raw_responses = RawResponseBuffer()
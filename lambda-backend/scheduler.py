@@ -0,0 +1,195 @@
+import asyncio
+import os
+import threading
+import time
+from collections import deque
+
+from metrics import metrics
+
+# Priority classes, highest first
+PRIORITY_CLASSES = ('interactive', 'batch', 'background')
+
+# Relative share of dispatch slots each class receives when all are backlogged
+DEFAULT_WEIGHTS = {
+    'interactive': 8,
+    'batch': 2,
+    'background': 1
+}
+
+
+class PreemptedError(Exception):
+    """Raised when queued work is dropped to make room for higher-priority work."""
+
+
+class _Ticket:
+    """A unit of queued work waiting for a dispatch slot."""
+
+    def __init__(self, priority, finish_tag):
+        self.priority = priority
+        self.finish_tag = finish_tag
+        self.enqueued_at = time.monotonic()
+        self.granted = False
+        self.preempted = False
+
+
+class PriorityScheduler:
+    """
+    Weighted fair queuing gate in front of the Mistral OCR and chat calls.
+
+    Callers run their work through `run()`, which blocks until a dispatch slot
+    is free and it is the caller's turn. Each class gets slots in proportion to
+    its weight, so a large batch import cannot starve interactive uploads.
+    When the queue is full, the newest queued ticket of the lowest class below
+    the newcomer is preempted. Work that is already in flight is never touched.
+    """
+
+    def __init__(self, max_concurrency=4, max_queue_depth=64, weights=None):
+        self.max_concurrency = max_concurrency
+        self.max_queue_depth = max_queue_depth
+        self.weights = dict(weights or DEFAULT_WEIGHTS)
+        self._cond = threading.Condition()
+        self._queues = {cls: deque() for cls in PRIORITY_CLASSES}
+        self._last_finish = {cls: 0.0 for cls in PRIORITY_CLASSES}
+        self._virtual_time = 0.0
+        self._in_flight = {cls: 0 for cls in PRIORITY_CLASSES}
+        self._stats = {cls: self._empty_stats() for cls in PRIORITY_CLASSES}
+
+    @staticmethod
+    def _empty_stats():
+        return {
+            'submitted': 0,
+            'completed': 0,
+            'preempted': 0,
+            'wait_total': 0.0,
+            'wait_max': 0.0
+        }
+
+    def run(self, priority, fn, *args, **kwargs):
+        """Run fn(*args, **kwargs) once the scheduler grants a slot to this priority class."""
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        ticket = self._acquire(priority)
+        try:
+            return fn(*args, **kwargs)
+        finally:
+            self._release(ticket)
+
+    async def run_async(self, priority, coro_fn, *args, **kwargs):
+        """Await coro_fn(*args, **kwargs) once the scheduler grants a slot to this priority class.
+
+        Cancelling the caller while it is still queued gives the slot back as
+        soon as it is granted, so abandoned work never leaks a slot.
+        """
+        if priority not in self._queues:
+            raise ValueError(f"Unknown priority class: {priority}")
+
+        acquiring = asyncio.ensure_future(asyncio.to_thread(self._acquire, priority))
+        try:
+            ticket = await asyncio.shield(acquiring)
+        except asyncio.CancelledError:
+            acquiring.add_done_callback(
+                lambda f: self._release(f.result()) if not f.cancelled() and f.exception() is None else None
+            )
+            raise
+        try:
+            return await coro_fn(*args, **kwargs)
+        finally:
+            self._release(ticket)
+
+    def _acquire(self, priority):
+        with self._cond:
+            self._stats[priority]['submitted'] += 1
+            if self._queued_count() >= self.max_queue_depth and not self._preempt_below(priority):
+                self._stats[priority]['preempted'] += 1
+                metrics.increment(f"scheduler_{priority}_preempted")
+                raise PreemptedError(f"Scheduler queue is full ({self.max_queue_depth} queued)")
+
+            start = max(self._virtual_time, self._last_finish[priority])
+            ticket = _Ticket(priority, start + 1.0 / self.weights[priority])
+            self._last_finish[priority] = ticket.finish_tag
+            self._queues[priority].append(ticket)
+            self._dispatch()
+            while not ticket.granted and not ticket.preempted:
+                self._cond.wait()
+
+            if ticket.preempted:
+                raise PreemptedError(f"Queued {priority} work preempted by higher-priority work")
+
+            waited = time.monotonic() - ticket.enqueued_at
+            stats = self._stats[priority]
+            stats['wait_total'] += waited
+            stats['wait_max'] = max(stats['wait_max'], waited)
+            metrics.observe(f"scheduler_{priority}_wait_ms", waited * 1000)
+            return ticket
+
+    def _release(self, ticket):
+        with self._cond:
+            self._in_flight[ticket.priority] -= 1
+            self._stats[ticket.priority]['completed'] += 1
+            self._dispatch()
+
+    def _queued_count(self):
+        return sum(len(queue) for queue in self._queues.values())
+
+    def _preempt_below(self, priority):
+        """Drop the newest queued ticket from the lowest class ranked below priority."""
+        rank = PRIORITY_CLASSES.index(priority)
+        for cls in reversed(PRIORITY_CLASSES[rank + 1:]):
+            if self._queues[cls]:
+                victim = self._queues[cls].pop()
+                victim.preempted = True
+                self._stats[cls]['preempted'] += 1
+                metrics.increment(f"scheduler_{cls}_preempted")
+                self._cond.notify_all()
+                return True
+        return False
+
+    def _dispatch(self):
+        """Grant free slots to queue heads in order of their virtual finish tag."""
+        granted = False
+        while sum(self._in_flight.values()) < self.max_concurrency:
+            heads = [queue[0] for queue in self._queues.values() if queue]
+            if not heads:
+                break
+            ticket = min(heads, key=lambda t: t.finish_tag)
+            self._queues[ticket.priority].popleft()
+            self._virtual_time = max(self._virtual_time, ticket.finish_tag - 1.0 / self.weights[ticket.priority])
+            self._in_flight[ticket.priority] += 1
+            ticket.granted = True
+            granted = True
+        if granted:
+            self._cond.notify_all()
+
+    def load(self):
+        """Return the current queue depth and in-flight count per priority class."""
+        with self._cond:
+            return {
+                cls: {'queue_depth': len(self._queues[cls]), 'in_flight': self._in_flight[cls]}
+                for cls in PRIORITY_CLASSES
+            }
+
+    def metrics(self):
+        """Return queue depth, in-flight count and wait-time statistics per priority class."""
+        with self._cond:
+            snapshot = {}
+            for cls in PRIORITY_CLASSES:
+                stats = self._stats[cls]
+                dispatched = stats['submitted'] - stats['preempted'] - len(self._queues[cls])
+                snapshot[cls] = {
+                    'queue_depth': len(self._queues[cls]),
+                    'in_flight': self._in_flight[cls],
+                    'submitted': stats['submitted'],
+                    'completed': stats['completed'],
+                    'preempted': stats['preempted'],
+                    'avg_wait_ms': round(stats['wait_total'] / dispatched * 1000, 2) if dispatched > 0 else 0.0,
+                    'max_wait_ms': round(stats['wait_max'] * 1000, 2)
+                }
+            return snapshot
+
+
+# Shared scheduler for every Mistral call made from this container
+scheduler = PriorityScheduler(
+    max_concurrency=int(os.environ.get('MISTRAL_MAX_CONCURRENCY', '4')),
+    max_queue_depth=int(os.environ.get('MISTRAL_MAX_QUEUE_DEPTH', '64'))
+)
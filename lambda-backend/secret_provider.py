@@ -0,0 +1,201 @@
+import json
+import os
+import threading
+import time
+import urllib.parse
+import urllib.request
+
+import boto3
+
+from log import get_logger
+from metrics import metrics
+
+log = get_logger(__name__)
+
+# How long a fetched secret is served before it must be fetched again
+SECRET_TTL = int(os.environ.get('SECRET_TTL', '300'))
+
+# Fraction of the TTL after which a background refresh starts while the cached value is still served
+REFRESH_AHEAD = 0.8
+
+# Default port of the AWS Parameters and Secrets Lambda extension
+EXTENSION_PORT = int(os.environ.get('PARAMETERS_SECRETS_EXTENSION_HTTP_PORT', '2773'))
+
+
+def _api_key_from_secret_string(secret_string):
+    """Secrets are stored as {"api_key": "..."}; a bare string is used as-is."""
+    try:
+        secret = json.loads(secret_string)
+    except json.JSONDecodeError:
+        return secret_string.strip()
+    return secret['api_key'] if isinstance(secret, dict) else str(secret)
+
+
+class BotoSecretsBackend:
+    """Reads the secret straight from Secrets Manager with boto3."""
+
+    def __init__(self, secret_id, client=None):
+        self.secret_id = secret_id
+        self._owns_client = client is None
+        self.client = client or boto3.client('secretsmanager', region_name='ap-southeast-2')
+
+    def reconnect(self):
+        """Build a new client, e.g. after a snapshot restore; an injected client is kept."""
+        if self._owns_client:
+            self.client = boto3.client('secretsmanager', region_name='ap-southeast-2')
+
+    def fetch(self):
+        response = self.client.get_secret_value(SecretId=self.secret_id)
+        return _api_key_from_secret_string(response['SecretString'])
+
+
+class ExtensionSecretsBackend:
+    """
+    Reads the secret through the Parameters and Secrets Lambda extension.
+
+    The extension caches secrets on localhost, so a fetch is a loopback HTTP
+    call instead of a Secrets Manager API call.
+    """
+
+    def __init__(self, secret_id, port=EXTENSION_PORT, timeout=2.0):
+        self.secret_id = secret_id
+        self.url = f"http://localhost:{port}/secretsmanager/get?secretId={urllib.parse.quote(secret_id)}"
+        self.timeout = timeout
+
+    def fetch(self):
+        request = urllib.request.Request(
+            self.url,
+            headers={'X-Aws-Parameters-Secrets-Token': os.environ.get('AWS_SESSION_TOKEN', '')}
+        )
+        with urllib.request.urlopen(request, timeout=self.timeout) as response:
+            payload = json.loads(response.read())
+        return _api_key_from_secret_string(payload['SecretString'])
+
+
+class EnvSecretBackend:
+    """Reads the secret from an environment variable or the file named by `<name>_FILE` (local runs and tests)."""
+
+    def __init__(self, name='MISTRAL_API_KEY'):
+        self.name = name
+
+    def fetch(self):
+        value = os.environ.get(self.name)
+        path = os.environ.get(f"{self.name}_FILE")
+        if not value and path:
+            with open(path) as f:
+                value = f.read().strip()
+        if not value:
+            raise ValueError(f"{self.name} environment variable not set")
+        return value
+
+
+class SecretProvider:
+    """
+    Caches a secret from a backend for `ttl` seconds.
+
+    Once `REFRESH_AHEAD` of the TTL has passed, the cached value keeps being
+    served while a background thread fetches a fresh one, so requests only
+    wait on a fetch for the very first call or after a long idle period.
+    `get(force_refresh=True)` re-fetches synchronously, for use after the
+    API rejects the cached key.
+    """
+
+    def __init__(self, backend, ttl=SECRET_TTL):
+        self.backend = backend
+        self.ttl = ttl
+        self._lock = threading.Lock()
+        self._fetch_lock = threading.Lock()
+        self._value = None
+        self._fetched_at = 0.0
+        self._refreshing = False
+        self.hits = 0
+        self.fetches = 0
+        self.background_refreshes = 0
+        self.forced_refreshes = 0
+        self.failures = 0
+
+    def get(self, force_refresh=False):
+        with self._lock:
+            age = time.time() - self._fetched_at
+            if self._value is not None and not force_refresh and age < self.ttl:
+                self.hits += 1
+                if age >= self.ttl * REFRESH_AHEAD and not self._refreshing:
+                    self._refreshing = True
+                    threading.Thread(target=self._background_refresh, daemon=True).start()
+                return self._value
+            if force_refresh:
+                self.forced_refreshes += 1
+                metrics.increment('secret_forced_refreshes')
+            fetched_at = self._fetched_at
+        return self._fetch(fetched_at)
+
+    def invalidate(self):
+        """Forget the cached value; the next get() fetches it again."""
+        with self._lock:
+            self._value = None
+            self._fetched_at = 0.0
+
+    def _fetch(self, fetched_at):
+        # Only one caller fetches; the others wait and reuse its value
+        with self._fetch_lock:
+            with self._lock:
+                if self._fetched_at != fetched_at and self._value is not None:
+                    return self._value
+            try:
+                value = self.backend.fetch()
+            except Exception:
+                with self._lock:
+                    self.failures += 1
+                metrics.increment('secret_fetch_failures')
+                raise
+            with self._lock:
+                self._value = value
+                self._fetched_at = time.time()
+                self.fetches += 1
+            metrics.increment('secret_fetches')
+            return value
+
+    def _background_refresh(self):
+        try:
+            with self._lock:
+                fetched_at = self._fetched_at
+            self._fetch(fetched_at)
+            with self._lock:
+                self.background_refreshes += 1
+            metrics.increment('secret_background_refreshes')
+        except Exception as e:
+            # The cached value stays in use until it expires
+            log.warning("Background secret refresh failed: %s", type(e).__name__)
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'hits': self.hits,
+                'fetches': self.fetches,
+                'background_refreshes': self.background_refreshes,
+                'forced_refreshes': self.forced_refreshes,
+                'failures': self.failures
+            }
+
+
+def is_auth_error(error):
+    """Return True if an API error means the key was rejected (e.g. rotated)."""
+    return getattr(error, 'status_code', None) in (401, 403)
+
+
+def default_secret_provider(secret_id):
+    """
+    Pick the backend from SECRETS_BACKEND: `boto3` (default), `extension`
+    for the Parameters and Secrets Lambda extension, or `env`.
+    """
+    backend = os.environ.get('SECRETS_BACKEND', 'boto3').lower()
+    if backend == 'extension':
+        return SecretProvider(ExtensionSecretsBackend(secret_id))
+    if backend == 'env':
+        return SecretProvider(EnvSecretBackend())
+    if backend != 'boto3':
+        raise ValueError(f"Unknown SECRETS_BACKEND: {backend}")
+    return SecretProvider(BotoSecretsBackend(secret_id))
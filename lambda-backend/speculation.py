@@ -0,0 +1,77 @@
+import asyncio
+import contextlib
+import threading
+import time
+
+from metrics import metrics
+
+
+class SpeculationStats:
+    """How often the local extractor or the model wins the race, and the latency saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.local_wins = 0
+        self.model_wins = 0
+        self.latency_saved = 0.0
+        self._model_latency_ewma = None
+
+    def record_local_win(self, elapsed):
+        saved = None
+        with self._lock:
+            self.local_wins += 1
+            if self._model_latency_ewma is not None:
+                saved = max(self._model_latency_ewma - elapsed, 0.0)
+                self.latency_saved += saved
+        metrics.increment('speculation_local_wins')
+        if saved is not None:
+            metrics.observe('speculation_saved_ms', saved * 1000)
+
+    def record_model_win(self, elapsed):
+        metrics.increment('speculation_model_wins')
+        with self._lock:
+            self.model_wins += 1
+            if self._model_latency_ewma is None:
+                self._model_latency_ewma = elapsed
+            else:
+                self._model_latency_ewma = 0.8 * self._model_latency_ewma + 0.2 * elapsed
+
+    def metrics(self):
+        with self._lock:
+            races = self.local_wins + self.model_wins
+            return {
+                'races': races,
+                'local_wins': self.local_wins,
+                'model_wins': self.model_wins,
+                'local_win_rate': round(self.local_wins / races, 4) if races else 0.0,
+                'latency_saved_ms': round(self.latency_saved * 1000, 2)
+            }
+
+
+stats = SpeculationStats()
+
+
+async def race_local_and_model(model_coro, local_fn, accept):
+    """
+    Start the model call and the local extractor at the same moment.
+
+    `local_fn()` runs in a worker thread. If `accept(local_output)` is true the
+    model call is cancelled; otherwise it is awaited. Returns
+    (winner, local_output, model_response) where winner is 'local' or 'model'
+    and model_response is None when the local path won.
+    """
+    start = time.monotonic()
+    model_task = asyncio.ensure_future(model_coro)
+    local_output = await asyncio.to_thread(local_fn)
+
+    if accept(local_output):
+        model_task.cancel()
+        # The local result stands even if the model call already failed (breaker open, 5xx, timeout)
+        with contextlib.suppress(asyncio.CancelledError, Exception):
+            await model_task
+        stats.record_local_win(time.monotonic() - start)
+        return 'local', local_output, None
+
+    response = await model_task
+    stats.record_model_win(time.monotonic() - start)
+    return 'model', local_output, response
@@ -0,0 +1,250 @@
+import re
+import threading
+from datetime import datetime
+
+from metrics import metrics
+from money import parse_decimal
+from validation import parse_amount, validate_receipt
+
+TABLE_SEPARATOR = re.compile(r'^\s*\|?(\s*:?-{2,}:?\s*\|)+\s*:?-*:?\s*\|?\s*$')
+AMOUNT = re.compile(r'(?:\b(?:AUD|NZD|USD|CAD|SGD|EUR|GBP|JPY|INR|CHF)\s?|[$€£¥₹])?-?\d[\d,]*[.,]\d{2}\b')
+TOTAL_LINE = re.compile(r'^\W*(grand\s+)?(total|balance due|amount due)\b', re.IGNORECASE)
+TAX_LINE = re.compile(r'\b(gst|vat|tax|hst)\b', re.IGNORECASE)
+RECEIPT_ID_LINE = re.compile(r'\b(receipt|invoice|tax invoice|order|trans(action)?)\s*(#|no\.?|number)?\s*:?\s*(?=[A-Z0-9-]*\d)([A-Z0-9-]{3,})', re.IGNORECASE)
+DATE_PATTERNS = [
+    (re.compile(r'\b(\d{4})-(\d{2})-(\d{2})\b'), '%Y-%m-%d'),
+    (re.compile(r'\b(\d{1,2})/(\d{1,2})/(\d{4})\b'), '%d/%m/%Y'),
+    (re.compile(r'\b(\d{1,2})/(\d{1,2})/(\d{2})\b'), '%d/%m/%y'),
+    (re.compile(r'\b(\d{1,2})\.(\d{1,2})\.(\d{4})\b'), '%d.%m.%Y'),
+]
+
+# Header keywords used to identify table columns
+COLUMN_KEYWORDS = {
+    'name': ('item', 'description', 'product', 'article', 'details'),
+    'qty': ('qty', 'quantity', 'qté', 'count', 'units'),
+    'unit_price': ('unit', 'price', 'each', 'rate', '@'),
+    'total_price': ('total', 'amount', 'amt', 'sum', 'value', 'line')
+}
+
+# Confidence required before the chat call is skipped
+MIN_CONFIDENCE = 0.9
+
+
+def split_row(line):
+    """Split a markdown table row into stripped cells."""
+    return [cell.strip().strip('*').strip() for cell in line.strip().strip('|').split('|')]
+
+
+def find_tables(text):
+    """Return every markdown table in the text as (header cells, list of row cells)."""
+    lines = text.splitlines()
+    tables = []
+    for index, line in enumerate(lines):
+        if index == 0 or not TABLE_SEPARATOR.match(line):
+            continue
+        header = split_row(lines[index - 1])
+        rows = []
+        for row_line in lines[index + 1:]:
+            if not row_line.strip().startswith('|'):
+                break
+            rows.append(split_row(row_line))
+        tables.append((header, rows))
+    return tables
+
+
+def detect_columns(header, rows):
+    """Map receipt item fields to column indexes using header keywords, then cell contents."""
+    columns = {}
+    for field in ('qty', 'total_price', 'unit_price', 'name'):
+        for index, cell in enumerate(header):
+            if index in columns.values():
+                continue
+            if any(keyword in cell.lower() for keyword in COLUMN_KEYWORDS[field]):
+                columns[field] = index
+                break
+
+    # Without a recognizable header, the rightmost money column is the line total
+    if 'total_price' not in columns:
+        for index in reversed(range(len(header))):
+            if index not in columns.values() and rows and all(
+                    parse_amount(row[index]) is not None for row in rows if index < len(row)):
+                columns['total_price'] = index
+                break
+    # A single price column is taken as the line total
+    if 'total_price' not in columns and 'unit_price' in columns:
+        columns['total_price'] = columns.pop('unit_price')
+    if 'name' not in columns:
+        for index in range(len(header)):
+            if index not in columns.values():
+                columns['name'] = index
+                break
+    return columns
+
+
+def extract_items(text):
+    """Extract line items from the first table that has a name and a line total column."""
+    for header, rows in find_tables(text):
+        columns = detect_columns(header, rows)
+        if 'name' not in columns or 'total_price' not in columns:
+            continue
+        items = []
+        for row in rows:
+            cell = lambda field: row[columns[field]] if field in columns and columns[field] < len(row) else ''
+            name = cell('name')
+            # Subtotal/total rows inside the table are not items
+            if not name or TOTAL_LINE.match(name) or parse_amount(cell('total_price')) is None:
+                continue
+            items.append({
+                'name': name,
+                'qty': cell('qty') or '1',
+                'unit_price': cell('unit_price') or derive_unit_price(cell('qty') or '1', cell('total_price')),
+                'total_price': cell('total_price')
+            })
+        if items:
+            return items
+    return []
+
+
+def derive_unit_price(qty, total_price):
+    """
+    Unit price for a row without one: the line total divided by a quantity
+    above 1, or empty when there is no such quantity to divide by.
+    """
+    quantity = parse_decimal(qty)
+    if quantity is None or quantity <= 1:
+        return ''
+    total = AMOUNT.search(total_price or '')
+    amount = parse_decimal(total.group(0)) if total else None
+    if amount is None:
+        return ''
+    unit = f"{amount / quantity:.2f}"
+    digits = re.search(r'\d[\d,.]*', total.group(0))
+    if digits.group(0)[-3] == ',':
+        unit = unit.replace('.', ',')
+    return total_price[:total.start() + digits.start()] + unit + total_price[total.start() + digits.end():]
+
+
+def extract_header(text):
+    """Extract merchant name and address from the lines above the first table, amount or date."""
+    header_lines = []
+    for line in text.splitlines():
+        stripped = line.strip().lstrip('#').strip().strip('*').strip()
+        if not stripped or stripped.startswith('!['):
+            continue
+        if stripped.startswith('|') or AMOUNT.search(stripped) or RECEIPT_ID_LINE.search(stripped):
+            break
+        if any(pattern.search(stripped) for pattern, _ in DATE_PATTERNS):
+            break
+        header_lines.append(stripped)
+        if len(header_lines) == 3:
+            break
+    merchant = header_lines[0] if header_lines else ''
+    address = ', '.join(line for line in header_lines[1:] if not TAX_LINE.search(line))
+    return merchant, address
+
+
+def extract_date(text):
+    """Return the first recognizable date as YYYY-MM-DD, or an empty string."""
+    for pattern, fmt in DATE_PATTERNS:
+        for match in pattern.finditer(text):
+            separator = fmt[2]
+            try:
+                return datetime.strptime(separator.join(match.groups()), fmt).strftime('%Y-%m-%d')
+            except ValueError:
+                continue
+    return ''
+
+
+def extract_labeled_amount(text, label_pattern, exclude_pattern=None):
+    """Return the amount on the last line matching label_pattern, as written on the receipt."""
+    found = ''
+    for line in text.splitlines():
+        cells = split_row(line) if line.strip().startswith('|') else [line.strip()]
+        joined = ' '.join(cells)
+        if exclude_pattern and exclude_pattern.search(joined):
+            continue
+        if label_pattern.search(joined):
+            amounts = AMOUNT.findall(joined)
+            if amounts:
+                found = amounts[-1].strip()
+    return found
+
+
+def extract_receipt(text):
+    """
+    Deterministically extract a receipt from OCR markdown.
+
+    Returns (result, confidence). Confidence is 1.0 only when the items
+    reconcile with the total and the header fields were found.
+    """
+    merchant, address = extract_header(text)
+    receipt_id_match = RECEIPT_ID_LINE.search(text)
+    result = {
+        'merchant': merchant,
+        'address': address,
+        'date': extract_date(text),
+        'receipt_id': receipt_id_match.group(4) if receipt_id_match else '',
+        'tax': extract_labeled_amount(text, TAX_LINE, exclude_pattern=TOTAL_LINE),
+        'total': extract_labeled_amount(text, TOTAL_LINE),
+        'items': extract_items(text)
+    }
+    return result, score_extraction(result)
+
+
+def score_extraction(result):
+    """Score a local extraction between 0 and 1."""
+    issues = validate_receipt(result)
+    if 'missing_total' in issues or 'missing_items' in issues:
+        return 0.0
+    score = 1.0
+    if issues:
+        score -= 0.5
+    if not result['merchant']:
+        score -= 0.2
+    if not result['date']:
+        score -= 0.1
+    return max(score, 0.0)
+
+
+class ExtractorStats:
+    """Hit rate of the local extractor and chat latency it saved."""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.attempts = 0
+        self.hits = 0
+        self.latency_saved = 0.0
+        self._chat_latency_ewma = None
+
+    def record_chat_latency(self, seconds):
+        """Track a moving average of chat latency to estimate what a hit saves."""
+        with self._lock:
+            if self._chat_latency_ewma is None:
+                self._chat_latency_ewma = seconds
+            else:
+                self._chat_latency_ewma = 0.8 * self._chat_latency_ewma + 0.2 * seconds
+
+    def record_attempt(self, hit, extraction_seconds):
+        saved = None
+        with self._lock:
+            self.attempts += 1
+            if hit:
+                self.hits += 1
+                if self._chat_latency_ewma is not None:
+                    saved = max(self._chat_latency_ewma - extraction_seconds, 0.0)
+                    self.latency_saved += saved
+        metrics.increment('local_table_hits' if hit else 'local_table_misses')
+        if saved is not None:
+            metrics.observe('local_table_saved_ms', saved * 1000)
+
+    def metrics(self):
+        with self._lock:
+            return {
+                'attempts': self.attempts,
+                'hits': self.hits,
+                'hit_rate': round(self.hits / self.attempts, 4) if self.attempts else 0.0,
+                'latency_saved_ms': round(self.latency_saved * 1000, 2)
+            }
+
+
+stats = ExtractorStats()
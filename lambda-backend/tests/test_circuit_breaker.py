@@ -0,0 +1,66 @@
+from types import SimpleNamespace
+
+import pytest
+
+import circuit_breaker
+from circuit_breaker import CLOSED, HALF_OPEN, OPEN, CircuitBreaker, is_outage_error
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = SimpleNamespace(now=100.0)
+    monkeypatch.setattr(circuit_breaker, 'time', SimpleNamespace(monotonic=lambda: clock.now))
+    return clock
+
+
+def open_breaker():
+    breaker = CircuitBreaker('test', failure_threshold=2, reset_timeout=30)
+    breaker.record_failure()
+    breaker.record_failure()
+    return breaker
+
+
+def test_consecutive_failures_open_the_breaker(clock):
+    breaker = open_breaker()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+    assert breaker.retry_after() == 30
+
+
+def test_late_success_does_not_close_an_open_breaker(clock):
+    breaker = open_breaker()
+
+    breaker.record_success()
+
+    assert breaker.state == OPEN
+    assert not breaker.allow()
+
+
+def test_successful_trial_closes_the_breaker(clock):
+    breaker = open_breaker()
+    clock.now += 30
+
+    assert breaker.state == HALF_OPEN
+    assert breaker.allow()
+    assert not breaker.allow()
+    breaker.record_success()
+    assert breaker.state == CLOSED
+
+
+def test_failed_trial_reopens_the_breaker(clock):
+    breaker = open_breaker()
+    clock.now += 30
+    breaker.allow()
+
+    breaker.record_failure()
+
+    assert breaker.state == OPEN
+    assert breaker.retry_after() == 30
+
+
+def test_only_outages_count():
+    assert is_outage_error(ConnectionError())
+    assert is_outage_error(SimpleNamespace(status_code=429))
+    assert is_outage_error(SimpleNamespace(status_code=503))
+    assert not is_outage_error(SimpleNamespace(status_code=422))
@@ -0,0 +1,89 @@
+import pytest
+
+from compaction import compact_markdown
+from table_extractor import detect_columns, extract_receipt, find_tables
+
+CAFE = """# **Harbour Cafe**
+12 Wharf St, Sydney NSW
+
+![img-0.jpeg](img-0.jpeg)
+
+| Item | Qty | Price | Total |
+|------|-----|-------|-------|
+| Flat white | 2 | $4.50 | $9.00 |
+| Banana bread |  | $5.00 | $5.00 |
+| Water | 1 | | $3.00 |
+
+---
+
+GST $1.55
+**TOTAL $17.00**
+
+Thank you for visiting!
+Receipt #A-10442
+Date: 2024-03-14
+Follow us on www.harbourcafe.example
+VISA xx1234 $17.00
+"""
+
+HARDWARE = """## Bolt & Nut Hardware
+Tax Invoice No. 88120
+
+| Description | Amount |
+|:--|--:|
+| Hex bolts M8 | $12.40 |
+| Washers | $3.10 |
+
+Subtotal $15.50
+Total $15.50
+Join today and earn points!
+Have a great day
+15/02/2024
+"""
+
+SAMPLES = [CAFE, HARDWARE]
+
+HEADER_FIELDS = ('merchant', 'date', 'receipt_id', 'tax', 'total')
+
+
+@pytest.mark.parametrize('raw', SAMPLES)
+def test_compacted_text_extracts_the_same_fields(raw):
+    compacted, stats = compact_markdown(raw)
+    expected, _ = extract_receipt(raw)
+    actual, _ = extract_receipt(compacted)
+
+    assert stats['tokens_after'] < stats['tokens_before']
+    assert {field: actual[field] for field in HEADER_FIELDS} == {field: expected[field] for field in HEADER_FIELDS}
+
+
+@pytest.mark.parametrize('raw', SAMPLES)
+def test_compacted_table_rows_keep_their_columns(raw):
+    compacted, _ = compact_markdown(raw)
+    expected, _ = extract_receipt(raw)
+    header, rows = find_tables(raw)[0]
+    columns = detect_columns(header, rows)
+    compacted_rows = [line.split(' | ') for line in compacted.splitlines() if ' | ' in line][1:]
+
+    assert expected['items']
+    for item, cells in zip(expected['items'], compacted_rows):
+        assert cells[columns['name']] == item['name']
+        assert cells[columns['total_price']] == item['total_price']
+        if 'qty' in columns and item['qty'] != '1':
+            assert cells[columns['qty']] == item['qty']
+
+
+def test_lines_after_the_footer_are_kept():
+    compacted, _ = compact_markdown(CAFE)
+
+    assert 'Thank you' not in compacted
+    assert 'www.' not in compacted
+    assert 'Receipt #A-10442' in compacted
+    assert 'Date: 2024-03-14' in compacted
+    assert 'VISA xx1234 $17.00' in compacted
+
+
+def test_empty_cells_are_kept():
+    compacted, _ = compact_markdown(CAFE)
+
+    assert 'Banana bread |  | $5.00 | $5.00' in compacted
+    assert 'Water | 1 |  | $3.00' in compacted
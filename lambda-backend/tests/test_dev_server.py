@@ -0,0 +1,78 @@
+import json
+import threading
+import time
+import urllib.error
+import urllib.request
+
+import pytest
+
+from dev_server import ContainerPool, create_server
+
+
+class FakeContainer:
+    def __init__(self, container_id, pool=None, dead=False):
+        self.container_id = container_id
+        self.pool = pool
+        self.dead = dead
+        self.closed = False
+        self.invocations = 0
+        self.init_duration_ms = 0.0
+        self.last_used = time.monotonic()
+
+    def query(self, name):
+        if self.dead:
+            raise RuntimeError(f"{self.container_id} exited with code 1")
+        # Other threads can use the pool while a container is being queried
+        stats = []
+        thread = threading.Thread(target=lambda: stats.append(self.pool.stats()))
+        thread.start()
+        thread.join(timeout=1)
+        assert stats, 'pool lock held during a container query'
+        return {'result': f"{name} of {self.container_id}"}
+
+    def invoke(self, event, timeout_seconds):
+        raise RuntimeError(f"{self.container_id} exited with code 1")
+
+    def close(self):
+        self.closed = True
+
+
+def pool_with(*containers):
+    pool = ContainerPool()
+    for container in containers:
+        container.pool = pool
+        pool._idle.append(container)
+    pool._total = len(containers)
+    return pool
+
+
+def test_query_releases_the_lock_and_keeps_idle_containers():
+    older, dead, newer = FakeContainer('c1'), FakeContainer('c2', dead=True), FakeContainer('c3')
+    pool = pool_with(older, dead, newer)
+
+    assert pool.query('providers') == [('c3', 'providers of c3'), ('c1', 'providers of c1')]
+    assert pool._idle == [older, newer]
+    assert dead.closed and pool.stats()['containers'] == 2
+
+
+@pytest.fixture
+def server():
+    crashing = FakeContainer('c1')
+    server = create_server(port=0, pool=pool_with(crashing))
+    thread = threading.Thread(target=server.serve_forever, daemon=True)
+    thread.start()
+    yield server, crashing
+    server.shutdown()
+    server.server_close()
+
+
+def test_failed_container_returns_502(server):
+    server, crashing = server
+    url = f"http://127.0.0.1:{server.server_address[1]}/upload"
+
+    with pytest.raises(urllib.error.HTTPError) as error:
+        urllib.request.urlopen(urllib.request.Request(url, data=b'{}', method='POST'), timeout=5)
+
+    assert error.value.code == 502
+    assert json.loads(error.value.read())['error'] == 'Lambda container failed'
+    assert crashing.closed
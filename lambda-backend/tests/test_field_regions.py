@@ -0,0 +1,35 @@
+import pytest
+
+from field_regions import locate_fields, valid_region
+
+
+@pytest.mark.parametrize('region', [
+    {'top': 0.1, 'bottom': 0.2},
+    {'top': 0, 'bottom': 1, 'left': 0.25, 'right': 0.75},
+])
+def test_valid_regions(region):
+    assert valid_region(region)
+
+
+@pytest.mark.parametrize('region', [
+    None,
+    [0.1, 0.2],
+    {'top': 0.1},
+    {'top': 0.5, 'bottom': 0.2},
+    {'top': 0.2, 'bottom': 0.2},
+    {'top': -0.1, 'bottom': 0.2},
+    {'top': 0.1, 'bottom': 1.5},
+    {'top': 0.1, 'bottom': 0.2, 'left': 0.8, 'right': 0.3},
+    {'top': 0.1, 'bottom': float('nan')},
+    {'top': 0.1, 'bottom': float('inf')},
+    {'top': '0.1', 'bottom': 0.2},
+    {'top': False, 'bottom': True},
+])
+def test_invalid_regions(region):
+    assert not valid_region(region)
+
+
+def test_located_regions_are_valid():
+    pages = ['Harbour Cafe\n2024-03-14\nItem 4.50\nTOTAL $4.50']
+    regions = locate_fields({'merchant': 'Harbour Cafe', 'date': '2024-03-14', 'total': '$4.50'}, pages)
+    assert regions and all(valid_region(region) for region in regions.values())
@@ -0,0 +1,102 @@
+import asyncio
+import base64
+from types import SimpleNamespace
+
+import mistral_client
+from image_handles import ImageHandles, InMemoryFilesAPI
+
+IMAGE_B64 = base64.b64encode(b'jpeg bytes').decode()
+
+
+class FailingFilesAPI(InMemoryFilesAPI):
+    def upload(self, file, purpose=None):
+        raise ConnectionError('files endpoint unavailable')
+
+
+def test_first_attempt_is_inline_and_retry_uploads_once():
+    files = InMemoryFilesAPI()
+    handles = ImageHandles(files)
+
+    assert handles.document(None, 'receipt', IMAGE_B64)['image_url'].startswith('data:image/jpeg')
+    retry = handles.document(None, 'receipt', IMAGE_B64, upload=True)
+    again = handles.document(None, 'receipt', IMAGE_B64, upload=True)
+
+    assert retry['image_url'].startswith('memory://files/')
+    assert again == retry
+    assert files.uploads == 1
+    assert handles.metrics()['reuses'] == 1
+
+
+def test_release_deletes_the_uploaded_file():
+    files = InMemoryFilesAPI()
+    handles = ImageHandles(files)
+    handles.document(None, 'receipt', IMAGE_B64, upload=True)
+
+    handles.release('receipt')
+    handles.flush()
+
+    assert len(files) == 0
+    assert handles.metrics()['deleted'] == 1
+    assert handles.document(None, 'receipt', IMAGE_B64)['image_url'].startswith('data:image/jpeg')
+
+
+def test_expired_handle_is_replaced():
+    files = InMemoryFilesAPI()
+    handles = ImageHandles(files, expiry_hours=0)
+    first = handles.document(None, 'receipt', IMAGE_B64, upload=True)
+
+    second = handles.document(None, 'receipt', IMAGE_B64, upload=True)
+    handles.flush()
+
+    assert second != first
+    assert files.uploads == 2
+    assert len(files) == 1
+
+
+def test_failed_upload_falls_back_to_inline():
+    handles = ImageHandles(FailingFilesAPI())
+
+    document = handles.document(None, 'receipt', IMAGE_B64, upload=True)
+
+    assert document['image_url'].startswith('data:image/jpeg')
+    assert handles.metrics()['upload_failures'] == 1
+
+
+def test_ocr_retry_references_the_upload(monkeypatch):
+    files = InMemoryFilesAPI()
+    monkeypatch.setattr(mistral_client, 'image_handles', ImageHandles(files))
+    documents = []
+
+    def process(model, document):
+        documents.append(document['image_url'])
+        if len(documents) == 1:
+            raise TimeoutError('read timed out')
+        return SimpleNamespace(pages=[SimpleNamespace(markdown='TOTAL 4.50')], usage_info=None)
+
+    client = SimpleNamespace(ocr=SimpleNamespace(process=process))
+    pages = mistral_client._run_ocr(client, IMAGE_B64, 'interactive')
+
+    assert pages == ['TOTAL 4.50']
+    assert documents[0].startswith('data:image/jpeg')
+    assert documents[1].startswith('memory://files/')
+    assert files.uploads == 1
+
+
+def test_tiled_ocr_retries_a_failed_strip_through_an_upload(monkeypatch):
+    files = InMemoryFilesAPI()
+    monkeypatch.setattr(mistral_client, 'image_handles', ImageHandles(files))
+    documents = []
+
+    async def process_async(model, document):
+        documents.append(document['image_url'])
+        if len(documents) == 1:
+            raise TimeoutError('read timed out')
+        return SimpleNamespace(pages=[SimpleNamespace(markdown='TOTAL 4.50')], usage_info=None)
+
+    client = SimpleNamespace(ocr=SimpleNamespace(process_async=process_async))
+    markdown = asyncio.run(mistral_client._run_tiled_ocr(client, [IMAGE_B64], 'receipt-full', 'interactive'))
+
+    assert markdown == 'TOTAL 4.50'
+    assert documents[0].startswith('data:image/jpeg')
+    assert documents[1].startswith('memory://files/')
+    assert files.uploads == 1
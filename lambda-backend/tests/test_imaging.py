@@ -0,0 +1,69 @@
+import base64
+import io
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+import mistral_client
+from imaging import crop_region, decode_image_base64, downscale, open_image, split_tall_image
+
+
+def jpeg(width, height):
+    buffer = io.BytesIO()
+    Image.new('RGB', (width, height), 'white').save(buffer, format='JPEG')
+    return buffer.getvalue()
+
+
+def size(image_b64):
+    return Image.open(io.BytesIO(base64.b64decode(image_b64))).size
+
+
+def test_downscale_shrinks_the_longest_side():
+    small = downscale(Image.new('RGB', (1500, 3000)), max_side=1024)
+
+    assert size(small) == (512, 1024)
+
+
+def test_downscale_skips_images_that_are_already_small():
+    assert downscale(Image.new('RGB', (800, 600)), max_side=1024) is None
+
+
+def test_progressive_pass_sends_fewer_bytes():
+    image_b64 = base64.b64encode(jpeg(2000, 2600)).decode()
+
+    tiles, low_b64 = mistral_client._prepare_passes(image_b64)
+
+    assert tiles is None
+    assert max(size(low_b64)) == mistral_client.PROGRESSIVE_MAX_SIDE
+    assert len(low_b64) < len(image_b64)
+
+
+def test_tiling_and_downscaling_decode_the_image_once(monkeypatch):
+    opened = []
+    def counting_open(image_bytes):
+        opened.append(image_bytes)
+        return open_image(image_bytes)
+
+    monkeypatch.setattr(mistral_client, 'open_image', counting_open)
+
+    tiles, low_b64 = mistral_client._prepare_passes(base64.b64encode(jpeg(400, 2400)).decode())
+
+    assert len(opened) == 1
+    assert len(tiles) > 1 and low_b64 is None
+
+
+def test_tall_receipts_split_into_overlapping_strips():
+    tiles = split_tall_image(Image.new('RGB', (400, 2400)))
+
+    heights = [size(tile)[1] for tile in tiles]
+    assert len(tiles) > 1
+    assert sum(heights) > 2400
+    assert split_tall_image(Image.new('RGB', (400, 800))) is None
+
+
+def test_crop_region_upscales_the_crop():
+    crop = crop_region(jpeg(400, 1000), {'top': 0.5, 'bottom': 0.6})
+
+    assert size(crop) == (800, 200)
+    assert decode_image_base64(f"data:image/jpeg;base64,{crop}") == base64.b64decode(crop)
@@ -0,0 +1,95 @@
+from layout_index import LayoutIndex, apply_recipe, fingerprint, learn_recipe
+
+RECEIPT = """# Corner Cafe
+12 King St, Sydney
+Date: 03/04/2024
+
+| Item | Qty | Amount |
+|---|---|---|
+| Flat white | 2 | $9.00 |
+| Muffin | 1 | $4.00 |
+
+GST included $1.18
+**Total $13.00**"""
+
+RESULT = {
+    'merchant': 'Corner Cafe',
+    'address': '12 King St, Sydney',
+    'date': '2024-04-03',
+    'receipt_id': '',
+    'tax': '$1.18',
+    'total': '$13.00',
+    'items': [
+        {'name': 'Flat white', 'qty': '2', 'unit_price': '$4.50', 'total_price': '$9.00'},
+        {'name': 'Muffin', 'qty': '1', 'unit_price': '$4.00', 'total_price': '$4.00'}
+    ]
+}
+
+# Same template, another branch and another basket
+SAME_LAYOUT = """# Corner Cafe
+80 George St, Sydney
+Date: 05/04/2024
+
+| Item | Qty | Amount |
+|---|---|---|
+| Long black | 3 | $12.00 |
+| Banana bread | 1 | $5.50 |
+| Water | 1 | $3.00 |
+
+GST included $1.86
+**Total $20.50**"""
+
+OTHER_LAYOUT = """# Harbour Grocer
+Date: 05/04/2024
+
+| Description | Price |
+|---|---|
+| Apples | $4.00 |
+
+Amount due $4.00"""
+
+
+def test_learned_recipe_extracts_the_same_layout():
+    recipe = learn_recipe(RECEIPT, RESULT)
+
+    replayed = apply_recipe(RECEIPT, recipe)['items']
+    assert [(item['name'], item['qty'], item['total_price']) for item in replayed] == \
+        [(item['name'], item['qty'], item['total_price']) for item in RESULT['items']]
+
+    result = apply_recipe(SAME_LAYOUT, recipe)
+    assert fingerprint(SAME_LAYOUT) == fingerprint(RECEIPT)
+    assert (result['merchant'], result['address'], result['date']) == \
+        ('Corner Cafe', '80 George St, Sydney', '2024-04-05')
+    assert (result['tax'], result['total']) == ('$1.86', '$20.50')
+    assert [(item['name'], item['unit_price']) for item in result['items']] == \
+        [('Long black', '$4.00'), ('Banana bread', ''), ('Water', '')]
+
+
+def test_index_extracts_known_layouts_only():
+    index = LayoutIndex()
+    key, result = index.extract(RECEIPT)
+    assert result is None
+    assert index.learn(key, RECEIPT, RESULT)
+
+    assert index.extract(SAME_LAYOUT)[1]['total'] == '$20.50'
+    assert index.extract(OTHER_LAYOUT) == (fingerprint(OTHER_LAYOUT), None)
+    assert index.metrics()['hits'] == 1
+
+
+def test_recipe_that_does_not_fit_the_layout_is_rejected():
+    index = LayoutIndex()
+    recipe_key = fingerprint(OTHER_LAYOUT)
+    index._recipes[recipe_key] = learn_recipe(RECEIPT, RESULT)
+
+    # The stored recipe's labels and columns do not match this receipt, so it falls back to the model
+    assert index.extract(OTHER_LAYOUT) == (recipe_key, None)
+    assert index.metrics()['hits'] == 0
+
+
+def test_result_that_cannot_be_mapped_back_is_not_learned():
+    index = LayoutIndex()
+    # Consistent on its own, but the item is not in the OCR text
+    wrong = dict(RESULT, items=[{'name': 'Tea', 'qty': '1', 'unit_price': '$13.00', 'total_price': '$13.00'}])
+
+    assert not index.learn(fingerprint(RECEIPT), RECEIPT, wrong)
+    assert len(index) == 0
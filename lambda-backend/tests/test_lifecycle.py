@@ -0,0 +1,44 @@
+import random
+
+import pytest
+
+import lambda_function
+import lifecycle
+import mistral_client
+from queue_worker import S3ResultStore, SqsQueue
+from secret_provider import BotoSecretsBackend
+from uploads import InMemoryS3Client, UploadStore
+
+
+def test_restore_drops_init_phase_state_and_rebuilds_clients():
+    secret = lambda_function.mistral_secret
+    if not isinstance(secret.backend, BotoSecretsBackend):
+        pytest.skip('SECRETS_BACKEND is not boto3')
+    secrets_client = secret.backend.client
+    secret._value, secret._fetched_at = 'init-key', 1.0
+    mistral_client._shared_http_client()
+    random.seed(1)
+    seeded = random.getstate()
+
+    lifecycle.before_snapshot()
+    assert secret._value is None
+    assert mistral_client._http_client is None
+
+    lifecycle.after_restore()
+    assert secret.backend.client is not secrets_client
+    assert random.getstate() != seeded
+
+
+def test_reconnect_rebuilds_only_owned_clients():
+    injected = InMemoryS3Client()
+    uploads = UploadStore('bucket', s3_client=injected)
+    results = S3ResultStore('bucket')
+    queue = SqsQueue('https://sqs.ap-southeast-2.amazonaws.com/123456789012/receipts')
+    owned = (results.s3_client, queue.sqs_client)
+
+    for component in (uploads, results, queue):
+        component.reconnect()
+
+    assert uploads.s3_client is injected
+    assert results.s3_client is not owned[0]
+    assert queue.sqs_client is not owned[1]
@@ -0,0 +1,60 @@
+import json
+import logging
+import sys
+
+import log
+from log import JsonFormatter, Redacted, SamplingFilter, _parse_sample_rates
+from request_context import request_scope
+
+RECEIPT_TEXT = 'CORNER CAFE\nFlat white $4.50'
+
+
+def format_record(message, *args, exc_info=None):
+    record = logging.LogRecord('receipt_scanner.test', logging.ERROR, __file__, 1, message, args, exc_info)
+    return json.loads(JsonFormatter().format(record))
+
+
+def failure():
+    try:
+        raise ValueError(f"Could not parse {RECEIPT_TEXT}")
+    except ValueError:
+        return sys.exc_info()
+
+
+def test_redaction_keeps_only_the_length(monkeypatch):
+    monkeypatch.setattr(log, 'LOG_REDACT', True)
+
+    entry = format_record('Model output: %s', Redacted(RECEIPT_TEXT))
+
+    assert entry['message'] == f"Model output: <redacted {len(RECEIPT_TEXT)} chars>"
+
+
+def test_redacted_exceptions_log_only_the_type(monkeypatch):
+    monkeypatch.setattr(log, 'LOG_REDACT', True)
+
+    entry = format_record('Parsing failed', exc_info=failure())
+
+    assert entry['exception'] == 'ValueError'
+    assert 'traceback' not in entry
+    assert 'CORNER CAFE' not in json.dumps(entry)
+
+
+def test_unredacted_logs_keep_contents_and_traceback(monkeypatch):
+    monkeypatch.setattr(log, 'LOG_REDACT', False)
+
+    entry = format_record('Model output: %s', Redacted(RECEIPT_TEXT), exc_info=failure())
+
+    assert entry['message'] == f"Model output: {RECEIPT_TEXT}"
+    assert entry['traceback'].startswith('Traceback (most recent call last):')
+    assert entry['traceback'].endswith(f"ValueError: Could not parse {RECEIPT_TEXT}")
+
+
+def test_sampling_keeps_or_drops_a_whole_request():
+    sampling = SamplingFilter(_parse_sample_rates('DEBUG=0.5, INFO=1'))
+    record = lambda level: logging.LogRecord('receipt_scanner.test', level, __file__, 1, 'line', (), None)
+
+    for request_id in ('a', 'b', 'c', 'd'):
+        with request_scope(request_id):
+            kept = {sampling.filter(record(logging.DEBUG)) for _ in range(5)}
+            assert len(kept) == 1
+            assert sampling.filter(record(logging.INFO))
@@ -0,0 +1,78 @@
+import base64
+import json
+
+import pytest
+
+import lambda_function
+from metering import UsageMeter
+from request_context import current_context
+
+SMALL = 'mistral-small-latest'
+LARGE = 'mistral-large-latest'
+
+
+def test_usage_is_accounted_per_user():
+    meter = UsageMeter(daily_budget=None)
+    meter.record('alice', 'chat', LARGE, prompt_tokens=1_000_000, completion_tokens=0)
+    meter.record('alice', 'chat', LARGE, prompt_tokens=0, completion_tokens=1_000_000)
+    meter.record('bob', 'ocr', 'mistral-ocr-latest', ocr_pages=2)
+
+    assert meter.spent_today('alice') == pytest.approx(8.0)
+    assert meter.spent_today('bob') == pytest.approx(0.002)
+    assert meter.spent_today('carol') == 0.0
+
+    records = {(r['user_id'], r['stage']): r for r in meter.flush()}
+    assert records[('alice', 'chat')]['requests'] == 2
+    assert records[('alice', 'chat')]['cost_usd_estimate'] == pytest.approx(8.0)
+    assert records[('bob', 'ocr')]['ocr_pages'] == 2
+    assert meter.flush() == []
+    # Flushing emits the aggregates; the daily spend used for budgets is kept
+    assert meter.spent_today('alice') == pytest.approx(8.0)
+
+
+def test_budget_downgrades_then_rejects():
+    meter = UsageMeter(daily_budget=1.0)
+    assert meter.check_budget('alice') == 'ok'
+
+    meter.record('alice', 'chat', LARGE, prompt_tokens=450_000)
+    assert meter.check_budget('alice') == 'downgrade'
+    assert meter.check_budget('bob') == 'ok'
+
+    meter.record('alice', 'chat', SMALL, prompt_tokens=2_000_000)
+    assert meter.check_budget('alice') == 'reject'
+    assert (meter.metrics()['downgraded'], meter.metrics()['rejected']) == (1, 1)
+
+
+def invoke(user_id):
+    event = {
+        'httpMethod': 'POST',
+        'requestContext': {'authorizer': {'claims': {'sub': user_id}}},
+        'body': json.dumps({'image_base64': base64.b64encode(b'receipt').decode()})
+    }
+    response = lambda_function.lambda_handler(event, None)
+    return response['statusCode']
+
+
+@pytest.fixture
+def handler(monkeypatch):
+    meter = UsageMeter(daily_budget=1.0)
+    downgraded = []
+
+    def process(fn, *args, **kwargs):
+        downgraded.append(current_context().downgraded)
+        return {'total': '$1.00'}
+
+    monkeypatch.setattr(lambda_function, 'meter', meter)
+    monkeypatch.setattr(lambda_function, 'call_with_api_key', process)
+    return meter, downgraded
+
+
+def test_handler_downgrades_and_rejects_over_budget_users(handler):
+    meter, downgraded = handler
+    meter.record('alice', 'chat', LARGE, prompt_tokens=450_000)
+    meter.record('bob', 'chat', LARGE, prompt_tokens=500_000)
+
+    assert invoke('alice') == 200
+    assert invoke('bob') == 429
+    assert invoke('carol') == 200
+    assert downgraded == [True, False]
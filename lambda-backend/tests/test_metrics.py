@@ -0,0 +1,104 @@
+from metrics import MAX_METRICS_PER_DIRECTIVE, InMemorySink, MetricsRegistry, bucket_value
+
+
+def registry():
+    return MetricsRegistry(InMemorySink(), namespace='Test')
+
+
+def test_bucket_value_rounds_up_to_a_geometric_boundary():
+    assert bucket_value(0.5) == 0.5
+    assert bucket_value(-3) == 0.0
+    assert bucket_value(100) >= 100
+    assert bucket_value(100) == bucket_value(bucket_value(100))
+    assert len({bucket_value(ms) for ms in range(1, 600_000, 50)}) < 100
+
+
+def test_flush_emits_histograms_and_counters_as_one_record():
+    metrics = registry()
+    for ms in (10, 10, 250):
+        metrics.observe('ocr_ms', ms)
+    metrics.observe('payload_bytes', 2048, unit='Bytes')
+    metrics.increment('requests_success')
+    metrics.increment('requests_success', 2)
+
+    record = metrics.flush()
+
+    assert metrics.sink.records == [record]
+    directive, = record['_aws']['CloudWatchMetrics']
+    assert directive['Namespace'] == 'Test'
+    assert directive['Metrics'] == [
+        {'Name': 'ocr_ms', 'Unit': 'Milliseconds'},
+        {'Name': 'payload_bytes', 'Unit': 'Bytes'},
+        {'Name': 'requests_success', 'Unit': 'Count'}
+    ]
+    assert record['ocr_ms'] == {'Values': [bucket_value(10), bucket_value(250)], 'Counts': [2, 1]}
+    assert record['requests_success'] == 3
+
+
+def test_flush_resets_observations_but_keeps_gauges():
+    metrics = registry()
+    metrics.increment('requests_success')
+    metrics.flush()
+
+    assert metrics.flush() is None
+
+    metrics.register_gauges('cache', lambda: {'entries': 3})
+    assert metrics.flush()['cache_entries'] == 3
+    assert metrics.flush()['cache_entries'] == 3
+
+
+def test_gauges_flatten_nested_numbers_only():
+    metrics = registry()
+    metrics.register_gauges('providers', lambda: {
+        'mistral.ocr': {'latency_ms': 12.5, 'state': 'closed', 'calls': 4},
+        'enabled': True,
+        'latency_ms': None
+    })
+
+    assert metrics.gauges() == {'providers_mistral_ocr_latency_ms': 12.5, 'providers_mistral_ocr_calls': 4}
+    record = metrics.flush()
+    assert {'Name': 'providers_mistral_ocr_calls', 'Unit': 'None'} in record['_aws']['CloudWatchMetrics'][0]['Metrics']
+
+
+def test_directives_are_split_at_the_emf_limit():
+    metrics = registry()
+    for index in range(MAX_METRICS_PER_DIRECTIVE + 5):
+        metrics.increment(f"counter_{index:03d}")
+
+    directives = metrics.flush()['_aws']['CloudWatchMetrics']
+
+    assert [len(d['Metrics']) for d in directives] == [MAX_METRICS_PER_DIRECTIVE, 5]
+    assert all(d['Dimensions'] == [['Service']] for d in directives)
+
+
+def test_handler_gauges_do_not_reuse_counter_names():
+    import lambda_function
+    from metrics import metrics
+
+    metrics.increment('ocr_cache_hits')
+    metrics.increment('ocr_cache_misses')
+    names = [d['Name'] for directive in metrics.flush()['_aws']['CloudWatchMetrics'] for d in directive['Metrics']]
+
+    assert lambda_function.metrics is metrics
+    assert len(names) == len(set(names))
+
+
+def test_handler_gauges_are_point_in_time_values():
+    import lambda_function
+
+    gauges = lambda_function.metrics.gauges()
+
+    assert 'scheduler_interactive_queue_depth' in gauges and 'scheduler_interactive_in_flight' in gauges
+    assert all(name.endswith(('_queue_depth', '_in_flight', '_entries', '_templates', '_active',
+                              '_latency_ms', '_error_rate')) for name in gauges)
+
+
+def test_scheduler_wait_is_observed_per_invocation():
+    from metrics import metrics
+    from scheduler import PriorityScheduler
+
+    metrics.flush()
+    PriorityScheduler(max_concurrency=1).run('batch', lambda: None)
+    record = metrics.flush()
+
+    assert 'scheduler_batch_wait_ms' in record
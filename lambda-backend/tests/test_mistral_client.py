@@ -0,0 +1,19 @@
+import mistral_client
+from providers import FailoverClient, ProviderPool, fake_provider
+
+
+def test_each_event_loop_gets_its_own_async_client():
+    pool = ProviderPool([fake_provider('mistral', latency=0)])
+    client = FailoverClient(pool, 'key', None)
+    seen = []
+
+    async def ocr(loop_client):
+        seen.append(loop_client.async_client)
+        await loop_client.ocr.process_async(model='mistral-ocr-latest', document={})
+        return loop_client.async_client.is_closed
+
+    assert mistral_client._run_async(client, ocr) is False
+    assert mistral_client._run_async(client, ocr) is False
+    assert seen[0] is not seen[1]
+    assert all(async_client.is_closed for async_client in seen)
+    assert pool._clients == {}
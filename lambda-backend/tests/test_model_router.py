@@ -0,0 +1,73 @@
+import json
+from types import SimpleNamespace
+
+import pytest
+
+import mistral_client
+from layout_index import layout_index
+from model_router import MODEL_ROUTES, ModelRouter, measure_ocr_text
+from money import normalize_receipt
+from request_context import current_context, request_scope
+
+# No table, so neither local extractor answers and the chat model is always called
+OCR_TEXT = "CORNER CAFE\nFlat white $4.50\nTOTAL $4.50"
+
+VALID = {'merchant': 'Corner Cafe', 'date': '2024-04-03', 'total': '$4.50', 'tax': '',
+         'items': [{'name': 'Flat white', 'qty': '1', 'unit_price': '$4.50', 'total_price': '$4.50'}]}
+INVALID = dict(VALID, items=[])
+
+
+class ChatClient:
+    def __init__(self, answers):
+        self.models = []
+        self.answers = answers
+        self.chat = SimpleNamespace(complete=self._complete)
+
+    def _complete(self, model, messages, **options):
+        self.models.append(model)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(self.answers.pop(0))))],
+                               usage=None)
+
+
+@pytest.fixture(autouse=True)
+def no_layout_learning(monkeypatch):
+    monkeypatch.setattr(layout_index, 'learn', lambda key, text, result: False)
+
+
+def structure(client):
+    with request_scope():
+        return mistral_client._structure_receipt(client, OCR_TEXT, 'prompt', 'batch')[0]
+
+
+def test_short_receipts_route_to_the_small_model():
+    router = ModelRouter(small_max_chars=1500, small_max_lines=40)
+
+    assert router.choose_route(measure_ocr_text(OCR_TEXT)) == 'small'
+    assert router.choose_route(measure_ocr_text('\n'.join(['Item $1.00'] * 41))) == 'large'
+    assert router.choose_route(measure_ocr_text('GST $1.00\nVAT $2.00')) == 'large'
+
+
+def test_valid_small_model_result_is_accepted():
+    client = ChatClient([VALID])
+
+    assert structure(client) == normalize_receipt(VALID)
+    assert client.models == [MODEL_ROUTES['small']]
+
+
+def test_invalid_small_model_result_escalates_to_the_large_model():
+    client = ChatClient([INVALID, VALID])
+
+    assert structure(client)['items'][0]['name'] == 'Flat white'
+    assert client.models == [MODEL_ROUTES['small'], MODEL_ROUTES['large']]
+
+
+def test_downgraded_request_stays_on_the_small_model():
+    client = ChatClient([INVALID])
+
+    with request_scope():
+        current_context().downgraded = True
+        long_text = OCR_TEXT + '\n' + '\n'.join(['Item $1.00'] * 41)
+        result, _ = mistral_client._structure_receipt(client, long_text, 'prompt', 'batch')
+
+    assert result['items'] == []
+    assert client.models == [MODEL_ROUTES['small']]
@@ -0,0 +1,45 @@
+from decimal import Decimal
+
+import pytest
+
+from money import detect_currency, normalize_quantity, normalize_receipt, parse_decimal
+
+
+@pytest.mark.parametrize('value, amount', [
+    ('$12.34', '12.34'),
+    ('AUD 5,00', '5.00'),
+    ('5,00', '5.00'),
+    ('1.234,50', '1234.50'),
+    ('$1,234.56', '1234.56'),
+    ('1 234,50', '1234.50'),
+    ('¥1,200', '1200'),
+    ('5.00-', '-5.00'),
+    ('-$5.00', '-5.00'),
+    ('$0.82 (10%)', '0.82'),
+    (9.5, '9.5')
+])
+def test_parse_decimal(value, amount):
+    assert parse_decimal(value) == Decimal(amount)
+
+
+@pytest.mark.parametrize('value', ['12.34 1.12', '2 x 3.50', 'n/a', '', None, True])
+def test_ambiguous_or_missing_amounts_are_none(value):
+    assert parse_decimal(value) is None
+
+
+def test_quantities():
+    assert normalize_quantity('2x') == 2
+    assert normalize_quantity('1.5 kg') == 1.5
+    assert normalize_quantity('some') == 1
+
+
+def test_receipt_currency_comes_from_the_first_explicit_symbol():
+    receipt = normalize_receipt({'total': 'NZ$9.00', 'tax': '', 'items': [
+        {'qty': '2', 'unit_price': '$4.50', 'total_price': '$9.00'}
+    ]})
+
+    assert detect_currency('NZ$9.00') == 'NZD'
+    assert receipt['normalized'] == {
+        'currency': 'NZD', 'total': 900, 'tax': None,
+        'items': [{'qty': 2, 'unit_price': 450, 'total_price': 900}]
+    }
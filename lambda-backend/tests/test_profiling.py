@@ -0,0 +1,48 @@
+import json
+import time
+
+import pytest
+
+import lambda_function
+import profiling
+from profiling import InvocationProfile, profile_requested, profile_sampled, sign_profile_request
+
+EVENT = {'httpMethod': 'POST', 'body': json.dumps({'action': 'result'})}
+
+
+def test_profiling_is_a_no_op_when_disabled(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_SECRET', '')
+    monkeypatch.setattr(profiling, 'PROFILE_SAMPLE_RATE', 0.0)
+
+    def unexpected_profile(request_id):
+        raise AssertionError('profiler started while disabled')
+
+    monkeypatch.setattr(lambda_function, 'InvocationProfile', unexpected_profile)
+    headers = {'X-Profile': sign_profile_request(int(time.time()), secret='')}
+
+    assert not profile_requested(headers)
+    assert not profile_sampled()
+    response = lambda_function.lambda_handler(dict(EVENT, headers=headers), None)
+    assert 'profile' not in json.loads(response['body'])
+
+
+def test_only_fresh_signed_requests_are_profiled(monkeypatch):
+    monkeypatch.setattr(profiling, 'PROFILE_SECRET', 'secret')
+    now = int(time.time())
+
+    assert profile_requested({'x-profile': sign_profile_request(now, secret='secret')})
+    assert not profile_requested({'X-Profile': sign_profile_request(now, secret='other')})
+    assert not profile_requested({'X-Profile': sign_profile_request(now - 3600, secret='secret')})
+    assert not profile_requested({})
+
+
+def test_requested_profile_is_attached_to_the_response(monkeypatch, tmp_path):
+    monkeypatch.setattr(profiling, 'PROFILE_SECRET', 'secret')
+    monkeypatch.setattr(profiling, 'PROFILE_DIR', str(tmp_path))
+    headers = {'X-Profile': sign_profile_request(int(time.time()), secret='secret')}
+
+    response = lambda_function.lambda_handler(dict(EVENT, headers=headers), None)
+
+    profile = json.loads(response['body'])['profile']
+    assert profile['wall_ms'] >= 0 and profile['functions']
+    assert profile['pstats_path'].startswith(str(tmp_path))
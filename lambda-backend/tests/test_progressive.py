@@ -0,0 +1,55 @@
+import base64
+import io
+import json
+from types import SimpleNamespace
+
+import pytest
+
+Image = pytest.importorskip('PIL.Image')
+
+import mistral_client
+from layout_index import layout_index
+from ocr_cache import OcrCache
+
+# The model misses the tax and items on the blurry pass, so the low tier is rejected
+INCOMPLETE = {'merchant': 'Cafe', 'date': '2024-01-02', 'total': '$9.00', 'tax': '', 'items': []}
+COMPLETE = dict(INCOMPLETE, tax='$0.82', items=[{'name': 'Flat white', 'qty': '2', 'unit_price': '$4.50',
+                                                   'total_price': '$9.00'}])
+
+
+class RecordingClient:
+    def __init__(self, answers):
+        self.calls = []
+        self.answers = answers
+        self.ocr = SimpleNamespace(process=self._ocr)
+        self.chat = SimpleNamespace(complete=self._chat)
+
+    def _ocr(self, model, document):
+        self.calls.append('ocr')
+        return SimpleNamespace(pages=[SimpleNamespace(markdown=f"CAFE {len(self.calls)}\nTOTAL $9.00")], usage_info=None)
+
+    def _chat(self, model, messages, **options):
+        self.calls.append(model)
+        content = self.answers.pop(0)
+        return SimpleNamespace(choices=[SimpleNamespace(message=SimpleNamespace(content=json.dumps(content)))],
+                               usage=None)
+
+
+def large_jpeg_b64():
+    buffer = io.BytesIO()
+    Image.new('RGB', (1600, 2000), 'white').save(buffer, format='JPEG')
+    return base64.b64encode(buffer.getvalue()).decode()
+
+
+def test_rejected_low_res_pass_only_costs_one_small_model_call(monkeypatch):
+    client = RecordingClient([INCOMPLETE, COMPLETE])
+    learned = []
+    monkeypatch.setattr(mistral_client, '_get_client', lambda api_key=None: client)
+    monkeypatch.setattr(layout_index, 'learn', lambda key, text, result: learned.append(text))
+    monkeypatch.setattr(mistral_client, 'ocr_cache', OcrCache())
+
+    result = mistral_client.process_image(large_jpeg_b64(), 'prompt', priority='batch')
+
+    assert result['tax'] == '$0.82'
+    assert client.calls == ['ocr', mistral_client.MODEL_ROUTES['small'], 'ocr', mistral_client.MODEL_ROUTES['small']]
+    assert [text.split('\n')[0] for text in learned] == ['CAFE 3']
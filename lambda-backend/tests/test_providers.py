@@ -0,0 +1,84 @@
+import asyncio
+
+import pytest
+
+from circuit_breaker import OPEN, CircuitOpenError
+from providers import FailoverClient, FakeProviderError, Provider, ProviderPool, fake_provider
+
+OCR_REQUEST = {'model': 'mistral-ocr-latest', 'document': {'type': 'image_url', 'image_url': 'https://example.com/r.jpg'}}
+
+
+def failover_client(*providers):
+    return FailoverClient(ProviderPool(list(providers)), 'key', None)
+
+
+def test_outage_fails_over_to_the_next_provider():
+    primary, backup = fake_provider('primary', latency=0, failure_rate=1.0), fake_provider('backup', latency=0)
+    client = failover_client(primary, backup)
+
+    response = client.ocr.process(**OCR_REQUEST)
+
+    assert response.pages[0].markdown == 'TOTAL 0.00'
+    assert (primary.fake.calls, backup.fake.calls) == (1, 1)
+    assert client.pool.metrics()['primary.ocr']['failures'] == 1
+
+
+def test_client_error_is_raised_without_failing_over():
+    primary, backup = fake_provider('primary', latency=0), fake_provider('backup', latency=0)
+
+    def bad_request(**request):
+        primary.fake.calls += 1
+        raise FakeProviderError('primary', status_code=422)
+
+    primary.fake.ocr.process = bad_request
+    client = failover_client(primary, backup)
+
+    with pytest.raises(FakeProviderError):
+        client.ocr.process(**OCR_REQUEST)
+    assert (primary.fake.calls, backup.fake.calls) == (1, 0)
+    assert client.pool.metrics()['primary.ocr']['failures'] == 0
+
+
+def test_failed_provider_is_ranked_last():
+    primary, backup = fake_provider('primary', latency=0, failure_rate=1.0), fake_provider('backup', latency=0)
+    client = failover_client(primary, backup)
+    for _ in range(3):
+        client.ocr.process(**OCR_REQUEST)
+
+    assert (primary.fake.calls, backup.fake.calls) == (1, 3)
+
+
+def test_open_breaker_fails_fast():
+    primary = fake_provider('primary', latency=0, failure_rate=1.0)
+    client = failover_client(primary)
+    for _ in range(5):
+        with pytest.raises(FakeProviderError):
+            client.ocr.process(**OCR_REQUEST)
+
+    assert client.pool.metrics()['primary.ocr']['state'] == OPEN
+    with pytest.raises(CircuitOpenError):
+        client.ocr.process(**OCR_REQUEST)
+    assert primary.fake.calls == 5
+
+
+def test_async_calls_build_one_sdk_client_per_async_client():
+    built = []
+
+    def factory(api_key, http_client, async_client):
+        built.append(async_client)
+        return fake_provider('mistral', latency=0).fake
+
+    pool = ProviderPool([Provider('mistral', factory, uses_request_key=True)])
+    client = FailoverClient(pool, 'key', None)
+
+    async def run(async_client):
+        loop_client = client.with_async_client(async_client)
+        await asyncio.gather(*(loop_client.ocr.process_async(**OCR_REQUEST) for _ in range(3)))
+        pool.release(async_client)
+
+    first, second = object(), object()
+    asyncio.run(run(first))
+    asyncio.run(run(second))
+
+    assert built == [first, second]
+    assert pool._clients == {}
@@ -0,0 +1,75 @@
+import json
+
+from queue_worker import InMemoryQueue, InMemoryResultStore, InvalidMessage, is_queue_event, process_queue_event
+
+
+def process_receipt(request_data):
+    if request_data.get('fail'):
+        raise RuntimeError('OCR unavailable')
+    if not request_data.get('image_base64'):
+        raise InvalidMessage('Missing image_base64 or upload_id field')
+    return {'total': request_data['image_base64']}
+
+
+def run_batch(queue, store):
+    event = queue.receive_batch()
+    assert is_queue_event(event)
+    response = process_queue_event(event, process_receipt, store)
+    queue.complete(event, response)
+    return response
+
+
+def test_failed_records_are_redelivered_and_the_rest_acknowledged():
+    queue, store = InMemoryQueue(), InMemoryResultStore()
+    queue.send_message({'receipt_id': 'ok', 'image_base64': '12.34'})
+    failing_id = queue.send_message({'receipt_id': 'flaky', 'image_base64': 'x', 'fail': True})
+
+    response = run_batch(queue, store)
+
+    assert response == {'batchItemFailures': [{'itemIdentifier': failing_id}]}
+    assert store.get('ok') == {'total': '12.34'}
+    assert store.get('flaky') is None
+    assert len(queue) == 1
+    assert queue.receive_batch()['Records'][0]['attributes']['ApproximateReceiveCount'] == '2'
+
+
+def test_invalid_messages_are_acknowledged_with_a_failed_result():
+    queue, store = InMemoryQueue(), InMemoryResultStore()
+    queue.send_message({'receipt_id': 'no-image'})
+    not_an_object = queue.send_message('just a string')
+
+    response = run_batch(queue, store)
+
+    assert response == {'batchItemFailures': []}
+    assert len(queue) == 0
+    assert store.get('no-image') == {'error': 'Missing image_base64 or upload_id field'}
+    assert store.get(not_an_object) == {'error': 'Message body must be a JSON object'}
+
+
+def test_malformed_json_is_acknowledged():
+    store = InMemoryResultStore()
+    event = {'Records': [{'messageId': 'm1', 'body': '{not json', 'eventSource': 'aws:sqs'}]}
+
+    assert process_queue_event(event, process_receipt, store) == {'batchItemFailures': []}
+    assert 'error' in store.get('m1')
+
+
+def test_empty_batch():
+    assert process_queue_event({'Records': []}, process_receipt, InMemoryResultStore()) == {'batchItemFailures': []}
+
+
+def test_result_store_round_trip():
+    store = InMemoryResultStore()
+    store.put('r1', {'total': '$1.00'})
+    assert json.loads(json.dumps(store.get('r1'))) == {'total': '$1.00'}
+
+
+def test_results_are_stored_for_the_submitting_user():
+    queue, store = InMemoryQueue(), InMemoryResultStore()
+    queue.send_message({'receipt_id': 'r1', 'image_base64': '4.50', 'user_id': 'alice'})
+
+    run_batch(queue, store)
+
+    assert store.get('r1', owner='alice') == {'total': '4.50'}
+    assert store.get('r1', owner='bob') is None
+    assert store.get('r1') is None
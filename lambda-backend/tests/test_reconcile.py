@@ -0,0 +1,34 @@
+import pytest
+
+from reconcile import find_inconsistencies, has_tax_line
+
+CONSISTENT = {
+    'merchant': 'Cafe Nero', 'date': '2024-01-02', 'total': '$9.00', 'tax': '',
+    'items': [{'name': 'Flat white', 'qty': '2', 'unit_price': '$4.50', 'total_price': '$9.00'}]
+}
+
+
+@pytest.mark.parametrize('header', [
+    'TAX INVOICE ABN 12 345 678 901',
+    'Tax Invoice No. 88120',
+    'ABN: 12 345 678 901 GST registered',
+    'GST No. 123-456-789',
+    'VAT Reg 123 4567 89'
+])
+def test_headers_mentioning_tax_are_not_tax_lines(header):
+    text = f"CAFE NERO\n{header}\nFlat white x2 $9.00\nTOTAL $9.00"
+
+    assert not has_tax_line(text)
+    assert find_inconsistencies(CONSISTENT, text) == []
+
+
+@pytest.mark.parametrize('line', ['GST $0.82', 'Includes GST 0.82', 'VAT 20% £1.50', 'Sales Tax: $0.74'])
+def test_tax_line_with_an_amount_flags_a_missing_tax(line):
+    text = f"CAFE NERO\nTAX INVOICE\nFlat white x2 $9.00\n{line}\nTOTAL $9.00"
+
+    assert has_tax_line(text)
+    assert find_inconsistencies(CONSISTENT, text) == ['missing_tax']
+
+
+def test_extracted_tax_is_not_flagged():
+    assert find_inconsistencies(dict(CONSISTENT, tax='$0.82'), "GST $0.82\nTOTAL $9.00") == []
@@ -0,0 +1,51 @@
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+
+from request_context import RawResponseBuffer, active_context, current_context, request_scope, timed
+
+
+def test_context_survives_asyncio_to_thread():
+    def stage():
+        with timed('ocr'):
+            current_context().add_usage(ocr_pages=1)
+        return active_context()
+
+    async def run():
+        with request_scope('req-1', 'alice') as request:
+            seen = await asyncio.gather(asyncio.to_thread(stage), asyncio.to_thread(stage))
+            return request, seen
+
+    request, seen = asyncio.run(run())
+
+    assert seen == [request, request]
+    assert request.usage == {'ocr_pages': 2}
+    assert 'ocr' in request.timings
+
+
+def test_plain_thread_pools_do_not_inherit_the_context():
+    with request_scope('req-1'), ThreadPoolExecutor(max_workers=1) as pool:
+        assert pool.submit(active_context).result() is None
+
+
+def test_nested_scopes_join_the_active_request():
+    with request_scope('outer', 'alice') as outer:
+        with request_scope('inner', 'bob') as inner:
+            assert inner is outer
+    assert active_context() is None
+    assert outer.outcome == 'success'
+
+
+def test_failed_requests_are_always_kept():
+    buffer = RawResponseBuffer(capacity=2, sample_rate=0.0)
+    with request_scope('ok') as ok:
+        pass
+    try:
+        with request_scope('failed') as failed:
+            raise RuntimeError('503 from chat')
+    except RuntimeError:
+        pass
+    buffer.record(ok)
+    buffer.record(failed)
+
+    assert [entry['request_id'] for entry in buffer.recent()] == ['failed']
+    assert buffer.latest()['error'] == '503 from chat'
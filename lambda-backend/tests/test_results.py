@@ -0,0 +1,62 @@
+import json
+
+import pytest
+
+import lambda_function
+from queue_worker import InMemoryResultStore, SqsQueue, default_receipt_queue
+from scheduler import PreemptedError
+
+
+def lookup(receipt_id, user_id=None):
+    event = {'httpMethod': 'POST', 'body': json.dumps({'action': 'result', 'receipt_id': receipt_id})}
+    if user_id:
+        event['requestContext'] = {'authorizer': {'claims': {'sub': user_id}}}
+    response = lambda_function.lambda_handler(event, None)
+    return response['statusCode'], json.loads(response['body'])
+
+
+@pytest.fixture
+def results(monkeypatch):
+    store = InMemoryResultStore()
+    monkeypatch.setattr(lambda_function, 'result_store', store)
+    return store
+
+
+def test_result_lookup(results):
+    results.put('done', {'merchant': 'Cafe Nero', 'total': '$4.50'})
+    results.put('failed', {'error': 'Missing image_base64 or upload_id field'})
+
+    assert lookup('done') == (200, {'success': True, 'data': {'merchant': 'Cafe Nero', 'total': '$4.50'}})
+    assert lookup('failed') == (422, {'success': False, 'error': 'Missing image_base64 or upload_id field'})
+    assert lookup('pending')[0] == 404
+    assert lookup(None)[0] == 400
+
+
+def test_results_are_only_returned_to_their_owner(results):
+    results.put('alice-receipt', {'merchant': 'Cafe Nero', 'total': '$4.50'}, owner='alice')
+
+    assert lookup('alice-receipt', 'alice')[0] == 200
+    assert lookup('alice-receipt', 'bob') == lookup('never-queued', 'bob')
+    assert lookup('alice-receipt')[0] == 404
+
+
+def test_busy_responses_expose_retry_after(monkeypatch):
+    def preempted(fn, *args, **kwargs):
+        raise PreemptedError('Scheduler queue is full (64 queued)')
+
+    monkeypatch.setattr(lambda_function, 'call_with_api_key', preempted)
+    response = lambda_function.lambda_handler(
+        {'httpMethod': 'POST', 'body': json.dumps({'image_base64': 'aGVsbG8='})}, None)
+
+    assert response['statusCode'] == 503
+    assert response['headers']['Access-Control-Expose-Headers'] == 'Retry-After'
+    assert response['headers']['Retry-After'] == '5'
+
+
+def test_receipts_are_only_deferred_with_a_result_bucket(monkeypatch):
+    monkeypatch.setenv('RECEIPT_QUEUE_URL', 'https://sqs.ap-southeast-2.amazonaws.com/123456789012/receipts')
+    monkeypatch.delenv('RESULT_BUCKET', raising=False)
+    assert default_receipt_queue() is None
+
+    monkeypatch.setenv('RESULT_BUCKET', 'results')
+    assert isinstance(default_receipt_queue(), SqsQueue)
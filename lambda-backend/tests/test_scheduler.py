@@ -0,0 +1,73 @@
+import threading
+import time
+
+import pytest
+
+from scheduler import PreemptedError, PriorityScheduler
+
+
+def wait_for_queued(scheduler, count):
+    deadline = time.monotonic() + 5
+    while sum(load['queue_depth'] for load in scheduler.load().values()) < count:
+        assert time.monotonic() < deadline, 'work was never queued'
+        time.sleep(0.001)
+
+
+def queue(scheduler, priority, fn=lambda: None, errors=None):
+    def run():
+        try:
+            scheduler.run(priority, fn)
+        except PreemptedError as e:
+            errors.append((priority, e))
+
+    thread = threading.Thread(target=run)
+    thread.start()
+    return thread
+
+
+def test_backlogged_classes_are_dispatched_in_proportion_to_their_weights():
+    scheduler = PriorityScheduler(max_concurrency=1, weights={'interactive': 2, 'batch': 1, 'background': 1})
+    dispatched = []
+    # Holding the only slot lets the whole backlog queue up before anything is dispatched
+    holder = scheduler._acquire('background')
+    threads = [queue(scheduler, cls, lambda cls=cls: dispatched.append(cls))
+               for cls in ['interactive'] * 4 + ['batch'] * 2]
+    wait_for_queued(scheduler, len(threads))
+
+    scheduler._release(holder)
+    for thread in threads:
+        thread.join()
+
+    assert dispatched == ['interactive', 'interactive', 'batch', 'interactive', 'interactive', 'batch']
+
+
+def test_full_queue_raises_preempted_error():
+    scheduler = PriorityScheduler(max_concurrency=1, max_queue_depth=1)
+    holder = scheduler._acquire('interactive')
+    errors = []
+    waiting = queue(scheduler, 'interactive', errors=errors)
+    wait_for_queued(scheduler, 1)
+
+    with pytest.raises(PreemptedError):
+        scheduler.run('interactive', lambda: None)
+
+    scheduler._release(holder)
+    waiting.join()
+    assert errors == []
+    assert scheduler.metrics()['interactive']['preempted'] == 1
+
+
+def test_full_queue_preempts_lower_priority_work():
+    scheduler = PriorityScheduler(max_concurrency=1, max_queue_depth=1)
+    holder = scheduler._acquire('interactive')
+    errors = []
+    background = queue(scheduler, 'background', errors=errors)
+    wait_for_queued(scheduler, 1)
+
+    interactive = queue(scheduler, 'interactive', errors=errors)
+    background.join()
+    scheduler._release(holder)
+    interactive.join()
+
+    assert [priority for priority, _ in errors] == ['background']
+    assert scheduler.metrics()['interactive']['completed'] == 2
@@ -0,0 +1,122 @@
+import threading
+import time
+from types import SimpleNamespace
+
+import pytest
+
+import secret_provider
+from secret_provider import EnvSecretBackend, SecretProvider
+
+
+class CountingBackend:
+    def __init__(self):
+        self.fetches = 0
+        self.fail = False
+
+    def fetch(self):
+        if self.fail:
+            raise ConnectionError('Secrets Manager unavailable')
+        self.fetches += 1
+        return f"key-{self.fetches}"
+
+
+class Clock:
+    def __init__(self):
+        self.now = 1000.0
+
+    def time(self):
+        return self.now
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    clock = Clock()
+    monkeypatch.setattr(secret_provider, 'time', SimpleNamespace(time=clock.time))
+    return clock
+
+
+def wait_for(condition):
+    deadline = time.monotonic() + 2
+    while not condition():
+        assert time.monotonic() < deadline
+        time.sleep(0.01)
+
+
+def test_cached_value_is_served_within_the_ttl(clock):
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=100)
+
+    assert provider.get() == 'key-1'
+    clock.now += 50
+    assert provider.get() == 'key-1'
+    assert provider.metrics()['hits'] == 1
+
+
+def test_refresh_ahead_serves_the_cached_value_while_fetching(clock):
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=100)
+    provider.get()
+
+    clock.now += 90
+    assert provider.get() == 'key-1'
+    wait_for(lambda: provider.metrics()['background_refreshes'] == 1)
+    assert provider.get() == 'key-2'
+
+
+def test_expired_value_is_fetched_again(clock):
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=100)
+    provider.get()
+
+    clock.now += 150
+    assert provider.get() == 'key-2'
+
+
+def test_failed_background_refresh_keeps_the_cached_value(clock):
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=100)
+    provider.get()
+
+    backend.fail = True
+    clock.now += 90
+    assert provider.get() == 'key-1'
+    wait_for(lambda: not provider._refreshing)
+    assert provider.get() == 'key-1'
+    assert provider.metrics()['failures'] == 1
+
+
+def test_force_refresh_and_invalidate_fetch_again(clock):
+    backend = CountingBackend()
+    provider = SecretProvider(backend, ttl=100)
+    provider.get()
+
+    assert provider.get(force_refresh=True) == 'key-2'
+    provider.invalidate()
+    assert provider.get() == 'key-3'
+    assert provider.metrics()['forced_refreshes'] == 1
+
+
+def test_concurrent_callers_share_one_fetch():
+    class SlowBackend(CountingBackend):
+        def fetch(self):
+            time.sleep(0.05)
+            return super().fetch()
+
+    backend = SlowBackend()
+    provider = SecretProvider(backend, ttl=100)
+    threads = [threading.Thread(target=provider.get) for _ in range(5)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+
+    assert backend.fetches == 1
+
+
+def test_env_backend_reads_the_key_file(tmp_path, monkeypatch):
+    path = tmp_path / 'key'
+    path.write_text('file-key\n')
+    monkeypatch.delenv('TEST_API_KEY', raising=False)
+    monkeypatch.setenv('TEST_API_KEY_FILE', str(path))
+
+    assert EnvSecretBackend('TEST_API_KEY').fetch() == 'file-key'
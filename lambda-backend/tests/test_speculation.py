@@ -0,0 +1,39 @@
+import asyncio
+import time
+
+import pytest
+
+from speculation import race_local_and_model
+
+
+async def model_response(delay, response='model'):
+    await asyncio.sleep(delay)
+    return response
+
+
+async def model_failure():
+    raise RuntimeError('503 Service Unavailable')
+
+
+def test_accepted_local_result_cancels_the_model_call():
+    winner, local, response = asyncio.run(race_local_and_model(model_response(5), lambda: 'local', lambda output: True))
+    assert (winner, local, response) == ('local', 'local', None)
+
+
+def test_accepted_local_result_survives_a_failed_model_call():
+    def slow_local():
+        # The model call fails while the local extractor is still running
+        time.sleep(0.05)
+        return 'local'
+
+    assert asyncio.run(race_local_and_model(model_failure(), slow_local, lambda output: True))[0] == 'local'
+
+
+def test_rejected_local_result_waits_for_the_model():
+    winner, _, response = asyncio.run(race_local_and_model(model_response(0.01), lambda: None, lambda output: False))
+    assert (winner, response) == ('model', 'model')
+
+
+def test_model_failure_propagates_when_local_result_is_rejected():
+    with pytest.raises(RuntimeError):
+        asyncio.run(race_local_and_model(model_failure(), lambda: None, lambda output: False))
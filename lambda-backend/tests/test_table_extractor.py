@@ -0,0 +1,27 @@
+import pytest
+
+from table_extractor import derive_unit_price, extract_items
+
+TABLE = """| Item | Qty | Total |
+|---|---|---|
+| Flat white | 2 | $9.00 |
+| Muffin | 1 | $4.00 |
+| Cookie | some | $3.00 |"""
+
+
+def test_missing_unit_price_is_derived_from_the_quantity():
+    items = extract_items(TABLE)
+
+    assert [item['unit_price'] for item in items] == ['$4.50', '', '']
+
+
+@pytest.mark.parametrize('qty, total, unit', [
+    ('3', 'AUD 10.00', 'AUD 3.33'),
+    ('2', '9,00 €', '4,50 €'),
+    ('1.5 kg', '$6.00', '$4.00'),
+    ('1', '$6.00', ''),
+    ('0.5', '$6.00', ''),
+    ('2', 'n/a', '')
+])
+def test_derive_unit_price(qty, total, unit):
+    assert derive_unit_price(qty, total) == unit
@@ -0,0 +1,58 @@
+import json
+
+import pytest
+from botocore.exceptions import ClientError
+
+import lambda_function
+from uploads import InMemoryS3Client, UploadNotFound, UploadStore
+
+
+class ForbiddenHeadS3Client(InMemoryS3Client):
+    def head_object(self, Bucket, Key):
+        raise ClientError({'Error': {'Code': '403', 'Message': 'Forbidden'}}, 'HeadObject')
+
+
+def post(body):
+    return lambda_function.lambda_handler({'httpMethod': 'POST', 'body': json.dumps(body)}, None)
+
+
+def completed_upload(store):
+    upload = store.create_upload()
+    store.s3_client.put_presigned(upload['upload_url'], b'\xff\xd8jpeg')
+    return upload['upload_id']
+
+
+def test_completed_upload_gets_a_download_url():
+    store = UploadStore('bucket', s3_client=InMemoryS3Client())
+    upload_id = completed_upload(store)
+
+    assert store.download_url(upload_id).startswith('memory://bucket/uploads/')
+
+
+@pytest.mark.parametrize('s3_client', [InMemoryS3Client(), ForbiddenHeadS3Client()])
+def test_missing_upload_is_not_found(s3_client):
+    store = UploadStore('bucket', s3_client=s3_client)
+
+    with pytest.raises(UploadNotFound):
+        store.download_url(store.create_upload()['upload_id'])
+
+
+def test_uploads_are_disabled_without_a_bucket(monkeypatch):
+    monkeypatch.setattr(lambda_function, 'upload_store', None)
+
+    assert post({'action': 'upload_init'})['statusCode'] == 501
+    assert post({'upload_id': '6f1c1f5e-0000-4000-8000-000000000000'})['statusCode'] == 501
+
+
+def test_processed_upload_is_deleted(monkeypatch):
+    store = UploadStore('bucket', s3_client=InMemoryS3Client())
+    upload_id = completed_upload(store)
+    monkeypatch.setattr(lambda_function, 'upload_store', store)
+    monkeypatch.setattr(lambda_function, 'get_mistral_api_key', lambda force_refresh=False: 'key')
+    monkeypatch.setattr(lambda_function, 'process_image_url',
+                        lambda image_url, prompt, priority, cache_key, api_key: {'total': '$4.50'})
+
+    assert post({'upload_id': upload_id})['statusCode'] == 200
+    with pytest.raises(UploadNotFound):
+        store.download_url(upload_id)
+    assert post({'upload_id': upload_id})['statusCode'] == 404
@@ -0,0 +1,15 @@
+import lambda_function
+from metrics import InMemorySink, metrics
+
+
+def test_warmup_ping_flushes_metrics(monkeypatch):
+    monkeypatch.setattr(metrics, 'sink', InMemorySink())
+
+    def run(get_api_key):
+        metrics.increment('warmup_runs')
+        return {'warm': True}
+
+    monkeypatch.setattr(lambda_function.prewarmer, 'run', run)
+
+    assert lambda_function.lambda_handler({'warmup': True}, None) == {'warm': True}
+    assert metrics.sink.records[-1]['warmup_runs'] == 1
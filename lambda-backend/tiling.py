@@ -0,0 +1,48 @@
+import re
+
+TABLE_ROW = re.compile(r'^\s*\|.*\|\s*$')
+TABLE_SEPARATOR = re.compile(r'^\s*\|?(\s*:?-{2,}:?\s*\|)+\s*:?-*:?\s*\|?\s*$')
+NON_ALNUM = re.compile(r'[^a-z0-9]+')
+
+# How many lines at each tile edge are searched for the overlap
+OVERLAP_WINDOW = 15
+
+
+def _normalize(line):
+    return NON_ALNUM.sub('', line.lower())
+
+
+def stitch_markdown(parts, window=OVERLAP_WINDOW):
+    """
+    Join the OCR markdown of overlapping strips into one page.
+
+    For each pair of neighbouring strips, the first line near the top of the
+    lower strip that also appears near the bottom of the upper strip anchors
+    the overlap: the upper strip is cut after that line and the lower strip
+    continues after it. That drops both the duplicated lines and the partial
+    lines cut at each strip edge. Table separator rows that OCR inserts when a
+    strip starts in the middle of a table are dropped as well.
+    """
+    if not parts:
+        return ''
+    lines = parts[0].splitlines()
+    for part in parts[1:]:
+        following = part.splitlines()
+        tail_start = max(len(lines) - window, 0)
+        tail = [_normalize(line) for line in lines[tail_start:]]
+
+        cut, resume = len(lines), 0
+        for index, line in enumerate(following[:window]):
+            key = _normalize(line)
+            if key and key in tail:
+                # Anchor on the last occurrence so repeated lines in the tail stay intact
+                cut = tail_start + len(tail) - tail[::-1].index(key)
+                resume = index + 1
+                break
+
+        lines = lines[:cut]
+        for line in following[resume:]:
+            if TABLE_SEPARATOR.match(line) and len(lines) >= 2 and TABLE_ROW.match(lines[-2]):
+                continue
+            lines.append(line)
+    return '\n'.join(lines)
@@ -0,0 +1,136 @@
+import os
+import threading
+import time
+import uuid
+from urllib.parse import quote
+
+import boto3
+from botocore.exceptions import ClientError
+
+# Presigned URLs are short-lived: the client uploads right away and OCR fetches right after
+UPLOAD_URL_EXPIRY = int(os.environ.get('UPLOAD_URL_EXPIRY', '300'))
+
+# Largest image accepted through a direct upload (the inline path stays at 4 MB)
+UPLOAD_MAX_BYTES = int(os.environ.get('UPLOAD_MAX_BYTES', str(20 * 1024 * 1024)))
+
+ALLOWED_CONTENT_TYPES = ('image/jpeg', 'image/png', 'image/webp', 'image/heic')
+
+
+class UploadNotFound(Exception):
+    """Raised when a process call references an upload that was never completed."""
+
+
+class InMemoryS3Client:
+    """
+    Local S3-compatible stand-in covering the calls the upload store makes (tests).
+
+    Presigned URLs point at memory://; `put_presigned()` plays the client's PUT.
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._objects = {}
+
+    def generate_presigned_url(self, operation, Params, ExpiresIn=3600):
+        expires = int(time.time()) + ExpiresIn
+        return f"memory://{Params['Bucket']}/{quote(Params['Key'])}?op={operation}&expires={expires}"
+
+    def put_presigned(self, url, body, content_type='image/jpeg'):
+        path, _, query = url[len('memory://'):].partition('?')
+        bucket, _, key = path.partition('/')
+        params = dict(part.split('=', 1) for part in query.split('&'))
+        if params['op'] != 'put_object' or int(params['expires']) < time.time():
+            raise PermissionError("Presigned URL is not valid for upload")
+        self.put_object(Bucket=bucket, Key=key, Body=body, ContentType=content_type)
+
+    def put_object(self, Bucket, Key, Body, ContentType='binary/octet-stream'):
+        with self._lock:
+            self._objects[(Bucket, Key)] = (bytes(Body), ContentType)
+
+    def head_object(self, Bucket, Key):
+        with self._lock:
+            stored = self._objects.get((Bucket, Key))
+        if stored is None:
+            raise ClientError({'Error': {'Code': '404', 'Message': 'Not Found'}}, 'HeadObject')
+        return {'ContentLength': len(stored[0]), 'ContentType': stored[1]}
+
+    def delete_object(self, Bucket, Key):
+        with self._lock:
+            self._objects.pop((Bucket, Key), None)
+        return {}
+
+
+class UploadStore:
+    """
+    Hands out presigned S3 URLs so image bytes go straight from the client to S3.
+
+    `create_upload()` returns a PUT URL for the client; `download_url()` turns
+    a completed upload into a short-lived GET URL that is passed to OCR as-is,
+    so the Lambda never holds the image.
+    """
+
+    def __init__(self, bucket, prefix='uploads/', s3_client=None):
+        self.bucket = bucket
+        self.prefix = prefix
+        self._owns_client = s3_client is None
+        self.s3_client = s3_client or boto3.client('s3', region_name='ap-southeast-2')
+
+    def reconnect(self):
+        """Build a new client, e.g. after a snapshot restore; an injected client is kept."""
+        if self._owns_client:
+            self.s3_client = boto3.client('s3', region_name='ap-southeast-2')
+
+    def _key(self, upload_id):
+        return f"{self.prefix}{upload_id}"
+
+    def create_upload(self, content_type='image/jpeg'):
+        if content_type not in ALLOWED_CONTENT_TYPES:
+            raise ValueError(f"Unsupported content type. Must be one of: {', '.join(ALLOWED_CONTENT_TYPES)}")
+        upload_id = str(uuid.uuid4())
+        url = self.s3_client.generate_presigned_url(
+            'put_object',
+            Params={'Bucket': self.bucket, 'Key': self._key(upload_id), 'ContentType': content_type},
+            ExpiresIn=UPLOAD_URL_EXPIRY
+        )
+        return {
+            'upload_id': upload_id,
+            'upload_url': url,
+            'method': 'PUT',
+            'headers': {'Content-Type': content_type},
+            'expires_in': UPLOAD_URL_EXPIRY,
+            'max_bytes': UPLOAD_MAX_BYTES
+        }
+
+    def download_url(self, upload_id):
+        """Return a short-lived GET URL for a completed upload."""
+        try:
+            uuid.UUID(upload_id)
+        except (TypeError, ValueError, AttributeError):
+            raise UploadNotFound(f"Invalid upload_id: {upload_id}")
+
+        try:
+            head = self.s3_client.head_object(Bucket=self.bucket, Key=self._key(upload_id))
+        except ClientError as e:
+            # Without s3:ListBucket, S3 answers HEAD on a missing key with 403 instead of 404
+            if e.response.get('Error', {}).get('Code') in ('403', '404', 'AccessDenied', 'Forbidden', 'NoSuchKey', 'NotFound'):
+                raise UploadNotFound(f"Upload {upload_id} has not been completed")
+            raise
+        if head['ContentLength'] > UPLOAD_MAX_BYTES:
+            raise ValueError(f"Uploaded image too large. Maximum size is {UPLOAD_MAX_BYTES / (1024 * 1024):.1f} MB")
+
+        return self.s3_client.generate_presigned_url(
+            'get_object',
+            Params={'Bucket': self.bucket, 'Key': self._key(upload_id)},
+            ExpiresIn=UPLOAD_URL_EXPIRY
+        )
+
+    def delete(self, upload_id):
+        self.s3_client.delete_object(Bucket=self.bucket, Key=self._key(upload_id))
+
+
+def default_upload_store():
+    """Use S3 when UPLOAD_BUCKET is configured; without it direct uploads are disabled (None)."""
+    bucket = os.environ.get('UPLOAD_BUCKET')
+    if bucket:
+        return UploadStore(bucket)
+    return None
@@ -0,0 +1,90 @@
+from datetime import date, datetime, timedelta
+
+from money import parse_decimal
+
+# Absolute difference (in currency units) tolerated when reconciling amounts
+AMOUNT_TOLERANCE = 0.02
+
+# Largest plausible share of the total that is tax
+MAX_TAX_SHARE = 0.25
+
+# Oldest receipt date accepted without review
+MAX_RECEIPT_AGE = timedelta(days=10 * 365)
+
+
+def parse_amount(value):
+    """
+    Parse a free-form money string like "$12.34", "AUD 5,00" or "1.234,50".
+
+    Returns a float, or None when no amount can be found.
+    """
+    amount = parse_decimal(value)
+    return float(amount) if amount is not None else None
+
+
+def amounts_match(a, b):
+    """Return True if two amounts are equal within AMOUNT_TOLERANCE."""
+    return abs(a - b) <= AMOUNT_TOLERANCE
+
+
+def validate_receipt(result):
+    """
+    Check a structured receipt for obvious extraction failures.
+
+    Returns a list of issue codes; an empty list means the receipt looks sound.
+    """
+    issues = []
+    if not isinstance(result, dict):
+        return ['not_an_object']
+
+    total = parse_amount(result.get('total'))
+    if total is None:
+        issues.append('missing_total')
+
+    items = result.get('items') or []
+    if not items:
+        issues.append('missing_items')
+    elif total is not None:
+        item_sum = 0.0
+        for item in items:
+            amount = parse_amount(item.get('total_price')) if isinstance(item, dict) else None
+            if amount is None:
+                issues.append('item_without_price')
+                break
+            item_sum += amount
+        else:
+            # Tax may be included in the item prices or added on top of them
+            tax = parse_amount(result.get('tax')) or 0.0
+            if not amounts_match(item_sum, total) and not amounts_match(item_sum + tax, total):
+                issues.append('items_do_not_sum_to_total')
+
+    return issues
+
+
+def reconciliation_issues(result, today=None):
+    """
+    Stricter checks a locally extracted receipt must pass to be returned as-is.
+
+    On top of validate_receipt, the tax must be a plausible share of the total
+    and the date must be a valid YYYY-MM-DD that is neither in the future nor
+    implausibly old.
+    """
+    issues = validate_receipt(result)
+    if issues == ['not_an_object']:
+        return issues
+
+    total = parse_amount(result.get('total'))
+    tax = parse_amount(result.get('tax'))
+    if tax is not None and total is not None and (tax < 0 or tax > total * MAX_TAX_SHARE):
+        issues.append('implausible_tax')
+
+    today = today or date.today()
+    try:
+        receipt_date = datetime.strptime(result.get('date') or '', '%Y-%m-%d').date()
+    except ValueError:
+        issues.append('invalid_date')
+    else:
+        if receipt_date > today or today - receipt_date > MAX_RECEIPT_AGE:
+            issues.append('implausible_date')
+
+    return issues